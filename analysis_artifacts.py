@@ -0,0 +1,247 @@
+import glob
+import hashlib
+import json
+import os
+import pandas as pd
+import pyarrow.dataset as ds
+from repo_dataset import build_repo_dataset, dataset_sources, load_membership, load_repositories
+from search_queries import query_feature
+
+# Shared data layer for the data-analysis notebooks. The frames every notebook
+# used to rebuild by hand (one repositoryinfo file, the unique repositories of
+# a category/version/mode, their starred subset, v1-only style exclusions) are
+# artifacts:
+#
+#   from analysis_artifacts import source, repos, starred, exclusive
+#   df_strict_v1 = source("mtls_strict_v1")
+#   df_v1_unique = repos("mtls", version="v1")
+#   df_v1_star = starred("mtls", version="v1")
+#   df_strict_v1only = exclusive("mtls", "v1", mode="strict")
+#
+# The frames are read from the consolidated dataset of repo_dataset.py
+# (data/consolidated): the membership table selects the repo_ids of a
+# category/version/mode, reading only that category's partition, and those
+# rows are sliced out of the deduplicated repository table, which is read once
+# per session; starred() reads only the stars_band partitions that can reach
+# min_stars. The dataset is rebuilt first when the
+# repositoryinfo files it was built from changed. A repository fetched for
+# several queries has one document, the most recently updated one.
+#
+# Each artifact is computed once, kept in memory for the session and written
+# to data/.artifacts/<name>-<key>.parquet. The key hashes the artifact name,
+# its parameters, the content hashes of the source files it reads and the keys
+# of the artifacts it is built from, so editing or re-harvesting a
+# *_repos.parquet file invalidates the artifacts that depend on it.
+# File hashes are remembered by (size, mtime), so an unchanged file is not
+# read again just to be hashed.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+VERSION_ORDER = ("v1", "v1beta1", "v1alpha1")
+MODE_ORDER = ("strict", "permissive", "disable", None, "ip", "remote_ip")
+# bump when an artifact's computation changes, so old cache files are not reused
+CODE_VERSION = 2
+
+ARTIFACTS = {}
+
+
+def artifact(name, deps=None, sources=None):
+    """
+    Register fn(store, **params) as the artifact called name.
+
+    sources(store, **params) lists the repositoryinfo files it reads and
+    deps(**params) the (artifact name, params) pairs it is built from.
+    """
+    def register(fn):
+        ARTIFACTS[name] = (fn, deps, sources)
+        return fn
+    return register
+
+
+def _sort_key(path):
+    category, mode, version = query_feature(os.path.basename(path)[:-len("_repos.parquet")])
+    version_rank = VERSION_ORDER.index(version) if version in VERSION_ORDER else len(VERSION_ORDER)
+    mode_rank = MODE_ORDER.index(mode) if mode in MODE_ORDER else len(MODE_ORDER)
+    return version_rank, mode_rank, category
+
+
+class ArtifactStore:
+    def __init__(self, repo_dir=os.path.join(HERE, "data", "repositoryinfo"),
+                 cache_dir=os.path.join(HERE, "data", ".artifacts"),
+                 dataset_dir=os.path.join(HERE, "data", "consolidated")):
+        self.repo_dir = repo_dir
+        self.cache_dir = cache_dir
+        self.dataset_dir = dataset_dir
+        self.dataset_current = False
+        self.repository_frame = None
+        self.memory = {}
+        self.hashes_path = os.path.join(cache_dir, "file_hashes.json")
+        self.hashes = None
+        self.computed = 0
+        self.loaded = 0
+
+    def files(self, category=None, version=None, mode=None):
+        """repositoryinfo files of a selection, v1 before v1beta1 before v1alpha1, strict before permissive."""
+        selected = []
+        for path in glob.glob(os.path.join(self.repo_dir, "*_repos.parquet")):
+            file_category, file_mode, file_version = query_feature(os.path.basename(path)[:-len("_repos.parquet")])
+            if category is not None and file_category != category:
+                continue
+            if version is not None and file_version != version:
+                continue
+            if mode is not None and file_mode != mode:
+                continue
+            selected.append(path)
+        return sorted(selected, key=_sort_key)
+
+    def file_hash(self, path):
+        if self.hashes is None:
+            self.hashes = {}
+            if os.path.exists(self.hashes_path):
+                with open(self.hashes_path, encoding="utf-8") as f:
+                    self.hashes = json.load(f)
+        stat = os.stat(path)
+        name = os.path.basename(path)
+        entry = self.hashes.get(name)
+        if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        self.hashes[name] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.hashes_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.hashes, f)
+        os.replace(tmp_path, self.hashes_path)
+        return self.hashes[name][2]
+
+    def source_hashes(self):
+        return {os.path.basename(path): self.file_hash(path) for path in self.files()}
+
+    def dataset(self):
+        """The consolidated dataset directory, rebuilt first if the repositoryinfo files changed."""
+        if not self.dataset_current:
+            sources = self.source_hashes()
+            if dataset_sources(self.dataset_dir) != sources:
+                print(f"Rebuilding {self.dataset_dir} from {len(sources)} repositoryinfo files")
+                build_repo_dataset(self.repo_dir, self.dataset_dir, sources)
+            self.dataset_current = True
+        return self.dataset_dir
+
+    def select(self, category=None, version=None, mode=None, exact=False):
+        """repo_ids of a selection; with exact, mode=None matches only datasets without a mode."""
+        membership = load_membership(self.dataset(), category=category, version=version,
+                                     mode=None if exact else mode, columns=["repo_id", "mode"])
+        if exact:
+            membership = membership[membership["mode"].isna() if mode is None else membership["mode"] == mode]
+        return membership["repo_id"].unique().tolist()
+
+    def repositories(self, repo_ids, min_stars=None):
+        """Repository documents of repo_ids, ordered by full_name."""
+        if min_stars is not None:
+            # only the stars_band partitions that can reach min_stars are read
+            df = load_repositories(self.dataset(), filter=ds.field("repo_id").isin(repo_ids), min_stars=min_stars)
+        else:
+            # selections overlap, so the whole table is read once and sliced
+            if self.repository_frame is None:
+                self.repository_frame = load_repositories(self.dataset())
+            df = self.repository_frame[self.repository_frame["repo_id"].isin(repo_ids)]
+        return df.drop(columns=["repo_id", "stars_band"]).sort_values("full_name", ignore_index=True)
+
+    def key(self, name, params):
+        fn, deps, sources = ARTIFACTS[name]
+        parts = [name, CODE_VERSION, sorted(params.items())]
+        if sources is not None:
+            parts.append([(os.path.basename(p), self.file_hash(p)) for p in sources(self, **params)])
+        for dep_name, dep_params in (deps(**params) if deps is not None else []):
+            parts.append(self.key(dep_name, dep_params))
+        return hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()[:16]
+
+    def get(self, name, **params):
+        """The artifact's frame: from memory, else from the disk cache, else computed and cached."""
+        key = self.key(name, params)
+        if key in self.memory:
+            return self.memory[key]
+        path = os.path.join(self.cache_dir, f"{name}-{key}.parquet")
+        if os.path.exists(path):
+            df = pd.read_parquet(path)
+            self.loaded += 1
+        else:
+            fn = ARTIFACTS[name][0]
+            df = fn(self, **params)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = path + ".tmp"
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+            self.computed += 1
+        self.memory[key] = df
+        return df
+
+    def print_summary(self):
+        print(f"  artifacts: {len(self.memory)} in memory, {self.loaded} read from cache, {self.computed} computed")
+
+
+def _dataset_sources(store, **_):
+    # every artifact reads the deduplicated table, which all repositoryinfo files feed
+    return store.files()
+
+
+@artifact("source", sources=_dataset_sources)
+def _source(store, key):
+    """The repositories of one repositoryinfo file, e.g. key="mtls_strict_v1"."""
+    category, mode, version = query_feature(key)
+    return store.repositories(store.select(category, version, mode, exact=True))
+
+
+@artifact("repos", sources=_dataset_sources)
+def _repos(store, category=None, version=None, mode=None):
+    """Unique repositories of every file in the selection."""
+    return store.repositories(store.select(category, version, mode))
+
+
+@artifact("starred", sources=_dataset_sources)
+def _starred(store, category=None, version=None, mode=None, min_stars=10):
+    """Unique repositories of the selection with at least min_stars stargazers."""
+    return store.repositories(store.select(category, version, mode), min_stars=min_stars)
+
+
+@artifact("exclusive", sources=_dataset_sources)
+def _exclusive(store, category, version, mode=None, others=None):
+    """Repositories of one version that do not appear in the other versions (e.g. v1 only)."""
+    others = [v for v in VERSION_ORDER if v != version] if others is None else others
+    excluded = set()
+    for other in others:
+        excluded.update(store.select(category, other, mode))
+    return store.repositories([repo_id for repo_id in store.select(category, version, mode) if repo_id not in excluded])
+
+
+_store = None
+
+
+def default_store():
+    global _store
+    if _store is None:
+        _store = ArtifactStore()
+    return _store
+
+
+def get(name, **params):
+    return default_store().get(name, **params)
+
+
+def source(key):
+    return get("source", key=key)
+
+
+def repos(category=None, version=None, mode=None):
+    return get("repos", category=category, version=version, mode=mode)
+
+
+def starred(category=None, version=None, mode=None, min_stars=10):
+    return get("starred", category=category, version=version, mode=mode, min_stars=min_stars)
+
+
+def exclusive(category, version, mode=None, others=None):
+    return get("exclusive", category=category, version=version, mode=mode,
+               others=list(others) if others is not None else None)
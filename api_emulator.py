@@ -0,0 +1,327 @@
+import glob
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pyarrow.parquet as pq
+from parquet_sink import list_parts
+from query_planner import matches_terms, query_terms
+from search_queries import base_queries, find_shards
+from seen_index import file_identity
+from sharding import MAX_FILE_SIZE, MAX_PAGES, PER_PAGE
+
+# Local stand-in for the parts of the GitHub API the crawlers use, serving the
+# recorded data in data/ instead of live results:
+#
+#   /search/code?q=...          items of data/<category>/.../<query>_<char>.parquet
+#                               whose file name contains the filename: value
+#   /repos/{owner}/{repo}       documents of data/repositoryinfo/*_repos.parquet
+#   .../git/blobs/{sha}         a file holding the terms of every query that
+#                               returned it, so query_planner can derive subsets
+#
+# The recorded shards keep one file per repository, so a query alone misses
+# files that were recorded only for a query with more terms. A query is served
+# every recorded file of the queries whose terms include all of its own terms
+# (any_authz_v1 also returns the files of http_traffic_v1). The filename:
+# qualifier matches anywhere in the name: every recorded file contains the
+# character of its shard, most not at the start (_istio_base.yaml is in "i").
+# Derived subsets hold every recorded file of their query plus a few percent
+# more (http_traffic_v1: 766 for 723 recorded): a blob carries the terms of
+# every query that returned it, in any repository and version, so a file
+# recorded for any_authz_v1 and http_traffic_v1beta1 matches http_traffic_v1.
+#
+# Each token gets its own code_search (10 per minute), search and core buckets
+# with the API's X-RateLimit-* headers and a 403 once a bucket is empty;
+# secondary rate limits are 403s with Retry-After at a configurable rate, and
+# pages past the 1000-result cap get the API's 422. The windows run time_scale
+# times faster than GitHub's (60 by default: a minute takes a second, an hour
+# a minute), so a crawler sleeping until X-RateLimit-Reset finishes a benchmark
+# unattended; time_scale=1 gives the real windows. The recorded items carry no
+# file size, so size: qualifiers filter on a size derived from the blob sha,
+# which keeps size-range shards disjoint and complete. Point the crawlers at it
+# with GITHUB_API=http://127.0.0.1:<port>.
+
+GITHUB = "https://api.github.com"
+# GitHub's rate-limit windows in seconds
+WINDOWS = {"code_search": 60, "search": 60, "core": 3600}
+
+
+def unflatten_row(row):
+    """Inverse of flatten_item_for_parquet for the repository_* columns."""
+    item = {"repository": {}}
+    for key, value in row.items():
+        if key.startswith("repository_"):
+            item["repository"][key[len("repository_"):]] = value
+        else:
+            item[key] = value
+    return item
+
+
+def blob_size(sha):
+    return int(sha[:8], 16) % MAX_FILE_SIZE
+
+
+def rewrite_urls(value, base):
+    if isinstance(value, str):
+        return base + value[len(GITHUB):] if value.startswith(GITHUB) else value
+    if isinstance(value, dict):
+        return {k: rewrite_urls(v, base) for k, v in value.items()}
+    if isinstance(value, list):
+        return [rewrite_urls(v, base) for v in value]
+    return value
+
+
+class RecordedData:
+    """Search items per query, sorted by lower-cased file name, plus repo documents and blob terms."""
+
+    def __init__(self, data_dir="data", repo_dir="data/repositoryinfo"):
+        self.queries = {query: key for key, query in base_queries.items()}
+        self.items = {}
+        self.names = {}
+        self.blob_terms = {}
+        recorded = {}
+        for key, paths in find_shards(data_dir).items():
+            items = recorded[key] = []
+            for path in paths:
+                for part in list_parts(path) or [path]:
+                    for row in pq.read_table(part).to_pylist():
+                        item = unflatten_row(row)
+                        items.append(item)
+                        self.blob_terms.setdefault(item.get("sha"), set()).update(query_terms(base_queries[key]))
+        for key in recorded:
+            terms = query_terms(base_queries[key])
+            seen = set()
+            items = []
+            # a file recorded for a query with more terms matches this query as well
+            for other, other_items in recorded.items():
+                if not matches_terms(base_queries[other].encode(), terms):
+                    continue
+                for item in other_items:
+                    identity = file_identity(item)
+                    if identity not in seen:
+                        seen.add(identity)
+                        items.append(item)
+            items.sort(key=lambda item: ((item.get("name") or "").lower(), item.get("path") or ""))
+            self.items[key] = items
+            self.names[key] = [(item.get("name") or "").lower() for item in items]
+        self.repos = {}
+        for path in sorted(glob.glob(os.path.join(repo_dir, "*_repos.parquet"))):
+            for doc in pq.read_table(path).to_pylist():
+                if doc.get("full_name"):
+                    self.repos[doc["full_name"].lower()] = doc
+
+    def search(self, query, prefix, size_range=None, repo=None):
+        """Recorded items of query whose file name contains prefix."""
+        key = self.queries.get(query)
+        if key is None:
+            return []
+        prefix = prefix.lower()
+        matches = []
+        for name, item in zip(self.names[key], self.items[key]):
+            if prefix not in name:
+                continue
+            if repo is not None and (item["repository"].get("full_name") or "").lower() != repo.lower():
+                continue
+            if size_range is not None and not size_range[0] <= blob_size(item.get("sha") or "0") <= size_range[1]:
+                continue
+            matches.append(item)
+        return matches
+
+    def blob(self, sha):
+        terms = self.blob_terms.get(sha)
+        if terms is None:
+            return None
+        return "".join(f"# {term}\n" for term in sorted(terms)).encode()
+
+
+class RateLimiter:
+    """Per-token buckets by X-RateLimit-Resource, each refilled after its own window in seconds."""
+
+    def __init__(self, limits, windows):
+        self.limits = limits
+        self.windows = windows
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def take(self, token, resource, now):
+        """Consume one request; returns (allowed, remaining, reset)."""
+        with self.lock:
+            used, reset = self.buckets.get((token, resource), (0, 0))
+            if now >= reset:
+                used, reset = 0, int(now + self.windows[resource]) + 1
+            allowed = used < self.limits[resource]
+            if allowed:
+                used += 1
+            self.buckets[(token, resource)] = (used, reset)
+            return allowed, self.limits[resource] - used, reset
+
+
+class ApiEmulator:
+    def __init__(self, data, port=0, latency=0.0, secondary_rate=0.0, retry_after=1,
+                 search_limit=10, core_limit=5000, time_scale=60, seed=0):
+        self.data = data
+        self.latency = latency
+        self.secondary_rate = secondary_rate
+        self.retry_after = retry_after
+        # search_limit is the code search limit; the other search endpoints allow 30 per minute
+        self.limiter = RateLimiter({"code_search": search_limit, "search": 30, "core": core_limit},
+                                   {resource: seconds / time_scale for resource, seconds in WINDOWS.items()})
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "rate_limited": 0, "secondary": 0, "not_modified": 0}
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="api-emulator", daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _draw(self):
+        with self.lock:
+            return self.random.random()
+
+    def _count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def _handler(self):
+        emulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def send(self, status, body, headers=(), content_type="application/json"):
+                if not isinstance(body, bytes):
+                    body = json.dumps(body, default=str).encode()
+                etag = f'"{hashlib.sha1(body).hexdigest()}"'
+                if status == 200 and self.headers.get("If-None-Match") == etag:
+                    emulator._count("not_modified")
+                    status, body = 304, b""
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                if status in (200, 304):
+                    self.send_header("ETag", etag)
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                emulator._count("requests")
+                if emulator.latency:
+                    time.sleep(emulator.latency * (0.5 + emulator._draw()))
+                url = urlparse(self.path)
+                if url.path == "/search/code":
+                    resource = "code_search"
+                elif url.path.startswith("/search/"):
+                    resource = "search"
+                else:
+                    resource = "core"
+                token = self.headers.get("Authorization", "anonymous").split(" ")[-1]
+                now = time.time()
+                allowed, remaining, reset = emulator.limiter.take(token, resource, now)
+                limit = emulator.limiter.limits[resource]
+                headers = [
+                    ("X-RateLimit-Limit", str(limit)),
+                    ("X-RateLimit-Remaining", str(max(remaining, 0))),
+                    ("X-RateLimit-Reset", str(reset)),
+                    ("X-RateLimit-Used", str(limit - max(remaining, 0))),
+                    ("X-RateLimit-Resource", resource),
+                ]
+                if not allowed:
+                    emulator._count("rate_limited")
+                    return self.send(403, {"message": f"API rate limit exceeded for token {token}."}, headers)
+                if emulator.secondary_rate and emulator._draw() < emulator.secondary_rate:
+                    emulator._count("secondary")
+                    return self.send(403, {"message": "You have exceeded a secondary rate limit."},
+                                     headers + [("Retry-After", str(emulator.retry_after))])
+                if url.path == "/search/code":
+                    return self.search(parse_qs(url.query), headers)
+                parts = url.path.strip("/").split("/")
+                if len(parts) == 3 and parts[0] == "repos":
+                    doc = emulator.data.repos.get(f"{parts[1]}/{parts[2]}".lower())
+                    if doc is not None:
+                        return self.send(200, rewrite_urls(doc, emulator.url), headers)
+                elif len(parts) >= 4 and parts[-3:-1] == ["git", "blobs"]:
+                    content = emulator.data.blob(parts[-1])
+                    if content is not None:
+                        return self.send(200, content, headers, content_type="application/vnd.github.raw")
+                self.send(404, {"message": "Not Found"}, headers)
+
+            def search(self, params, headers):
+                query = params.get("q", [""])[0]
+                page = int(params.get("page", ["1"])[0])
+                per_page = int(params.get("per_page", [str(PER_PAGE)])[0])
+                if page * per_page > MAX_PAGES * PER_PAGE:
+                    return self.send(422, {"message": "Cannot access beyond the first 1000 results."}, headers)
+                base, _, qualifiers = query.partition(" language:YAML")
+                prefix, size_range, repo = "", None, None
+                for qualifier in qualifiers.split():
+                    name, _, value = qualifier.partition(":")
+                    if name == "filename":
+                        prefix = value
+                    elif name == "size":
+                        low, high = value.split("..")
+                        size_range = (int(low), int(high))
+                    elif name == "repo":
+                        repo = value
+                matches = emulator.data.search(base, prefix, size_range, repo)
+                items = matches[(page - 1) * per_page:page * per_page]
+                body = {"total_count": len(matches), "incomplete_results": False,
+                        "items": [rewrite_urls(item, emulator.url) for item in items]}
+                self.send(200, body, headers)
+
+        return Handler
+
+    def print_summary(self):
+        stats = self.stats
+        print(f"  emulator: {stats['requests']} requests, {stats['rate_limited']} rate limited, "
+              f"{stats['secondary']} secondary limits, {stats['not_modified']} not modified")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve the recorded search and repository data as a local GitHub API.")
+    parser.add_argument("--data", default="data", help="folder with the recorded search shards")
+    parser.add_argument("--repos", default="data/repositoryinfo", help="folder of *_repos.parquet files")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.0, help="mean seconds added to every response")
+    parser.add_argument("--secondary-rate", type=float, default=0.0, help="share of requests answered with a secondary-limit 403")
+    parser.add_argument("--search-limit", type=int, default=10, help="code search requests per token and window")
+    parser.add_argument("--core-limit", type=int, default=5000, help="core requests per token and window")
+    parser.add_argument("--time-scale", type=float, default=60,
+                        help="run the rate-limit windows this many times faster; 1 for GitHub's real windows")
+    args = parser.parse_args()
+
+    data = RecordedData(args.data, args.repos)
+    emulator = ApiEmulator(data, port=args.port, latency=args.latency, secondary_rate=args.secondary_rate,
+                           search_limit=args.search_limit, core_limit=args.core_limit, time_scale=args.time_scale)
+    print(f"Serving {sum(len(items) for items in data.items.values())} search items and "
+          f"{len(data.repos)} repositories at {emulator.url}")
+    try:
+        emulator.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    emulator.print_summary()
+
+
+if __name__ == "__main__":
+    main()
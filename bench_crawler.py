@@ -0,0 +1,121 @@
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from api_emulator import ApiEmulator, RecordedData
+from event_log import read_events
+
+# End-to-end benchmark of the crawl scripts against api_emulator.py: test4.py
+# sweeps the recorded search results, then test5.py fetches the repositories it
+# found, both in a scratch folder with GITHUB_API pointed at the emulator. No
+# quota is spent and the rate-limit windows are compressed (--time-scale, 60
+# by default), so a run finishes unattended and two versions of the
+# crawler can be compared on the same data. Reports wall time, requests, search
+# pages per second and bytes written for each stage.
+#
+# Usage: python bench_crawler.py [--latency 0.05] [--secondary-rate 0.01] ...
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def folder_bytes(path):
+    """(Parquet bytes, total bytes) under path; the rest are caches, journals and stores."""
+    output = total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            size = os.path.getsize(os.path.join(root, name))
+            total += size
+            if name.endswith(".parquet"):
+                output += size
+    return output, total
+
+
+def run_stage(script, work_dir, env, log_pattern, args=()):
+    """Run one crawl script in work_dir; return (seconds, events of its JSON-lines log)."""
+    with open(os.path.join(work_dir, f"{script}.out"), "w") as out:
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, os.path.join(HERE, script), *args],
+                                cwd=work_dir, env=env, stdout=out, stderr=subprocess.STDOUT)
+        seconds = time.perf_counter() - started
+    if result.returncode != 0:
+        print(f"{script} exited with {result.returncode}, see {work_dir}/{script}.out")
+    logs = sorted(glob.glob(os.path.join(work_dir, log_pattern)))
+    return seconds, list(read_events(logs[-1])) if logs else []
+
+
+def stage_row(name, seconds, records, written):
+    requests = sum(1 for r in records if r.get("event") == "request")
+    pages = [r for r in records if r.get("event") == "page"]
+    limited = sum(1 for r in records if r.get("event") == "request" and r.get("status") in (403, 429))
+    output, total = written
+    return (name, seconds, requests, limited, len(pages), sum(r.get("items", 0) for r in pages),
+            len(pages) / seconds if seconds else 0.0, output, total)
+
+
+def print_report(rows):
+    print(f"\n{'stage':<8} {'seconds':>8} {'requests':>9} {'limited':>8} {'pages':>6} {'items':>7} "
+          f"{'pages/s':>8} {'output MB':>10} {'total MB':>9}")
+    for name, seconds, requests, limited, pages, items, rate, output, total in rows:
+        print(f"{name:<8} {seconds:>8.1f} {requests:>9} {limited:>8} {pages:>6} {items:>7} "
+              f"{rate:>8.1f} {output / 1e6:>10.2f} {total / 1e6:>9.2f}")
+
+
+def run(args):
+    print("Loading recorded data...")
+    data = RecordedData(args.data, args.repos)
+    emulator = ApiEmulator(data, latency=args.latency, secondary_rate=args.secondary_rate,
+                           search_limit=args.search_limit, core_limit=args.core_limit, time_scale=args.time_scale)
+    url = emulator.start()
+    print(f"Emulator at {url}")
+
+    env = {k: v for k, v in os.environ.items() if not k.startswith("GITHUB_TOKEN")}
+    env["GITHUB_API"] = url
+    for i in range(1, args.tokens + 1):
+        env[f"GITHUB_TOKEN{i}"] = f"bench{i}"
+
+    work_dir = tempfile.mkdtemp(prefix="bench_crawler_")
+    rows = []
+    try:
+        seconds, records = run_stage("test4.py", work_dir, env, "istio_security_log_*.jsonl")
+        sweep_dir = os.path.join(work_dir, "istio_security_data")
+        rows.append(stage_row("test4", seconds, records, folder_bytes(sweep_dir)))
+
+        if not args.skip_repos:
+            # test5.py reads the sweep output from istio_repository
+            os.symlink(sweep_dir, os.path.join(work_dir, "istio_repository"))
+            before = folder_bytes(sweep_dir)
+            seconds, records = run_stage("test5.py", work_dir, env, "github_repo_log_*.jsonl")
+            after = folder_bytes(sweep_dir)
+            rows.append(stage_row("test5", seconds, records,
+                                  (after[0] - before[0], after[1] - before[1])))
+    finally:
+        emulator.stop()
+        if args.keep:
+            print(f"Kept {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_report(rows)
+    print(f"sweep end to end: {sum(row[1] for row in rows):.1f}s")
+    emulator.print_summary()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark test4.py and test5.py against the local API emulator.")
+    parser.add_argument("--data", default=os.path.join(HERE, "data"))
+    parser.add_argument("--repos", default=os.path.join(HERE, "data", "repositoryinfo"))
+    parser.add_argument("--tokens", type=int, default=2, help="GITHUB_TOKENn variables to set (test4 needs 2)")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--secondary-rate", type=float, default=0.0)
+    parser.add_argument("--search-limit", type=int, default=10, help="code search requests per token and window")
+    parser.add_argument("--core-limit", type=int, default=5000)
+    parser.add_argument("--time-scale", type=float, default=60,
+                        help="rate-limit windows run this many times faster; 1 waits out GitHub's real windows")
+    parser.add_argument("--skip-repos", action="store_true", help="only run the test4.py sweep")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch folder")
+    run(parser.parse_args())
@@ -0,0 +1,77 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import pandas as pd
+from parquet_sink import ParquetSink, flatten_item_for_parquet, read_parquet_parts
+
+# Compare the cost of appending search items with the old read-concat-rewrite
+# approach against ParquetSink. Usage: python bench_parquet_sink.py [items] [step]
+
+
+def make_item(i):
+    owner = f"owner{i % 97}"
+    return {
+        "name": f"policy-{i}.yaml",
+        "path": f"deploy/istio/policy-{i}.yaml",
+        "sha": f"{i:040x}",
+        "html_url": f"https://github.com/{owner}/repo{i}/blob/main/policy-{i}.yaml",
+        "repository": {
+            "id": i,
+            "name": f"repo{i}",
+            "full_name": f"{owner}/repo{i}",
+            "private": False,
+            "html_url": f"https://github.com/{owner}/repo{i}",
+            "description": "istio security test repository",
+            "fork": False,
+        },
+        "score": 1.0,
+    }
+
+
+def rewrite_append(filename, item):
+    """The previous append_item_to_parquet from test4.py."""
+    new_df = pd.DataFrame([flatten_item_for_parquet(item)])
+    if os.path.exists(filename):
+        existing_df = pd.read_parquet(filename)
+        combined_df = pd.concat([existing_df, new_df], ignore_index=True)
+    else:
+        combined_df = new_df
+    combined_df.to_parquet(filename, index=False, compression="snappy")
+
+
+def run(total_items, step):
+    work_dir = tempfile.mkdtemp(prefix="bench_sink_")
+    try:
+        rewrite_path = os.path.join(work_dir, "rewrite.parquet")
+        sink_path = os.path.join(work_dir, "sink.parquet")
+        sink = ParquetSink(sink_path, max_rows=1000, max_seconds=60.0)
+
+        print(f"{'rows in shard':>14} {'rewrite ms/item':>16} {'sink ms/item':>14}")
+        for start in range(0, total_items, step):
+            items = [make_item(i) for i in range(start, start + step)]
+
+            t0 = time.perf_counter()
+            for item in items:
+                rewrite_append(rewrite_path, item)
+            rewrite_cost = (time.perf_counter() - t0) * 1000 / step
+
+            t0 = time.perf_counter()
+            for item in items:
+                sink.append(item)
+            sink_cost = (time.perf_counter() - t0) * 1000 / step
+
+            print(f"{start + step:>14} {rewrite_cost:>16.3f} {sink_cost:>14.3f}")
+        sink.close()
+
+        rows = len(read_parquet_parts(sink_path))
+        print(f"\nsink wrote {rows} rows in {sink.parts_written} parts")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    step = int(sys.argv[2]) if len(sys.argv) > 2 else 250
+    run(total, step)
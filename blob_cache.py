@@ -0,0 +1,58 @@
+import os
+import requests
+from token_pool import CORE
+
+# On-disk cache of file contents keyed by git blob SHA. Identical blobs that
+# show up under several queries or repositories are downloaded only once.
+
+RAW_HEADERS = {"Accept": "application/vnd.github.raw"}
+
+
+class BlobCache:
+    def __init__(self, directory="blob_cache"):
+        self.directory = directory
+        self.hits = 0
+        self.downloads = 0
+        self.failures = 0
+
+    def path(self, sha):
+        return os.path.join(self.directory, sha[:2], sha)
+
+    def get(self, sha):
+        """Cached content for sha as bytes, or None."""
+        try:
+            with open(self.path(sha), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, sha, content):
+        path = self.path(sha)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def fetch(self, sha, git_url, pool, session=requests):
+        """
+        Return the blob content, downloading it through the token pool if needed.
+
+        git_url is the blob API URL stored with every search item
+        (/repos/{owner}/{repo}/git/blobs/{sha}). Returns None on failure.
+        """
+        content = self.get(sha)
+        if content is not None:
+            self.hits += 1
+            return content
+        response = pool.get(git_url, bucket=CORE, headers=RAW_HEADERS, session=session)
+        if response.status_code != 200:
+            self.failures += 1
+            print(f"    Failed to fetch blob {sha}: {response.status_code}")
+            return None
+        self.downloads += 1
+        self.put(sha, response.content)
+        return response.content
+
+    def print_summary(self):
+        print(f"  blobs: {self.hits} cached, {self.downloads} downloaded, {self.failures} failed")
@@ -0,0 +1,477 @@
+import hashlib
+import inspect
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from analysis_artifacts import HERE, default_store
+from figure_style import FONT_DIR, FONT_FILES, font, save_fig
+
+# Headless build of the paper figures and tables. Each output under
+# data-analysis/figures is a target: a function drawing it from named frames of
+# analysis_artifacts.py. A target is rebuilt only when its key changes; the key
+# hashes the keys of its input artifacts (so the content of the repositoryinfo
+# files behind them), the target's source code and the font files. Stale targets
+# render in a process pool with the Agg backend, so no display is needed:
+#
+#   python build_figures.py                   rebuild what changed
+#   python build_figures.py mTLS_modes.svg    one target
+#   python build_figures.py --force --list
+#
+# Fonts and saving come from figure_style.py, which the notebooks import too.
+# Every worker loads each (font, size) once, and all workers share one matplotlib
+# font cache under data/.artifacts/matplotlib instead of rebuilding it per
+# process. The Venn diagrams need matplotlib_venn and the heatmaps seaborn;
+# figures not ported yet are still drawn by their notebooks. The build exits
+# with status 1 if any target failed.
+
+FIGURE_DIR = os.path.join(HERE, "data-analysis", "figures")
+MPL_CACHE = os.path.join(HERE, "data", ".artifacts", "matplotlib")
+MANIFEST = ".build.json"
+COLORS = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b", "#e377c2"]
+# bump when a shared drawing helper changes, so every target is rebuilt
+BUILD_VERSION = 1
+
+TARGETS = {}
+
+
+def target(output, inputs):
+    """Register fn(frames) as the target writing output; inputs maps frame names to (artifact, params)."""
+    def register(fn):
+        TARGETS[output] = (fn, inputs)
+        return fn
+    return register
+
+
+def _source(key):
+    return "source", {"key": key}
+
+
+def _exclusive(category, version, mode=None):
+    return "exclusive", {"category": category, "version": version, "mode": mode, "others": None}
+
+
+# the mtls notebook's frames: v1 files reduced to repositories not in v1beta1 or v1alpha1
+MTLS_INPUTS = {
+    "strict_v1": _exclusive("mtls", "v1", "strict"),
+    "permissive_v1": _exclusive("mtls", "v1", "permissive"),
+    "disable_v1": _exclusive("mtls", "v1", "disable"),
+    "strict_v1beta1": _source("mtls_strict_v1beta1"),
+    "permissive_v1beta1": _source("mtls_permissive_v1beta1"),
+    "disable_v1beta1": _source("mtls_disable_v1beta1"),
+    "strict_v1alpha1": _source("mtls_strict_v1alpha1"),
+    "permissive_v1alpha1": _source("mtls_permissive_v1alpha1"),
+}
+
+VERSIONS = ("v1", "v1beta1", "v1alpha1")
+# the authentication notebook's frames: peer and request authentication per version
+AUTH_INPUTS = {f"{kind}_{version}": _source(f"{kind}_auth_{version}") for kind in ("peer", "req") for version in VERSIONS}
+# the mtls repositories of every mode per version, as repo_index selects them in the cross notebook
+MTLS_VERSION_INPUTS = {version: ("repos", {"category": "mtls", "version": version, "mode": None}) for version in VERSIONS}
+# authorization features of the authentization and cross notebooks and the files behind them
+AUTHZ_FEATURES = {
+    "HTTP": ["http_authz_v1", "http_authz_v1beta1"],
+    "TCP": ["tcp_authz_v1", "tcp_authz_v1beta1"],
+    "JWT": ["jwt_authz_v1", "jwt_authz_v1beta1"],
+    "Provider": ["provider_authz_v1", "provider_authz_v1beta1"],
+    "Ingress": ["ingress_authz_ip_v1", "ingress_authz_ip_v1beta1",
+                "ingress_authz_remote_ip_v1", "ingress_authz_remote_ip_v1beta1"],
+}
+AUTHZ_INPUTS = {key: _source(key) for keys in AUTHZ_FEATURES.values() for key in keys}
+
+
+# --- worker side: matplotlib is imported only where figures are drawn -------
+
+def _init_worker():
+    os.environ.setdefault("MPLCONFIGDIR", MPL_CACHE)
+
+
+def _pyplot():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def _bar_figure(labels, counts, colors, figsize, ylim, title=None, inside=False, rotation=20):
+    """Vertical bars annotated with count and share, as in the mtls notebook."""
+    plt = _pyplot()
+
+    prop = font()
+    total = sum(counts)
+    percentages = [count / total * 100 if total > 0 else 0 for count in counts]
+    fig, ax = plt.subplots(figsize=figsize)
+    bars = ax.bar(labels, counts, color=colors, width=0.6 if inside else 0.8)
+    ax.set_ylabel("Number of Applications", fontproperties=prop)
+    if title is not None:
+        ax.set_title(title, fontproperties=prop)
+    plt.setp(ax.get_xticklabels(), rotation=rotation, ha="right" if rotation else "center", fontproperties=prop)
+    plt.setp(ax.get_yticklabels(), fontproperties=prop)
+    for bar, pct in zip(bars, percentages):
+        x = bar.get_x() + bar.get_width() / 2
+        height = bar.get_height()
+        if inside and pct >= 5:
+            ax.text(x, height * 0.5, f"{pct:.1f}%", ha="center", va="center", color="white", fontproperties=prop)
+            ax.text(x, height, f"{int(height)}", ha="center", va="bottom", fontproperties=prop)
+        else:
+            ax.text(x, height, f"{int(height)} ({pct:.1f}%)", ha="center", va="bottom", fontproperties=prop)
+    ax.set_ylim(0, ylim)
+    fig.tight_layout()
+    return fig
+
+
+def _venn_figure(counts, names, region_labels, figsize, sizes=None, set_labels=("", "", ""), title=None,
+                 legend_anchor=None):
+    """
+    Three-set Venn diagram with each region labelled by its count and name, as
+    in the authentication and cross notebooks. sizes are the region areas in
+    venn3 order (default: the counts).
+    """
+    plt = _pyplot()
+    from matplotlib.patches import Patch
+    from matplotlib_venn import venn3
+
+    prop = font()
+    colors = COLORS[:3]
+    fig = plt.figure(figsize=figsize)
+    venn = venn3(subsets=sizes or tuple(counts[region] for region in VENN3_ORDER),
+                 set_labels=set_labels, set_colors=colors, alpha=0.5)
+    for region, text in region_labels.items():
+        label = venn.get_label_by_id(region)
+        if label is not None:
+            label.set_text(f"{counts[region]}\n{text}")
+            label.set_fontproperties(prop)
+            x, y = label.get_position()
+            label.set_position((x, y + 0.01))
+    legend = {"bbox_to_anchor": legend_anchor} if legend_anchor else {}
+    plt.legend(handles=[Patch(facecolor=color, alpha=0.5, label=name) for color, name in zip(colors, names)],
+               loc="upper right", prop=prop, **legend)
+    if title is not None:
+        plt.title(title, fontproperties=prop)
+    plt.tight_layout(pad=0 if legend_anchor else 1.08)
+    return fig
+
+
+def _heatmap_figure(matrix, fmt, figsize, cbar_label=None, title=None):
+    """Annotated seaborn heatmap with the notebook font on ticks, cells and colorbar."""
+    plt = _pyplot()
+    import seaborn as sns
+
+    prop = font()
+    fig = plt.figure(figsize=figsize)
+    ax = sns.heatmap(matrix, annot=True, fmt=fmt, cmap="Blues",
+                     cbar_kws={"label": cbar_label} if cbar_label else None)
+    if cbar_label:
+        cbar = ax.collections[0].colorbar
+        cbar.set_label(cbar_label, fontproperties=prop)
+        cbar.ax.yaxis.set_tick_params(labelsize=prop.get_size())
+        for tick in cbar.ax.get_yticklabels():
+            tick.set_fontproperties(prop)
+        for text in ax.texts:
+            text.set_fontproperties(prop)
+    if title is not None:
+        ax.set_title(title, fontproperties=prop)
+    ax.set_xticklabels(ax.get_xticklabels(), fontproperties=prop, rotation=45, ha="right")
+    ax.set_yticklabels(ax.get_yticklabels(), fontproperties=prop, rotation=0)
+    fig.tight_layout()
+    return fig
+
+
+def _write(output, result, out_dir):
+    """Write a figure or table text atomically; returns the path."""
+    path = os.path.join(out_dir, output)
+    tmp_path = path + ".tmp"
+    if isinstance(result, str):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(result)
+    else:
+        plt = _pyplot()
+        save_fig(result, tmp_path, format=os.path.splitext(output)[1][1:])
+        plt.close(result)
+    os.replace(tmp_path, path)
+    return path
+
+
+def render(job):
+    """Worker: draw one target from its input artifacts; returns (output, seconds)."""
+    output, out_dir = job
+    started = time.perf_counter()
+    fn, inputs = TARGETS[output]
+    store = default_store()
+    frames = {label: store.get(name, **params) for label, (name, params) in inputs.items()}
+    _write(output, fn(frames), out_dir)
+    return output, time.perf_counter() - started
+
+
+# --- shared frame logic --------------------------------------------------------
+
+def regions(sets):
+    """Venn regions of named sets: {tuple of names: members in exactly those sets}."""
+    members = {}
+    for name, values in sets.items():
+        for value in values:
+            members.setdefault(value, []).append(name)
+    counts = {}
+    for value, names in members.items():
+        counts.setdefault(tuple(names), set()).add(value)
+    return counts
+
+
+def _mtls_sets(frames, min_stars=0):
+    """Repository names per version and per mode of the mtls frames."""
+    def names(*labels):
+        return {name for label in labels for name, stars in zip(frames[label]["full_name"], frames[label]["stargazers_count"])
+                if stars >= min_stars}
+
+    versions = {
+        "v1": names("strict_v1", "permissive_v1", "disable_v1"),
+        "v1beta1": names("strict_v1beta1", "permissive_v1beta1", "disable_v1beta1"),
+        "v1alpha1": names("strict_v1alpha1", "permissive_v1alpha1"),
+    }
+    modes = {
+        "strict": names("strict_v1", "strict_v1beta1", "strict_v1alpha1"),
+        "permissive": names("permissive_v1", "permissive_v1beta1", "permissive_v1alpha1"),
+        "disable": names("disable_v1", "disable_v1beta1"),
+    }
+    return versions, modes
+
+
+VERSION_REGIONS = [("v1",), ("v1beta1",), ("v1alpha1",), ("v1", "v1beta1")]
+VERSION_LABELS = ["v1", "beta", "alpha", "v1 ∩ beta"]
+MODE_REGIONS = [("strict",), ("permissive",), ("disable",), ("strict", "permissive"), ("strict", "disable"),
+                ("permissive", "disable"), ("strict", "permissive", "disable")]
+MODE_LABELS = ["Strict", "Permissive", "Disable", "Strict ∩ Permissive", "Strict ∩ Disable",
+               "Disable ∩ Permissive", "All modes"]
+
+
+# venn3 region ids in its subsets order: only A, only B, A and B, only C, A and C, B and C, all three
+VENN3_ORDER = ("100", "010", "110", "001", "101", "011", "111")
+VENN_LABELS = {"100": "v1", "010": "beta", "001": "alpha", "110": "v1 ∪ beta", "101": "v1 ∪ alpha",
+               "011": "beta ∪ alpha", "111": "v1 ∪ beta ∪ alpha"}
+
+
+def venn3_counts(a, b, c):
+    """Sizes of the seven regions of three sets, by venn3 region id."""
+    found = regions({"100": a, "010": b, "001": c})
+    counts = {}
+    for region in VENN3_ORDER:
+        names = tuple(name for name, bit in zip(("100", "010", "001"), region) if bit == "1")
+        counts[region] = len(found.get(names, ()))
+    return counts
+
+
+def _auth_version_sets(frames):
+    """Repositories with peer or request authentication, per version."""
+    return [set(frames[f"peer_{version}"]["full_name"]) | set(frames[f"req_{version}"]["full_name"])
+            for version in VERSIONS]
+
+
+def cooccurrence(sets):
+    """Repositories in both features for every pair of named sets, as a square frame."""
+    import pandas as pd
+    names = list(sets)
+    return pd.DataFrame([[len(sets[a] & sets[b]) for b in names] for a in names], index=names, columns=names)
+
+
+def _names(frames, labels):
+    return {name for label in labels for name in frames[label]["full_name"]}
+
+
+def _region_counts(sets, wanted):
+    found = {tuple(sorted(key)): len(values) for key, values in regions(sets).items()}
+    return [found.get(tuple(sorted(key)), 0) for key in wanted]
+
+
+def _latex_table(header, rows):
+    """A booktabs tabular; the first column is left aligned, the others right aligned."""
+    lines = ["\\begin{tabular}{l" + "r" * (len(header) - 1) + "}", "\\toprule",
+             " & ".join(header) + " \\\\", "\\midrule"]
+    lines += [" & ".join(str(cell) for cell in row) + " \\\\" for row in rows]
+    lines += ["\\bottomrule", "\\end{tabular}", ""]
+    return "\n".join(lines).replace("∩", "$\\cap$")
+
+
+# --- targets ---------------------------------------------------------------------
+
+@target("mtls_api_versions_usage.svg", MTLS_INPUTS)
+def mtls_api_versions_usage(frames):
+    versions, _ = _mtls_sets(frames)
+    counts = _region_counts(versions, VERSION_REGIONS)
+    return _bar_figure(VERSION_LABELS, counts, ["#1f77b4", "#ff7f0e", "#2ca02c", "#9467bd"], (5, 4), 950, inside=True)
+
+
+@target("mtls_api_versions_usage_star.svg", MTLS_INPUTS)
+def mtls_api_versions_usage_star(frames):
+    versions, _ = _mtls_sets(frames, min_stars=10)
+    counts = _region_counts(versions, VERSION_REGIONS)
+    return _bar_figure(VERSION_LABELS, counts, ["#1f77b4", "#ff7f0e", "#2ca02c", "#9467bd"], (5, 4), 130, inside=True)
+
+
+@target("mTLS_modes.svg", MTLS_INPUTS)
+def mtls_modes(frames):
+    _, modes = _mtls_sets(frames)
+    return _bar_figure(MODE_LABELS, _region_counts(modes, MODE_REGIONS), COLORS, (7, 4), 601,
+                       title="mTLS mode per repository")
+
+
+@target("mTLS_modes_star.svg", MTLS_INPUTS)
+def mtls_modes_star(frames):
+    _, modes = _mtls_sets(frames, min_stars=10)
+    return _bar_figure(MODE_LABELS, _region_counts(modes, MODE_REGIONS), COLORS, (7, 4), 65,
+                       title="mTLS mode per repository")
+
+
+@target("istio_by_version.svg", MTLS_INPUTS)
+def istio_by_version(frames):
+    counts = [
+        sum(len(frames[f"{mode}_v1"]) for mode in ("strict", "permissive", "disable")),
+        sum(len(frames[f"{mode}_v1beta1"]) for mode in ("strict", "permissive", "disable")),
+        sum(len(frames[f"{mode}_v1alpha1"]) for mode in ("strict", "permissive")),
+    ]
+    return _bar_figure(["Istio v1", "Istio beta", "Istio alpha"], counts, COLORS[:3], (4, 4), 1255, rotation=0)
+
+
+@target("mtls_versions.tex", MTLS_INPUTS)
+def mtls_versions_table(frames):
+    versions, _ = _mtls_sets(frames)
+    starred, _ = _mtls_sets(frames, min_stars=10)
+    rows = zip(VERSION_LABELS, _region_counts(versions, VERSION_REGIONS), _region_counts(starred, VERSION_REGIONS))
+    return _latex_table(["API versions", "Repositories", "$\\geq$10 stars"], rows)
+
+
+@target("mtls_modes.tex", MTLS_INPUTS)
+def mtls_modes_table(frames):
+    _, modes = _mtls_sets(frames)
+    _, starred = _mtls_sets(frames, min_stars=10)
+    rows = zip(MODE_LABELS, _region_counts(modes, MODE_REGIONS), _region_counts(starred, MODE_REGIONS))
+    return _latex_table(["mTLS modes", "Repositories", "$\\geq$10 stars"], rows)
+
+
+@target("authentication_venn.svg", AUTH_INPUTS)
+def authentication_venn(frames):
+    counts = venn3_counts(*_auth_version_sets(frames))
+    # region areas on a log scale, so the small alpha regions stay visible
+    sizes = tuple(math.log10(counts[region] + 1) for region in VENN3_ORDER)
+    return _venn_figure(counts, ["v1", "beta", "alpha"], VENN_LABELS, (8, 8), sizes=sizes)
+
+
+@target("authentication_venn_fixed_small.svg", AUTH_INPUTS)
+def authentication_venn_fixed_small(frames):
+    counts = venn3_counts(*_auth_version_sets(frames))
+    return _venn_figure(counts, ["v1", "beta", "alpha"], VENN_LABELS, (5, 5), sizes=(1,) * 7,
+                        legend_anchor=(1, 1.05))
+
+
+@target("istio_venn_fixed_labels.svg", MTLS_VERSION_INPUTS)
+def istio_venn_fixed_labels(frames):
+    counts = venn3_counts(*(set(frames[version]["full_name"]) for version in VERSIONS))
+    return _venn_figure(counts, ["v1", "beta", "alpha"], VENN_LABELS, (8, 8), sizes=(1,) * 7,
+                        set_labels=["v1", "beta", "alpha"], title="Istio Authentication Usage Across Versions")
+
+
+@target("authz_heatmap.svg", AUTHZ_INPUTS)
+def authz_heatmap(frames):
+    sets = {feature: _names(frames, keys) for feature, keys in AUTHZ_FEATURES.items()}
+    return _heatmap_figure(cooccurrence(sets), "d", (8, 6), cbar_label="Number of repositories")
+
+
+@target("total_heatmap.svg", {**AUTH_INPUTS, **AUTHZ_INPUTS, **MTLS_INPUTS,
+                              "any_authz_v1alpha1": _source("any_authz_v1alpha1")})
+def total_heatmap(frames):
+    sets = {
+        "Peer": _names(frames, [f"peer_{version}" for version in VERSIONS]),
+        "Request": _names(frames, [f"req_{version}" for version in VERSIONS]),
+        **{feature: _names(frames, keys) for feature, keys in AUTHZ_FEATURES.items()},
+        "Any": _names(frames, ["any_authz_v1alpha1"]),
+        "Strict": _names(frames, ["strict_v1", "strict_v1beta1", "strict_v1alpha1"]),
+        "Permissive": _names(frames, ["permissive_v1", "permissive_v1beta1", "permissive_v1alpha1"]),
+        "Disable": _names(frames, ["disable_v1", "disable_v1beta1"]),
+    }
+    # share of all repositories that use any of the features
+    total = len(set().union(*sets.values()))
+    return _heatmap_figure(cooccurrence(sets) / total * 100, ".1f", (12, 10),
+                           title="Co-occurrence Heatmap: mTLS, Authentication & Authorization")
+
+
+# --- build -------------------------------------------------------------------------
+
+def target_key(store, output):
+    fn, inputs = TARGETS[output]
+    parts = [output, BUILD_VERSION, inspect.getsource(fn)]
+    parts += [(label, store.key(name, params)) for label, (name, params) in sorted(inputs.items())]
+    if not output.endswith(".tex"):
+        parts += [store.file_hash(os.path.join(FONT_DIR, name)) for name in sorted(FONT_FILES.values())]
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()[:16]
+
+
+def build(outputs=None, out_dir=FIGURE_DIR, processes=None, force=False):
+    """Render the stale targets among outputs (default: all); returns ({output: seconds}, [failed outputs])."""
+    store = default_store()
+    outputs = list(TARGETS) if not outputs else outputs
+    manifest_path = os.path.join(out_dir, MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    keys = {output: target_key(store, output) for output in outputs}
+    stale = [output for output in outputs
+             if force or manifest.get(output) != keys[output] or not os.path.exists(os.path.join(out_dir, output))]
+    print(f"Targets: {len(outputs)}, {len(outputs) - len(stale)} up to date, {len(stale)} to build")
+    if not stale:
+        return {}, []
+
+    # load every input once here, so the workers read cached parquet instead of racing to compute it
+    for output in stale:
+        for name, params in TARGETS[output][1].values():
+            store.get(name, **params)
+    os.makedirs(out_dir, exist_ok=True)
+    timings = {}
+    failed = []
+    with ProcessPoolExecutor(max_workers=min(processes or os.cpu_count() or 1, len(stale)),
+                             initializer=_init_worker) as executor:
+        futures = {output: executor.submit(render, (output, out_dir)) for output in stale}
+        for output, future in futures.items():
+            try:
+                _, seconds = future.result()
+            except Exception as e:
+                print(f"  {output}: failed: {e}")
+                failed.append(output)
+                continue
+            timings[output] = seconds
+            manifest[output] = keys[output]
+            print(f"  {output}: {seconds:.2f}s")
+
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+    return timings, failed
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Render the paper figures and tables from the cached analysis frames.")
+    parser.add_argument("targets", nargs="*", help="outputs to build (default: all)")
+    parser.add_argument("--out", default=FIGURE_DIR)
+    parser.add_argument("--processes", type=int, default=None, help="render processes (default: all cores)")
+    parser.add_argument("--force", action="store_true", help="rebuild even when the inputs did not change")
+    parser.add_argument("--list", action="store_true", help="print the targets and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for output, (fn, inputs) in TARGETS.items():
+            print(f"{output}: {', '.join(inputs)}")
+    else:
+        unknown = [output for output in args.targets if output not in TARGETS]
+        if unknown:
+            parser.error(f"unknown targets: {', '.join(unknown)}")
+        started = time.perf_counter()
+        _, failed = build(args.targets, args.out, args.processes, args.force)
+        print(f"Done in {time.perf_counter() - started:.1f}s")
+        default_store().print_summary()
+        if failed:
+            print(f"{len(failed)} targets failed: {', '.join(failed)}")
+            sys.exit(1)
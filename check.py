@@ -1,36 +1,89 @@
-import pandas as pd
 import json
 import os
 import glob
+from concurrent.futures import ThreadPoolExecutor
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from parquet_sink import list_parts
 
+# Columns that identify a repository, in order of preference. Search shards
+# carry repository_full_name, the repositoryinfo files carry full_name and older
+# exports keep the whole API document as JSON (or a struct) in api_repository.
+REPOSITORY_COLUMNS = ("repository_full_name", "full_name", "api_repository")
 
-def count_repositories_in_parquet_files(file_pattern):
-    files = glob.glob(file_pattern)
+
+def parquet_files(path):
+    """The Parquet files behind path: the file itself or the parts of a shard directory."""
+    if os.path.isdir(path):
+        return list_parts(path)
+    return [path]
+
+
+def repository_column(schema):
+    for name in REPOSITORY_COLUMNS:
+        if name in schema.names:
+            return name
+    return None
+
+
+def _full_names_from_api_repository(column):
+    if pa.types.is_struct(column.type):
+        return pc.struct_field(column, "full_name")
+    # decode each distinct document once instead of once per row
+    names = []
+    for text in pc.unique(column.drop_null()).to_pylist():
+        try:
+            full_name = json.loads(text).get("full_name")
+        except (json.JSONDecodeError, AttributeError):
+            continue
+        if full_name:
+            names.append(full_name)
+    return pa.array(names, type=pa.string())
+
+
+def file_repositories(path):
+    """Return (rows, distinct repository names) for one Parquet file, reading a single column."""
+    schema = pq.read_schema(path)
+    column_name = repository_column(schema)
+    if column_name is None:
+        return 0, set()
+    table = pq.read_table(path, columns=[column_name])
+    column = table.column(column_name).combine_chunks()
+    if column_name == "api_repository":
+        column = _full_names_from_api_repository(column)
+    return table.num_rows, set(pc.unique(column.drop_null()).to_pylist())
+
+
+def count_repositories_in_parquet_files(file_pattern, workers=8, verbose=True):
+    paths = sorted(glob.glob(file_pattern, recursive=True))
+    files = [f for p in paths for f in parquet_files(p)]
     if not files:
         print(f"No files found matching pattern: {file_pattern}")
         return 0
 
-    repo_names = set()
-
-    for file in files:
+    def count(file):
         try:
-            df = pd.read_parquet(file)
-
-            for _, row in df.iterrows():
-                if 'repository_full_name' in row:
-                    repo_names.add(row['repository_full_name'])
-                elif 'api_repository' in row:
-                    try:
-                        repo_data = json.loads(row['api_repository'])
-                        full_name = repo_data.get('full_name')
-                        if full_name:
-                            repo_names.add(full_name)
-                    except json.JSONDecodeError:
-                        continue
+            return file, file_repositories(file), None
         except Exception as e:
-            print(f"Error reading file {file}: {e}")
-            continue
+            return file, None, e
+
+    repo_names = set()
+    total_rows = 0
+    # pyarrow releases the GIL while decoding, so threads read files in parallel
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for file, result, error in executor.map(count, files):
+            if error is not None:
+                print(f"Error reading file {file}: {error}")
+                continue
+            rows, names = result
+            total_rows += rows
+            repo_names.update(names)
+            if verbose:
+                print(f"{file}: {rows} rows, {len(names)} repositories")
 
+    if verbose:
+        print(f"Files: {len(files)}, rows: {total_rows}")
     return len(repo_names)
 
 
@@ -39,7 +92,8 @@ if __name__ == "__main__":
 
     if len(sys.argv) > 1:
         pattern = sys.argv[1]
-        count = count_repositories_in_parquet_files(pattern)
+        workers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+        count = count_repositories_in_parquet_files(pattern, workers)
         print(f"Total unique repositories: {count}")
     else:
-        print("Usage: python count_repos.py 'Authori_*.parquet'")
\ No newline at end of file
+        print("Usage: python check.py 'Authori_*.parquet' [workers]")
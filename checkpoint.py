@@ -0,0 +1,35 @@
+import json
+import os
+import shutil
+
+# Resumable sweep state for test4.py. state.json holds the (query, char1,
+# shard stack, page) cursor plus the sink and seen index positions and is
+# replaced atomically after every page. Which files were already stored is
+# kept by seen_index.py, so the state stays a few hundred bytes.
+
+
+class SweepCheckpoint:
+    def __init__(self, directory):
+        self.directory = directory
+        self.state_path = os.path.join(directory, "state.json")
+
+    def load(self):
+        """Return the last saved state, or None if there is nothing to resume."""
+        if not os.path.exists(self.state_path):
+            return None
+        with open(self.state_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def save(self, state):
+        """Persist state atomically."""
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_path)
+
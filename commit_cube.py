@@ -0,0 +1,220 @@
+import hashlib
+import json
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from parquet_sink import list_parts
+
+# Pre-aggregated commit activity for the commits notebooks. For every API
+# version under data/final this keeps
+#
+#   <cubes>/<version>_activity.parquet  repository_full_name, first_commit,
+#                                       last_commit, commits
+#   <cubes>/<version>_monthly.parquet   repository_full_name, month, commits
+#   <cubes>/<version>_manifest.json     part files already folded in
+#
+# Parts are read one record batch at a time with only repository_full_name and
+# author_date, so memory is bounded by the batch size and the (small) cube, not
+# by the commit corpus. author_date is stored as a UTC timestamp (the harvester
+# and the commits_prepared.ipynb ingest parse it, migrate_author_dates()
+# converts older string parts), so batches need no date parsing. Part files
+# are append-only, so an update folds in just the parts that are new since the
+# manifest; if a known part changed (e.g. the dataset was rewritten) the cube
+# is rebuilt from scratch. Parts are recognised by size and content hash, not
+# mtime, so the committed manifests stay valid in a fresh clone.
+
+BATCH_SIZE = 64 * 1024
+COLUMNS = ["repository_full_name", "author_date"]
+HASH_CHUNK = 1024 * 1024
+
+
+def part_fingerprint(path):
+    """[size, blake2b hex digest] of a part file."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return [os.path.getsize(path), digest.hexdigest()]
+
+
+def iter_commit_batches(parts, columns=COLUMNS, batch_size=BATCH_SIZE):
+    """Yield pandas frames of the projected columns, one record batch at a time."""
+    for part in parts:
+        parquet_file = pq.ParquetFile(part)
+        for batch in parquet_file.iter_batches(columns=list(columns), batch_size=batch_size):
+            df = batch.to_pandas()
+            if "author_date" in df:
+                df["author_date"] = to_utc(df["author_date"])
+            yield df
+
+
+def to_utc(dates):
+    """author_date as tz-aware UTC timestamps, whether stored as strings or timestamps."""
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return dates.dt.tz_localize("UTC") if dates.dt.tz is None else dates.dt.tz_convert("UTC")
+    return pd.to_datetime(dates, utc=True, errors="coerce")
+
+
+def month_start(dates):
+    return dates.dt.tz_convert(None).dt.to_period("M").dt.to_timestamp()
+
+
+def _fold(activity, monthly, df):
+    """Merge one batch into the running (activity, monthly) aggregates."""
+    df = df.dropna(subset=["author_date"])
+    batch_activity = df.groupby("repository_full_name")["author_date"].agg(
+        first_commit="min", last_commit="max", commits="count")
+    batch_monthly = df.groupby(["repository_full_name", month_start(df["author_date"]).rename("month")]).size()
+    if activity is None:
+        return batch_activity, batch_monthly
+    activity = pd.concat([activity, batch_activity]).groupby(level=0).agg(
+        {"first_commit": "min", "last_commit": "max", "commits": "sum"})
+    monthly = batch_monthly.add(monthly, fill_value=0).astype("int64")
+    return activity, monthly
+
+
+class ActivityCube:
+    def __init__(self, cube_dir, version):
+        self.cube_dir = cube_dir
+        self.version = version
+        self.activity_path = os.path.join(cube_dir, f"{version}_activity.parquet")
+        self.monthly_path = os.path.join(cube_dir, f"{version}_monthly.parquet")
+        self.manifest_path = os.path.join(cube_dir, f"{version}_manifest.json")
+
+    def load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def activity(self):
+        return pd.read_parquet(self.activity_path)
+
+    def monthly(self):
+        return pd.read_parquet(self.monthly_path)
+
+    def update(self, dataset_path):
+        """Fold part files of dataset_path not seen before into the cube; return how many were read."""
+        parts = list_parts(dataset_path)
+        stats = {os.path.basename(p): part_fingerprint(p) for p in parts}
+        manifest = self.load_manifest()
+        if any(stats.get(name) != stat for name, stat in manifest.items()):
+            print(f"  {self.version}: parts changed since the last build, rebuilding")
+            manifest = {}
+        new_parts = [p for p in parts if os.path.basename(p) not in manifest]
+        if not new_parts and os.path.exists(self.activity_path):
+            return 0
+
+        activity = monthly = None
+        if manifest:
+            activity = self.activity().set_index("repository_full_name")
+            monthly = self.monthly().set_index(["repository_full_name", "month"])["commits"]
+        for df in iter_commit_batches(new_parts):
+            activity, monthly = _fold(activity, monthly, df)
+        if activity is None:
+            activity, monthly = _fold(None, None, pd.DataFrame({
+                "repository_full_name": pd.Series(dtype=str),
+                "author_date": pd.Series(dtype="datetime64[ns, UTC]")}))
+
+        os.makedirs(self.cube_dir, exist_ok=True)
+        self._write(activity.reset_index().sort_values("repository_full_name"), self.activity_path)
+        self._write(monthly.rename("commits").reset_index().sort_values(["repository_full_name", "month"]),
+                    self.monthly_path)
+        manifest.update({os.path.basename(p): stats[os.path.basename(p)] for p in new_parts})
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+        return len(new_parts)
+
+    @staticmethod
+    def _write(df, path):
+        tmp_path = path + ".tmp"
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path, compression="zstd")
+        os.replace(tmp_path, path)
+
+
+def migrate_author_dates(dataset_path):
+    """
+    Rewrite part files that still store author_date as a string with a UTC
+    timestamp column, so readers no longer parse dates on every load. Parts
+    are replaced one at a time and atomically; returns how many were rewritten.
+    """
+    rewritten = 0
+    for part in list_parts(dataset_path):
+        field = pq.read_schema(part).field("author_date")
+        if pa.types.is_timestamp(field.type):
+            continue
+        df = pd.read_parquet(part)
+        df["author_date"] = pd.to_datetime(df["author_date"], utc=True, errors="coerce")
+        tmp_path = os.path.join(dataset_path, f".{os.path.basename(part)}.tmp")
+        df.to_parquet(tmp_path, compression="snappy")
+        os.replace(tmp_path, part)
+        rewritten += 1
+    return rewritten
+
+
+def update_cubes(final_dir="data/final", cube_dir="data/aggregates"):
+    """Update the cube of every version folder under final_dir."""
+    cubes = {}
+    for version in sorted(os.listdir(final_dir)):
+        path = os.path.join(final_dir, version)
+        if version.startswith(".") or not list_parts(path):
+            continue
+        cube = ActivityCube(cube_dir, version)
+        read = cube.update(path)
+        print(f"  {version}: {read} new part files aggregated")
+        cubes[version] = cube
+    return cubes
+
+
+def load_activity(version, cube_dir="data/aggregates"):
+    """Per-repository first_commit, last_commit and commit count for one version."""
+    return ActivityCube(cube_dir, version).activity()
+
+
+def load_monthly(version, cube_dir="data/aggregates"):
+    """Commits per repository and calendar month for one version."""
+    return ActivityCube(cube_dir, version).monthly()
+
+
+def last_commits(version, exclude=(), cube_dir="data/aggregates"):
+    """
+    repository_full_name and author_date of each repository's newest commit,
+    oldest first, leaving out repositories that also appear in the versions
+    listed in exclude (e.g. v1 repositories that still use v1beta1).
+    """
+    activity = load_activity(version, cube_dir)
+    for other in exclude:
+        activity = activity[~activity["repository_full_name"].isin(load_activity(other, cube_dir)["repository_full_name"])]
+    last = activity[["repository_full_name", "last_commit"]].rename(columns={"last_commit": "author_date"})
+    return last.sort_values("author_date", ignore_index=True)
+
+
+def window_counts(version, start, end, cube_dir="data/aggregates"):
+    """
+    Commits per repository in the months from start to end, with 0 for
+    repositories that have no commit in the window. start and end are month
+    granular, e.g. "2024-08" and "2025-07".
+    """
+    monthly = load_monthly(version, cube_dir)
+    months = monthly["month"].dt.to_period("M")
+    in_window = monthly[(months >= pd.Period(start, "M")) & (months <= pd.Period(end, "M"))]
+    counts = in_window.groupby("repository_full_name")["commits"].sum()
+    repos = load_activity(version, cube_dir)["repository_full_name"]
+    return counts.reindex(repos, fill_value=0)
+
+
+if __name__ == "__main__":
+    import sys
+
+    final_dir = sys.argv[1] if len(sys.argv) > 1 else "data/final"
+    cube_dir = sys.argv[2] if len(sys.argv) > 2 else "data/aggregates"
+    for version in sorted(os.listdir(final_dir)):
+        path = os.path.join(final_dir, version)
+        if list_parts(path):
+            rewritten = migrate_author_dates(path)
+            if rewritten:
+                print(f"  {version}: author_date stored as timestamp in {rewritten} part files")
+    update_cubes(final_dir, cube_dir)
@@ -0,0 +1,347 @@
+import json
+import os
+import sys
+from urllib.parse import urlencode
+import pandas as pd
+import pyarrow.parquet as pq
+from commit_cube import to_utc, update_cubes
+from http_cache import CachedSession
+from item_schema import COMMITS
+from parquet_sink import ParquetSinkPool, list_parts
+from repo_enrichment import fetch_concurrently
+from search_queries import GITHUB_API, query_feature
+from token_pool import CORE, TokenPool, load_tokens
+
+# Commit-history harvester for the commits notebooks. Reads the repositories of
+# data/repositoryinfo/*_repos.parquet, pages through /repos/{full_name}/commits inside a
+# since/until window on several tokens at once and appends
+# (sha, author_date, repository_full_name) rows to <out>/<version>/part.N.parquet,
+# the layout the notebooks read as data/final/<version>. A repository used by
+# several API versions is fetched once and written to each of them.
+#
+# Finished repositories are recorded per version in <out>/.harvest/done.txt,
+# so an interrupted run picks up where it stopped. After every repository
+# <out>/.harvest/state.json is replaced with the sink positions and log sizes
+# at that point; a restart first rolls the parts, journals and logs back to it,
+# so rows of a repository that was not recorded as done are never kept twice.
+# Parts are written in the COMMITS schema of item_schema.py, the layout of the
+# dask parts already in data/final.
+# The newest commit of every repository is kept as a high-water mark in
+# <out>/.harvest/marks.tsv; --refresh asks each repository only for commits
+# after its mark and appends them as new part files. A dataset harvested before
+# this state existed is scanned once: the (version, repository) pairs it holds
+# are recorded as done and their newest commits as marks.
+
+SINCE = "2024-08-01T00:00:00Z"
+UNTIL = "2025-07-31T23:59:59Z"
+PER_PAGE = 100
+
+
+def commits_api_url(full_name):
+    """Commits endpoint of a repository; the repository schema does not store the *_url templates."""
+    return f"{GITHUB_API}/repos/{full_name}/commits"
+
+
+def repositories_by_version(repo_dir):
+    """{full_name: (commits API URL, {versions})} over every *_repos.parquet in repo_dir."""
+    repos = {}
+    for name in sorted(os.listdir(repo_dir)):
+        if not name.endswith("_repos.parquet"):
+            continue
+        _, _, version = query_feature(name[:-len("_repos.parquet")])
+        table = pq.read_table(os.path.join(repo_dir, name), columns=["full_name"])
+        for full_name in table.column("full_name").to_pylist():
+            if not full_name:
+                continue
+            repos.setdefault(full_name, (commits_api_url(full_name), set()))[1].add(version)
+    return repos
+
+
+def marks_from_dataset(out_dir):
+    """
+    ({full_name: (author_date, sha)}, {(version, full_name)}) of a dataset
+    already in out_dir: the newest commit per repository and every pair it holds.
+    """
+    marks = {}
+    pairs = set()
+    for version in sorted(os.listdir(out_dir)) if os.path.isdir(out_dir) else []:
+        path = os.path.join(out_dir, version)
+        if version.startswith(".") or not list_parts(path):
+            continue
+        for part in list_parts(path):
+            df = pd.read_parquet(part, columns=["sha", "author_date", "repository_full_name"])
+            df["author_date"] = to_utc(df["author_date"])
+            pairs.update((version, full_name) for full_name in df["repository_full_name"].dropna().unique())
+            df = df.dropna(subset=["author_date"])
+            newest = df.sort_values("author_date").groupby("repository_full_name").tail(1)
+            # marks are compared with the API's ISO 8601 strings
+            dates = newest["author_date"].dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+            for full_name, author_date, sha in zip(newest["repository_full_name"], dates, newest["sha"]):
+                if full_name not in marks or author_date > marks[full_name][0]:
+                    marks[full_name] = (author_date, sha)
+    return marks, pairs
+
+
+class CommitHarvester:
+    def __init__(self, out_dir, pool, session, since=SINCE, until=UNTIL):
+        self.out_dir = out_dir
+        self.pool = pool
+        self.session = session
+        self.since = since
+        self.until = until
+        self.sinks = ParquetSinkPool(max_rows=5000, max_seconds=60.0, journal=True, schema=COMMITS)
+        self.done_path = os.path.join(out_dir, ".harvest", "done.txt")
+        self.marks_path = os.path.join(out_dir, ".harvest", "marks.tsv")
+        self.state_path = os.path.join(out_dir, ".harvest", "state.json")
+        self.versions = set()
+        self.done_file = None
+        self.marks_file = None
+        self.marks = {}
+        self.commits = 0
+        self.requests = 0
+        self.failed = []
+
+    def recover(self):
+        """Roll the dataset and the logs back to the last commit() of an interrupted run."""
+        if not os.path.exists(self.state_path):
+            return
+        with open(self.state_path, encoding="utf-8") as f:
+            state = json.load(f)
+        for path, size in ((self.done_path, state["done"]), (self.marks_path, state["marks"])):
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+        self.sinks.rollback({os.path.join(self.out_dir, version): position
+                             for version, position in state["sinks"].items()})
+
+    def commit(self):
+        """Record the sink positions and log sizes that recover() returns to."""
+        self.sinks.sync()
+        paths = [os.path.join(self.out_dir, version) for version in sorted(self.versions)]
+        state = {
+            "sinks": {os.path.basename(path): position for path, position in self.sinks.positions(paths).items()},
+            "done": os.path.getsize(self.done_path) if os.path.exists(self.done_path) else 0,
+            "marks": os.path.getsize(self.marks_path) if os.path.exists(self.marks_path) else 0,
+        }
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_path)
+
+    def load_done(self):
+        """Set of (version, full_name) pairs finished by earlier runs."""
+        if not os.path.exists(self.done_path):
+            return set()
+        with open(self.done_path, encoding="utf-8") as f:
+            return {tuple(line.rstrip("\n").split("\t", 1)) for line in f if "\t" in line}
+
+    def load_marks(self):
+        """
+        Per-repository high-water marks: {full_name: (author_date, sha)} of the
+        newest harvested commit. The log is append-only and the last line for a
+        repository wins; a dataset harvested before marks existed is scanned once
+        and the pairs it holds are recorded as done along with their marks.
+        """
+        if not os.path.exists(self.marks_path):
+            self.marks, pairs = marks_from_dataset(self.out_dir)
+            if self.marks:
+                print(f"Seeding high-water marks for {len(self.marks)} repositories from {self.out_dir}")
+                self._write_done(sorted(pairs))
+                self._write_marks(self.marks.items())
+            return self.marks
+        self.marks = {}
+        with open(self.marks_path, encoding="utf-8") as f:
+            for line in f:
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) == 3:
+                    self.marks[fields[0]] = (fields[1], fields[2])
+        return self.marks
+
+    def _write_marks(self, marks):
+        if self.marks_file is None:
+            os.makedirs(os.path.dirname(self.marks_path), exist_ok=True)
+            self.marks_file = open(self.marks_path, "a", encoding="utf-8")
+        for full_name, (author_date, sha) in marks:
+            self.marks_file.write(f"{full_name}\t{author_date}\t{sha}\n")
+        self.marks_file.flush()
+        os.fsync(self.marks_file.fileno())
+
+    def mark_done(self, pairs, mark=None):
+        # logs first, then the commit: a crash in between rolls both back and only repeats work
+        if mark is not None:
+            self._write_marks([mark])
+            self.marks[mark[0]] = mark[1]
+        self._write_done(pairs)
+        self.commit()
+
+    def _write_done(self, pairs):
+        if self.done_file is None:
+            os.makedirs(os.path.dirname(self.done_path), exist_ok=True)
+            self.done_file = open(self.done_path, "a", encoding="utf-8")
+        for version, full_name in pairs:
+            self.done_file.write(f"{version}\t{full_name}\n")
+        self.done_file.flush()
+        os.fsync(self.done_file.fileno())
+
+    def page_url(self, commits_url, page, since=None):
+        params = {"per_page": PER_PAGE, "page": page}
+        since = since or self.since
+        if since:
+            params["since"] = since
+        if self.until:
+            params["until"] = self.until
+        return f"{commits_url}?{urlencode(params)}"
+
+    def fetch_commits(self, full_name, commits_url, since=None, stop_sha=None):
+        """
+        Commits of one repository in the window, newest first, or None if a page failed.
+
+        Paging stops at stop_sha (the repository's high-water mark), which is not
+        returned, so a refresh only reads pages with new commits.
+        """
+        commits = []
+        page = 1
+        while True:
+            response = self.pool.get(self.page_url(commits_url, page, since), bucket=CORE, session=self.session)
+            self.requests += 1
+            if response.status_code in (404, 409, 451):
+                # deleted, empty or blocked repositories have no commits to harvest
+                return commits
+            if response.status_code != 200:
+                print(f"  {full_name}: page {page} failed with {response.status_code}")
+                return None
+            items = response.json()
+            for item in items:
+                if item["sha"] == stop_sha:
+                    return commits
+                commits.append({
+                    "sha": item["sha"],
+                    "author_date": ((item.get("commit") or {}).get("author") or {}).get("date"),
+                    "repository_full_name": full_name,
+                })
+            if len(items) < PER_PAGE:
+                return commits
+            page += 1
+
+    def run(self, repos, workers=8, refresh=False):
+        """
+        Harvest {full_name: (commits_url, versions)}.
+
+        Without refresh only (version, repo) pairs not finished yet are fetched.
+        With refresh every repository is asked only for commits after its
+        high-water mark; versions it was not harvested for yet get the whole
+        window. New rows always go to new part files.
+        """
+        self.recover()
+        # marks first: seeding them from an existing dataset also fills done.txt
+        self.load_marks()
+        done = self.load_done()
+        todo = {}
+        for full_name, (commits_url, versions) in repos.items():
+            missing = sorted(v for v in versions if (v, full_name) not in done)
+            finished = sorted(v for v in versions if (v, full_name) in done)
+            if missing or refresh:
+                todo[full_name] = (commits_url, missing, finished if refresh else [])
+        action = "refresh" if refresh else "harvest"
+        print(f"Repositories to {action}: {len(todo)} of {len(repos)}")
+        self.versions = {version for _, missing, finished in todo.values() for version in missing + finished}
+        self.commit()
+
+        def fetch(name):
+            commits_url, missing, finished = todo[name]
+            mark = self.marks.get(name) if finished else None
+            if missing or mark is None:
+                commits = self.fetch_commits(name, commits_url)
+            else:
+                commits = self.fetch_commits(name, commits_url, since=mark[0], stop_sha=mark[1])
+            return commits, mark
+
+        names = sorted(todo)
+        for count, (full_name, result) in enumerate(fetch_concurrently(names, fetch, workers), 1):
+            commits, mark = result
+            if commits is None:
+                self.failed.append(full_name)
+                continue
+            _, missing, finished = todo[full_name]
+            new_commits = commits
+            if mark is not None:
+                # finished versions already hold everything from the mark down
+                shas = [row["sha"] for row in commits]
+                if mark[1] in shas:
+                    new_commits = commits[:shas.index(mark[1])]
+                else:
+                    new_commits = [row for row in commits if (row["author_date"] or "") > mark[0]]
+            for version in missing:
+                for row in commits:
+                    self.sinks.append(os.path.join(self.out_dir, version), row)
+            for version in finished:
+                for row in new_commits:
+                    self.sinks.append(os.path.join(self.out_dir, version), row)
+            self.commits += len(commits) if missing else len(new_commits)
+            newest = commits[0] if commits else None
+            if newest is not None and (mark is None or (newest["author_date"] or "") >= mark[0]):
+                mark = (full_name, (newest["author_date"], newest["sha"]))
+            else:
+                mark = None
+            self.mark_done([(version, full_name) for version in missing], mark)
+            if count % 100 == 0:
+                print(f"  {count}/{len(names)} repositories, {self.commits} commits")
+        self.sinks.close()
+        self.commit()
+
+    def print_summary(self):
+        print(f"  commits: {self.commits} harvested with {self.requests} requests, "
+              f"{len(self.failed)} repositories failed (rerun to retry)")
+
+    def close(self):
+        self.sinks.close()
+        for f in (self.done_file, self.marks_file):
+            if f is not None:
+                f.close()
+        self.done_file = None
+        self.marks_file = None
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Harvest commit history for the repositories in repositoryinfo.")
+    parser.add_argument("--repos", default="data/repositoryinfo", help="folder of *_repos.parquet files")
+    parser.add_argument("--out", default="data/final", help="commit dataset root, one part.N folder per version")
+    parser.add_argument("--since", default=SINCE, help="ISO 8601 lower bound, empty for full history")
+    parser.add_argument("--until", default=None,
+                        help=f"ISO 8601 upper bound, empty for no bound (default {UNTIL}, none with --refresh)")
+    parser.add_argument("--refresh", action="store_true", help="fetch only commits newer than each repository's mark")
+    parser.add_argument("--cubes", default="data/aggregates", help="activity cubes updated after the harvest")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--offline", action="store_true", help="replay responses from the HTTP cache")
+    args = parser.parse_args()
+
+    tokens = load_tokens()
+    if args.offline:
+        tokens = tokens or ["offline"]
+    elif not tokens:
+        raise ValueError("At least one GitHub token is required.")
+    pool = TokenPool(tokens)
+    http = CachedSession(os.path.join(args.out, ".http_cache.sqlite"), offline=args.offline)
+
+    until = args.until
+    if until is None:
+        until = "" if args.refresh else UNTIL
+    harvester = CommitHarvester(args.out, pool, http, since=args.since, until=until)
+    try:
+        harvester.run(repositories_by_version(args.repos), workers=args.workers, refresh=args.refresh)
+    finally:
+        harvester.close()
+    harvester.print_summary()
+    update_cubes(args.out, args.cubes)
+    http.print_summary()
+    http.close()
+    pool.print_summary()
+    return 1 if harvester.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
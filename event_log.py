@@ -0,0 +1,181 @@
+import json
+import queue
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+# Structured run log for the crawler scripts. Events are JSON lines
+# ({"ts": ..., "event": ..., ...}) handed to a background thread that writes
+# them through a buffered file and flushes about once a second, so a print or
+# a request never waits for the disk. capture_stdout() keeps the terminal
+# output and records every printed line as a "message" event, replacing the
+# old Tee wrapper. Metrics are updated as events are emitted, and
+# `python event_log.py run.jsonl` rebuilds the same summary from a log file.
+
+_STOP = object()
+
+
+class Metrics:
+    """Running totals over request, sleep and throttle events."""
+
+    def __init__(self):
+        self.started = None
+        self.last = None
+        self.events = Counter()
+        self.statuses = Counter()
+        self.requests = 0
+        self.fetch_seconds = 0.0
+        self.sleep_seconds = 0.0
+        self.throttled_seconds = 0.0
+        self.token_requests = Counter()
+        self.token_seconds = defaultdict(float)
+        self.token_remaining = {}
+        self.token_lowest = {}
+
+    def add(self, record):
+        ts = record.get("ts")
+        if ts is not None:
+            self.started = ts if self.started is None else min(self.started, ts)
+            self.last = ts if self.last is None else max(self.last, ts)
+        event = record.get("event")
+        self.events[event] += 1
+        if event == "request":
+            key = (record.get("token"), record.get("bucket"))
+            self.requests += 1
+            self.statuses[record.get("status")] += 1
+            self.fetch_seconds += record.get("latency", 0.0)
+            self.token_requests[key] += 1
+            self.token_seconds[key] += record.get("latency", 0.0)
+            remaining = record.get("remaining")
+            if remaining is not None:
+                self.token_remaining[key] = remaining
+                self.token_lowest[key] = min(remaining, self.token_lowest.get(key, remaining))
+        elif event == "sleep":
+            self.sleep_seconds += record.get("seconds", 0.0)
+        elif event == "throttled":
+            self.throttled_seconds += record.get("seconds", 0.0)
+
+    def summary_lines(self):
+        elapsed = (self.last - self.started) if self.started is not None else 0.0
+        rate = self.requests / elapsed if elapsed > 0 else 0.0
+        lines = [
+            f"  {self.requests} requests in {elapsed:.1f}s ({rate:.2f} requests/s)",
+            f"  time fetching {self.fetch_seconds:.1f}s, sleeping {self.sleep_seconds:.1f}s, "
+            f"throttled {self.throttled_seconds:.1f}s",
+            "  statuses: " + ", ".join(f"{status}: {count}" for status, count in sorted(self.statuses.items(), key=str)),
+        ]
+        for key in sorted(self.token_requests, key=str):
+            token, bucket = key
+            count = self.token_requests[key]
+            average = self.token_seconds[key] / count
+            quota = ""
+            if key in self.token_remaining:
+                quota = f", quota left {self.token_remaining[key]} (lowest {self.token_lowest[key]})"
+            lines.append(f"  token{token} {bucket}: {count} requests, {average * 1000:.0f}ms average{quota}")
+        return lines
+
+
+class _StdoutEvents:
+    """sys.stdout replacement: writes to the terminal and logs complete lines."""
+
+    def __init__(self, terminal, log):
+        self.terminal = terminal
+        self.log = log
+        self.pending = ""
+
+    def write(self, message):
+        self.terminal.write(message)
+        self.pending += message
+        if "\n" in self.pending:
+            *lines, self.pending = self.pending.split("\n")
+            for line in lines:
+                if line:
+                    self.log.emit("message", text=line)
+        return len(message)
+
+    def flush(self):
+        self.terminal.flush()
+
+    def isatty(self):
+        return self.terminal.isatty()
+
+
+class EventLog:
+    def __init__(self, path, flush_seconds=1.0):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self.metrics = Metrics()
+        self.metrics_lock = threading.Lock()
+        self.queue = queue.SimpleQueue()
+        self.file = open(path, "a", encoding="utf-8", buffering=1 << 16)
+        self.terminal = None
+        self.stdout = None
+        self.thread = threading.Thread(target=self._writer, name="event-log", daemon=True)
+        self.thread.start()
+
+    def emit(self, event, **fields):
+        record = {"ts": round(time.time(), 3), "event": event, **fields}
+        with self.metrics_lock:
+            self.metrics.add(record)
+        self.queue.put(record)
+
+    def _writer(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                record = self.queue.get(timeout=self.flush_seconds)
+            except queue.Empty:
+                record = None
+            if record is _STOP:
+                break
+            if record is not None:
+                self.file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            if time.monotonic() - last_flush >= self.flush_seconds:
+                self.file.flush()
+                last_flush = time.monotonic()
+        self.file.flush()
+
+    def capture_stdout(self):
+        """Keep printing to the terminal and record each printed line as an event."""
+        self.terminal = sys.stdout
+        self.stdout = _StdoutEvents(sys.stdout, self)
+        sys.stdout = self.stdout
+
+    def print_summary(self):
+        print("Run metrics:")
+        for line in self.metrics.summary_lines():
+            print(line)
+
+    def close(self):
+        if self.stdout is not None:
+            if self.stdout.pending:
+                self.emit("message", text=self.stdout.pending)
+            # leave stdout alone if something else replaced it after capture_stdout()
+            if sys.stdout is self.stdout:
+                sys.stdout = self.terminal
+            self.stdout = self.terminal = None
+        self.queue.put(_STOP)
+        self.thread.join()
+        self.file.close()
+
+
+def read_events(path):
+    """Yield the records of a JSON-lines event log, skipping a torn last line."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python event_log.py istio_security_log_<timestamp>.jsonl")
+        sys.exit(1)
+    metrics = Metrics()
+    for record in read_events(sys.argv[1]):
+        metrics.add(record)
+    for line in metrics.summary_lines():
+        print(line)
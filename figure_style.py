@@ -0,0 +1,29 @@
+import os
+from functools import lru_cache
+
+# Fonts and figure output shared by the data-analysis notebooks and
+# build_figures.py, so a figure drawn in a notebook and the same figure built
+# headless look alike. The fonts are the Nimbus and Inconsolata files next to
+# the notebooks; the paper figures use Nimbus Roman at 17 pt:
+#
+#   from figure_style import FONTSIZE, font, save_fig
+#   prop = font("rom", FONTSIZE)
+#   save_fig(ax, "./figures/mTLS_modes.svg")
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FONT_DIR = os.path.join(HERE, "data-analysis")
+FONT_FILES = {"rom": "NimbusRomNo9L-Reg.otf", "san": "NimbusSanL-Reg.otf", "mono": "Inconsolata-Regular.ttf"}
+FONTSIZE = 17
+
+
+@lru_cache(maxsize=None)
+def font(kind="rom", size=FONTSIZE):
+    """FontProperties of one of FONT_FILES, loaded once per process."""
+    from matplotlib import font_manager
+    return font_manager.FontProperties(fname=os.path.join(FONT_DIR, FONT_FILES[kind]), size=size)
+
+
+def save_fig(figure, path, format=None, dpi=300):
+    """Save a figure (or the figure of an Axes) tightly cropped; the format defaults to the extension of path."""
+    figure = figure if hasattr(figure, "savefig") else figure.figure
+    figure.savefig(path, format=format or os.path.splitext(path)[1][1:], dpi=dpi, bbox_inches="tight", pad_inches=0)
@@ -0,0 +1,132 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import requests
+
+# On-disk HTTP cache in front of the GitHub API. Every successful GET is stored
+# with its ETag / Last-Modified; later requests for the same URL are sent as
+# conditional requests and a 304 (which does not count against the rate limit)
+# is answered from the cache. In offline mode nothing goes to the network and
+# every response is replayed from the cache, so a pipeline run can be repeated
+# exactly.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    body BLOB NOT NULL,
+    stored_at REAL NOT NULL
+);
+"""
+
+RATE_LIMIT_HEADERS = ("X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset",
+                      "X-RateLimit-Used", "X-RateLimit-Resource")
+
+
+class CachedResponse:
+    """The parts of requests.Response the scripts use, rebuilt from the cache."""
+
+    def __init__(self, url, status_code, headers, content, from_cache=True):
+        self.url = url
+        self.status_code = status_code
+        self.headers = requests.structures.CaseInsensitiveDict(headers)
+        self.content = content
+        self.from_cache = from_cache
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class CachedSession:
+    """
+    Drop-in for the requests module in TokenPool.get(session=...).
+
+    offline=True serves every response from the cache and answers misses with
+    a 504 instead of touching the network.
+    """
+
+    def __init__(self, path="http_cache.sqlite", offline=False, session=None):
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.offline = offline
+        self.session = session or requests.Session()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(url, headers):
+        # the same URL can be fetched as JSON or raw content
+        accept = (headers or {}).get("Accept", "")
+        return f"{accept}|{url}"
+
+    def lookup(self, key):
+        with self.lock:
+            return self.db.execute(
+                "SELECT url, status, headers, body FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+    def store(self, key, response):
+        headers = dict(response.headers)
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses (key, url, status, headers, body, stored_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, response.url, response.status_code, json.dumps(headers), response.content, time.time()),
+            )
+            self.db.commit()
+
+    def get(self, url, headers=None, **kwargs):
+        key = self.key(url, headers)
+        cached = self.lookup(key)
+
+        if self.offline:
+            if cached is None:
+                self.misses += 1
+                return CachedResponse(url, 504, {}, b'{"message": "not in offline cache"}')
+            self.hits += 1
+            cached_url, status, cached_headers, body = cached
+            return CachedResponse(cached_url, status, json.loads(cached_headers), body)
+
+        request_headers = dict(headers or {})
+        if cached is not None:
+            cached_headers = json.loads(cached[2])
+            if "ETag" in cached_headers:
+                request_headers["If-None-Match"] = cached_headers["ETag"]
+            if "Last-Modified" in cached_headers:
+                request_headers["If-Modified-Since"] = cached_headers["Last-Modified"]
+
+        response = self.session.get(url, headers=request_headers, **kwargs)
+
+        if response.status_code == 304 and cached is not None:
+            self.revalidated += 1
+            cached_url, status, cached_headers, body = cached
+            merged = json.loads(cached_headers)
+            # the pool should see the current quota, not the one from when it was cached
+            for name in RATE_LIMIT_HEADERS:
+                if name in response.headers:
+                    merged[name] = response.headers[name]
+            return CachedResponse(cached_url, status, merged, body)
+
+        self.misses += 1
+        if response.status_code == 200:
+            self.store(key, response)
+        return response
+
+    def print_summary(self):
+        mode = "offline replay" if self.offline else "online"
+        print(f"  http cache ({mode}): {self.hits} replayed, {self.revalidated} not modified, {self.misses} fetched or missed")
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,290 @@
+import ast
+import glob
+import json
+import os
+import time
+from datetime import datetime, timezone
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from parquet_sink import flatten_item_for_parquet, list_parts
+from search_queries import find_shards
+
+# Fixed, versioned Arrow schemas for the tables the crawlers write:
+#
+#   SEARCH_ITEMS   one code-search item per row (test4.py shards)
+#   REPOSITORIES   one GitHub repository document per row (*_repos.parquet)
+#   COMMITS        one commit per row (commit_harvester.py parts of data/final),
+#                  in the layout of the dask parts already there, including
+#                  their __null_dask_index__ index column
+#
+# Rows used to be whatever columns the first item of a part happened to have,
+# including about forty *_url templates per repository, the owner and
+# organization objects and custom_properties as str(dict). The schemas keep
+# the fields the analysis uses, reduce nested objects to their login or
+# full_name, store repeated strings (owner, repository name, language, license)
+# dictionary encoded and timestamps as UTC timestamps. Dropped URLs are derived
+# from full_name when needed: https://github.com/{full_name},
+# https://api.github.com/repos/{full_name}/... . git_url and html_url of a
+# search item are kept, they name the blob and the ref.
+#
+# The schema name and version are stored in the file metadata, so old and new
+# files can be told apart. python item_schema.py [data] rewrites older files in
+# place; the files under data/ are migrated, and data/consolidated is rebuilt
+# from them (python repo_dataset.py).
+
+SCHEMA_VERSION = 1
+TIMESTAMP = pa.timestamp("us", tz="UTC")
+NAME_KEY = b"istio.schema"
+VERSION_KEY = b"istio.schema_version"
+
+
+def _dictionary():
+    return pa.dictionary(pa.int32(), pa.string())
+
+
+def _timestamp(value):
+    """ISO 8601 string or datetime as an aware UTC datetime."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _nested(row, key, field):
+    """row[key][field] of an API document, or row[f"{key}_{field}"] of an already compact one."""
+    value = row.get(key)
+    if isinstance(value, dict):
+        return value.get(field)
+    return row.get(f"{key}_{field}")
+
+
+def _custom_properties(value):
+    if isinstance(value, str):
+        # written as str(dict) before the schema existed
+        try:
+            value = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            return None
+    if isinstance(value, list):
+        value = dict(value)
+    if not value:
+        return None
+    return {str(k): v if isinstance(v, str) or v is None else json.dumps(v) for k, v in value.items()}
+
+
+def search_item_row(item):
+    """Schema columns of one search item, nested as returned by the API or flattened."""
+    row = flatten_item_for_parquet(item) if isinstance(item.get("repository"), dict) else item
+    return {
+        "name": row.get("name"),
+        "path": row.get("path"),
+        "sha": row.get("sha"),
+        "git_url": row.get("git_url"),
+        "html_url": row.get("html_url"),
+        "repository_id": row.get("repository_id"),
+        "repository_node_id": row.get("repository_node_id"),
+        "repository_name": row.get("repository_name"),
+        "repository_full_name": row.get("repository_full_name"),
+        "repository_owner_login": _nested(row, "repository_owner", "login"),
+        "repository_owner_id": _nested(row, "repository_owner", "id"),
+        "repository_owner_type": _nested(row, "repository_owner", "type"),
+        "repository_private": row.get("repository_private"),
+        "repository_description": row.get("repository_description"),
+        "repository_fork": row.get("repository_fork"),
+        "score": row.get("score"),
+    }
+
+
+REPOSITORY_COUNTS = ("size", "stargazers_count", "watchers_count", "forks_count", "open_issues_count",
+                     "forks", "open_issues", "watchers", "network_count", "subscribers_count")
+REPOSITORY_FLAGS = ("private", "fork", "has_issues", "has_projects", "has_downloads", "has_wiki", "has_pages",
+                    "has_discussions", "archived", "disabled", "allow_forking", "is_template",
+                    "web_commit_signoff_required")
+
+
+def repository_row(doc):
+    """Schema columns of one repository document, as returned by the API or already compact."""
+    row = {
+        "id": doc.get("id"),
+        "node_id": doc.get("node_id"),
+        "name": doc.get("name"),
+        "full_name": doc.get("full_name"),
+        "owner_login": _nested(doc, "owner", "login"),
+        "owner_id": _nested(doc, "owner", "id"),
+        "owner_type": _nested(doc, "owner", "type"),
+        "organization_login": _nested(doc, "organization", "login"),
+        "description": doc.get("description"),
+        "homepage": doc.get("homepage"),
+        "mirror_url": doc.get("mirror_url"),
+        "language": doc.get("language"),
+        "license_key": _nested(doc, "license", "key"),
+        "license_spdx_id": _nested(doc, "license", "spdx_id"),
+        "visibility": doc.get("visibility"),
+        "default_branch": doc.get("default_branch"),
+        "topics": list(doc.get("topics") or []),
+        "created_at": _timestamp(doc.get("created_at")),
+        "updated_at": _timestamp(doc.get("updated_at")),
+        "pushed_at": _timestamp(doc.get("pushed_at")),
+        "parent_full_name": _nested(doc, "parent", "full_name"),
+        "source_full_name": _nested(doc, "source", "full_name"),
+        "template_repository_full_name": _nested(doc, "template_repository", "full_name"),
+        "custom_properties": _custom_properties(doc.get("custom_properties")),
+    }
+    for name in REPOSITORY_COUNTS + REPOSITORY_FLAGS:
+        row[name] = doc.get(name)
+    return row
+
+
+class TableSchema:
+    """
+    A named, versioned Arrow schema plus the function mapping one input dict to
+    its columns. With index, tables also carry a 0..n-1 column of that name
+    that pandas reads back as the index.
+    """
+
+    def __init__(self, name, fields, row, index=None):
+        self.name = name
+        self.row = row
+        self.index = index
+        metadata = {NAME_KEY: name.encode(), VERSION_KEY: str(SCHEMA_VERSION).encode()}
+        self.columns = pa.schema(fields, metadata=metadata)
+        self.schema = self.columns if index is None else self.columns.append(pa.field(index, pa.int64()))
+
+    def table(self, items):
+        rows = []
+        for item in items:
+            # rows read back through pandas carry NaN for missing values
+            rows.append({k: None if isinstance(v, float) and v != v else v for k, v in self.row(item).items()})
+        table = pa.Table.from_pylist(rows, schema=self.columns)
+        if self.index is None:
+            return table
+        df = table.to_pandas()
+        df.index = pd.RangeIndex(len(df), name=self.index)
+        return pa.Table.from_pandas(df, schema=self.schema, preserve_index=True)
+
+    def is_current(self, path):
+        metadata = pq.read_schema(path).metadata or {}
+        return metadata.get(NAME_KEY) == self.name.encode() and metadata.get(VERSION_KEY) == str(SCHEMA_VERSION).encode()
+
+    def write(self, items, path, compression="zstd"):
+        """Write items as one Parquet file, atomically."""
+        tmp_path = path + ".tmp"
+        pq.write_table(self.table(items), tmp_path, compression=compression)
+        os.replace(tmp_path, path)
+
+    def migrate(self, path, compression="zstd"):
+        """Rewrite an older file at path in this schema; returns False if it is current already."""
+        if self.is_current(path):
+            return False
+        self.write(pq.read_table(path).to_pylist(), path, compression)
+        return True
+
+
+def commit_row(row):
+    """Schema columns of one harvested commit."""
+    return {
+        "sha": row.get("sha"),
+        "author_date": _timestamp(row.get("author_date")),
+        "repository_full_name": row.get("repository_full_name"),
+    }
+
+
+SEARCH_ITEMS = TableSchema("search_items", [
+    ("name", pa.string()),
+    ("path", pa.string()),
+    ("sha", pa.string()),
+    ("git_url", pa.string()),
+    ("html_url", pa.string()),
+    ("repository_id", pa.int64()),
+    ("repository_node_id", pa.string()),
+    ("repository_name", _dictionary()),
+    ("repository_full_name", _dictionary()),
+    ("repository_owner_login", _dictionary()),
+    ("repository_owner_id", pa.int64()),
+    ("repository_owner_type", _dictionary()),
+    ("repository_private", pa.bool_()),
+    ("repository_description", pa.string()),
+    ("repository_fork", pa.bool_()),
+    ("score", pa.float64()),
+], search_item_row)
+
+REPOSITORIES = TableSchema("repositories", [
+    ("id", pa.int64()),
+    ("node_id", pa.string()),
+    ("name", pa.string()),
+    ("full_name", pa.string()),
+    ("owner_login", _dictionary()),
+    ("owner_id", pa.int64()),
+    ("owner_type", _dictionary()),
+    ("organization_login", _dictionary()),
+    ("description", pa.string()),
+    ("homepage", pa.string()),
+    ("mirror_url", pa.string()),
+    ("language", _dictionary()),
+    ("license_key", _dictionary()),
+    ("license_spdx_id", _dictionary()),
+    ("visibility", _dictionary()),
+    ("default_branch", _dictionary()),
+    ("topics", pa.list_(pa.string())),
+    ("created_at", TIMESTAMP),
+    ("updated_at", TIMESTAMP),
+    ("pushed_at", TIMESTAMP),
+    ("parent_full_name", pa.string()),
+    ("source_full_name", pa.string()),
+    ("template_repository_full_name", pa.string()),
+    ("custom_properties", pa.map_(pa.string(), pa.string())),
+]
+    + [(name, pa.int64()) for name in REPOSITORY_COUNTS]
+    + [(name, pa.bool_()) for name in REPOSITORY_FLAGS], repository_row)
+
+COMMITS = TableSchema("commits", [
+    ("sha", pa.large_string()),
+    ("author_date", TIMESTAMP),
+    ("repository_full_name", pa.large_string()),
+], commit_row, index="__null_dask_index__")
+
+
+def data_files(root="data", repo_dir=None):
+    """(schema, path) of every search item part and *_repos.parquet file under root."""
+    repo_dir = repo_dir or os.path.join(root, "repositoryinfo")
+    files = []
+    for shards in find_shards(root).values():
+        for shard in shards:
+            files += [(SEARCH_ITEMS, part) for part in list_parts(shard) or [shard]]
+    files += [(REPOSITORIES, path) for path in sorted(glob.glob(os.path.join(repo_dir, "*_repos.parquet")))]
+    return files
+
+
+def scan_seconds(paths, columns=None):
+    started = time.perf_counter()
+    for path in paths:
+        pq.read_table(path, columns=columns)
+    return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Rewrite search item and repository files in the fixed schemas.")
+    parser.add_argument("root", nargs="?", default="data", help="folder with the search shards and repositoryinfo/")
+    parser.add_argument("--dry-run", action="store_true", help="only count the files that would be rewritten")
+    args = parser.parse_args()
+
+    files = data_files(args.root)
+    paths = [path for _, path in files]
+    stale = [(schema, path) for schema, path in files if not schema.is_current(path)]
+    print(f"{len(files)} files, {len(stale)} not in schema version {SCHEMA_VERSION}")
+    if args.dry_run or not stale:
+        raise SystemExit
+    before = sum(os.path.getsize(path) for path in paths)
+    scan_before = scan_seconds(paths)
+    for schema, path in stale:
+        schema.migrate(path)
+    after = sum(os.path.getsize(path) for path in paths)
+    scan_after = scan_seconds(paths)
+    print(f"Size: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB")
+    print(f"Full scan: {scan_before:.2f}s -> {scan_after:.2f}s")
@@ -0,0 +1,163 @@
+import glob
+import json
+import os
+import re
+import pandas as pd
+from sharding import MAX_PAGES, MAX_RESULTS, Shard
+
+# Sweep coverage reconstructed from crawler logs. Every filename prefix a run
+# probed becomes one row of (query, prefix, last_page, items, failures, capped):
+#
+#   last_page  page the prefix stopped at (the first empty page, or MAX_PAGES
+#              when every page returned items)
+#   items      search items returned for the prefix
+#   failures   pages that failed with a non-200 status
+#   capped     all MAX_PAGES pages were full, so the prefix hit the search cap
+#              and needs deeper sharding
+#
+# Both the text logs of the old two-character sweep (istio_security_log_*.txt)
+# and the JSON-lines event logs written by test4.py are understood. Files are
+# read line by line, so memory does not grow with the log size. When several
+# logs cover the same (query, prefix) the newest log wins.
+
+QUERY_LINE = re.compile(r"^Processing query: (\S+)")
+CHECKING_LINE = re.compile(r"^  Checking filename: (\S+)")
+STOP_LINE = re.compile(r"^    No more results for filename (\S+), stopping at page (\d+)\.")
+FAILED_LINE = re.compile(r"^    Failed: filename (\S+), page (\d+)")
+FOUND_LINE = re.compile(r"^  (\S+): (?:Found (\d+) items|No items found)\.")
+
+COLUMNS = ["log", "query", "prefix", "last_page", "items", "failures", "capped"]
+
+
+def parse_text_log(path):
+    """Yield one coverage row per prefix of an old text log."""
+    log = os.path.basename(path)
+    query = None
+    prefix = None
+    last_page = None
+    failures = 0
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if line.startswith("Processing query: "):
+                query = QUERY_LINE.match(line).group(1)
+            elif line.startswith("  Checking filename: "):
+                prefix = CHECKING_LINE.match(line).group(1)
+                last_page = None
+                failures = 0
+            elif line.startswith("    No more results"):
+                match = STOP_LINE.match(line)
+                if match:
+                    last_page = int(match.group(2))
+            elif FAILED_LINE.match(line):
+                failures += 1
+            elif prefix is not None and line.startswith(f"  {prefix}: "):
+                match = FOUND_LINE.match(line)
+                if not match:
+                    continue
+                items = int(match.group(2) or 0)
+                # every page up to the cap came back full; a loop that ended on
+                # failed pages never saw an empty page either, but was not capped
+                capped = failures == 0 and items >= MAX_RESULTS
+                yield {
+                    "log": log,
+                    "query": query,
+                    "prefix": prefix,
+                    "last_page": last_page if last_page is not None else MAX_PAGES,
+                    "items": items,
+                    "failures": failures,
+                    "capped": capped,
+                }
+                prefix = None
+
+
+def parse_event_log(path):
+    """Coverage rows from the request and page events of a JSON-lines log."""
+    log = os.path.basename(path)
+    shards = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if '"event": "page"' not in line and '"event": "request"' not in line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "query" not in record or "prefix" not in record:
+                continue
+            row = shards.setdefault((record["query"], record["prefix"]), {
+                "log": log, "query": record["query"], "prefix": record["prefix"],
+                "last_page": 1, "items": 0, "failures": 0, "capped": False,
+            })
+            if record["event"] == "request":
+                if record.get("status") not in (200, 403, 429):
+                    row["failures"] += 1
+            else:
+                row["last_page"] = max(row["last_page"], record["page"])
+                row["items"] += record.get("items", 0)
+                if (record.get("total_count") or 0) > MAX_RESULTS:
+                    row["capped"] = True
+    yield from shards.values()
+
+
+def build_coverage(paths):
+    """Coverage table over several logs, newest log first per (query, prefix)."""
+    rows = []
+    # log names carry their start time, so name order is run order
+    for path in sorted(paths, key=os.path.basename):
+        parse = parse_event_log if path.endswith(".jsonl") else parse_text_log
+        rows.extend(parse(path))
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    df = df.drop_duplicates(subset=["query", "prefix"], keep="last")
+    return df.sort_values(["query", "prefix"], ignore_index=True)
+
+
+def load_coverage(path):
+    return pd.read_parquet(path)
+
+
+def seed_shards(coverage, query_key, char1):
+    """
+    Starting shards for one (query, char1) sweep, or None to start from char1.
+
+    Only prefixes known to hold more than the search cap are worth seeding:
+    the char1 request would be split anyway, so the sweep starts from its
+    children directly, leaves out the ones a log saw empty without failures and
+    splits the ones that were capped one level deeper.
+    """
+    rows = coverage[(coverage["query"] == query_key) & coverage["prefix"].str.startswith(char1)
+                    & (coverage["prefix"].str.len() == len(char1) + 1)]
+    if rows.empty or rows["items"].sum() <= MAX_RESULTS:
+        return None
+    known = {row.prefix: row for row in rows.itertuples()}
+    shards = []
+    for child in Shard(char1).split():
+        row = known.get(child.prefix)
+        if row is None:
+            shards.append(child)
+        elif row.items == 0 and row.failures == 0:
+            continue
+        elif row.capped:
+            shards.extend(child.split())
+        else:
+            shards.append(child)
+    return shards
+
+
+def print_summary(coverage):
+    print(f"{len(coverage)} prefixes over {coverage['query'].nunique()} queries")
+    print(f"  empty: {int((coverage['items'] == 0).sum())}, "
+          f"with failures: {int((coverage['failures'] > 0).sum())}, "
+          f"capped: {int(coverage['capped'].sum())}")
+    for row in coverage[coverage["capped"]].itertuples():
+        print(f"  capped: {row.query} {row.prefix} ({row.items} items, {row.log})")
+
+
+if __name__ == "__main__":
+    import sys
+
+    paths = sys.argv[1:] or glob.glob("data/istio_security_log_*.txt")
+    coverage = build_coverage(paths)
+    out_path = "data/sweep_coverage.parquet"
+    coverage.to_parquet(out_path, index=False)
+    print_summary(coverage)
+    print(f"Wrote {out_path}")
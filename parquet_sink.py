@@ -0,0 +1,314 @@
+import glob
+import json
+import os
+import re
+import time
+import pandas as pd
+import pyarrow.parquet as pq
+
+PART_PATTERN = re.compile(r"^part\.(\d+)\.parquet$")
+
+
+def flatten_item_for_parquet(item):
+    """Flatten the item for easier handling in Parquet."""
+    flattended = {}
+    for key, value in item.items():
+        if isinstance(value, dict):
+            for sub_key, sub_value in value.items():
+                flattended[f"{key}_{sub_key}"] = sub_value
+        else:
+            flattended[key] = value
+    return flattended
+
+
+def _fsync_dir(path):
+    # make the rename itself durable; not every platform allows opening a directory
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def list_parts(path):
+    """Return the part files of a dataset directory sorted by part number."""
+    if not os.path.isdir(path):
+        return []
+    parts = []
+    for name in os.listdir(path):
+        match = PART_PATTERN.match(name)
+        if match:
+            parts.append((int(match.group(1)), os.path.join(path, name)))
+    return [p for _, p in sorted(parts)]
+
+
+def migrate_single_file(path):
+    """Turn an old single-file shard into a dataset directory holding it as part.0."""
+    if not os.path.isfile(path):
+        return
+    tmp_path = path + ".migrating"
+    os.replace(path, tmp_path)
+    os.makedirs(path, exist_ok=True)
+    os.replace(tmp_path, os.path.join(path, "part.0.parquet"))
+    _fsync_dir(path)
+
+
+def read_parquet_parts(path, columns=None):
+    """Read a shard written either as a single file or as a part.N directory."""
+    if os.path.isfile(path):
+        return pd.read_parquet(path, columns=columns)
+    frames = [pd.read_parquet(p, columns=columns) for p in list_parts(path)]
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
+
+
+class ParquetSink:
+    """
+    Buffer flattened items in memory and write them out as part.N.parquet files.
+
+    A shard path such as out/mtls/v1/mtls_strict_v1_a.parquet becomes a directory
+    (the same layout dask produced under data/final), so pd.read_parquet(path)
+    keeps working. Every part is written to a temporary name, fsynced and renamed,
+    so a crash leaves either a complete part or nothing, never a torn file.
+
+    With journal=True buffered rows are also appended to a JSON-lines journal
+    inside the shard directory, so rows not yet flushed survive a crash and
+    are reloaded into the buffer on the next open. sync() makes the journal
+    durable and position()/rollback() let a checkpoint restore the sink to an
+    exact earlier state.
+    """
+
+    def __init__(self, path, max_rows=1000, max_seconds=60.0, compression="snappy", journal=False, schema=None):
+        self.path = path
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+        self.compression = compression
+        self.journal = journal
+        # an item_schema.TableSchema: parts are written in its fixed columns instead of the buffer's
+        self.schema = schema
+        self.journal_file = None
+        self.buffer = []
+        self.rows_written = 0
+        self.parts_written = 0
+        self.last_flush = time.monotonic()
+
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        migrate_single_file(path)
+        os.makedirs(path, exist_ok=True)
+        parts = list_parts(path)
+        if parts:
+            self.next_part = int(PART_PATTERN.match(os.path.basename(parts[-1])).group(1)) + 1
+        else:
+            self.next_part = 0
+        if self.journal:
+            self.buffer = _read_journal(self.journal_path())
+
+    def journal_path(self, part=None):
+        if part is None:
+            return os.path.join(self.path, ".journal.jsonl")
+        # journal of an already flushed part, kept until the next flush for rollback()
+        return os.path.join(self.path, f".journal.{part}.jsonl")
+
+    def append(self, item, flatten=True):
+        """Buffer one item, flushing if the size or time threshold is reached."""
+        row = flatten_item_for_parquet(item) if flatten else item
+        self.buffer.append(row)
+        if self.journal:
+            if self.journal_file is None:
+                self.journal_file = open(self.journal_path(), "a", encoding="utf-8")
+            self.journal_file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        if len(self.buffer) >= self.max_rows or self.is_stale():
+            self.flush()
+        return True
+
+    def is_stale(self):
+        return bool(self.buffer) and time.monotonic() - self.last_flush >= self.max_seconds
+
+    def flush(self):
+        """Write the buffered rows as the next part file."""
+        self.last_flush = time.monotonic()
+        if not self.buffer:
+            return None
+        part_name = f"part.{self.next_part}.parquet"
+        final_path = os.path.join(self.path, part_name)
+        tmp_path = os.path.join(self.path, f".{part_name}.tmp")
+
+        if self.schema is not None:
+            pq.write_table(self.schema.table(self.buffer), tmp_path, compression=self.compression)
+        else:
+            pd.DataFrame(self.buffer).to_parquet(tmp_path, index=False, compression=self.compression)
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, final_path)
+        if self.journal:
+            self._close_journal()
+            previous = self.journal_path(self.next_part - 1)
+            if os.path.exists(previous):
+                os.remove(previous)
+            if os.path.exists(self.journal_path()):
+                os.replace(self.journal_path(), self.journal_path(self.next_part))
+        _fsync_dir(self.path)
+
+        self.rows_written += len(self.buffer)
+        self.parts_written += 1
+        self.next_part += 1
+        self.buffer = []
+        return final_path
+
+    def _close_journal(self):
+        if self.journal_file is not None:
+            self.journal_file.close()
+            self.journal_file = None
+
+    def sync(self):
+        """Make journaled rows durable without writing a part."""
+        if self.journal_file is not None:
+            self.journal_file.flush()
+            os.fsync(self.journal_file.fileno())
+
+    def position(self):
+        """[next part number, buffered rows]; pass to rollback() to return here."""
+        return [self.next_part, len(self.buffer)]
+
+    def rollback(self, position):
+        """
+        Drop everything written after position, restoring the buffer from the
+        journals. If more than one part was flushed since, the journal of the
+        first one is gone: the rows buffered at position are the head of that
+        part, so it is cut down to them and kept as a part instead.
+        """
+        next_part, buffered = position
+        self._close_journal()
+        flushed_since = [p for p in list_parts(self.path)
+                         if int(PART_PATTERN.match(os.path.basename(p)).group(1)) >= next_part]
+        head = None
+        if flushed_since and not os.path.exists(self.journal_path(next_part)):
+            head = pq.read_table(flushed_since[0]).slice(0, buffered)
+        for part_path in flushed_since:
+            os.remove(part_path)
+        if head is not None:
+            for journal_path in glob.glob(os.path.join(self.path, ".journal*.jsonl")):
+                os.remove(journal_path)
+            if head.num_rows:
+                tmp_path = os.path.join(self.path, f".part.{next_part}.parquet.tmp")
+                pq.write_table(head, tmp_path, compression=self.compression)
+                os.replace(tmp_path, os.path.join(self.path, f"part.{next_part}.parquet"))
+                next_part += 1
+            buffered = 0
+        elif os.path.exists(self.journal_path(next_part)):
+            # the part flushed after the checkpoint is gone, its journal holds our rows
+            os.replace(self.journal_path(next_part), self.journal_path())
+        rows = _read_journal(self.journal_path())[:buffered]
+        with open(self.journal_path(), "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        _fsync_dir(self.path)
+        self.buffer = rows
+        self.next_part = next_part
+
+    def close(self):
+        self.flush()
+        self._close_journal()
+        if self.journal:
+            previous = self.journal_path(self.next_part - 1)
+            if os.path.exists(previous):
+                os.remove(previous)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _read_journal(path):
+    if not os.path.exists(path):
+        return []
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                # torn last line from a crash mid-write
+                break
+    return rows
+
+
+class ParquetSinkPool:
+    """Keep one ParquetSink per output path and flush them together."""
+
+    def __init__(self, **sink_options):
+        self.sink_options = sink_options
+        self.sinks = {}
+
+    def get(self, path):
+        sink = self.sinks.get(path)
+        if sink is None:
+            sink = ParquetSink(path, **self.sink_options)
+            self.sinks[path] = sink
+        return sink
+
+    def append(self, path, item):
+        """Append an item to the sink for path; mirrors append_item_to_parquet."""
+        try:
+            return self.get(path).append(item)
+        except Exception as e:
+            print(f"Error appending item to Parquet sink {path}: {e}")
+            return False
+
+    def release(self, path):
+        """Flush and close the sink for path and stop tracking it."""
+        sink = self.sinks.pop(path, None)
+        if sink is not None:
+            sink.close()
+
+    def sync(self):
+        for sink in self.sinks.values():
+            sink.sync()
+
+    def positions(self, paths=()):
+        """Positions of the open sinks plus paths not opened yet (nothing buffered there)."""
+        positions = {path: sink.position() for path, sink in self.sinks.items()}
+        for path in paths:
+            if path not in positions:
+                parts = list_parts(path)
+                next_part = int(PART_PATTERN.match(os.path.basename(parts[-1])).group(1)) + 1 if parts else 0
+                positions[path] = [next_part, 0]
+        return positions
+
+    def rollback(self, positions):
+        for path, position in positions.items():
+            self.get(path).rollback(position)
+
+    def flush_stale(self):
+        """Flush sinks whose buffers are older than max_seconds."""
+        for sink in self.sinks.values():
+            if sink.is_stale():
+                sink.flush()
+
+    def flush(self):
+        for sink in self.sinks.values():
+            sink.flush()
+
+    def close(self):
+        for sink in self.sinks.values():
+            sink.close()
+        self.sinks = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,254 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import requests
+import yaml
+from blob_cache import BlobCache
+from check import parquet_files
+from repo_enrichment import fetch_concurrently
+from search_queries import api_url, find_shards
+from token_pool import TokenPool, load_tokens
+
+# Content stage for the sweep output. The search shards only say which files
+# matched a query; this downloads each matched file once by blob sha (the same
+# blob under several queries or repositories is fetched a single time and kept
+# in the BlobCache), parses the multi-document YAML in a pool of worker
+# processes and writes two tables to <out>:
+#
+#   files.parquet      repository_full_name, path, sha, query and whether the
+#                      blob was fetched and parsed
+#   resources.parquet  one row per Istio security resource in a blob: kind,
+#                      api_version, name, namespace, mtls_mode, action, rules
+#                      and the principals, request principals, namespaces,
+#                      ipBlocks and remoteIpBlocks its rules mention
+#
+# Join them on sha to get resources per repository. Only documents of the
+# security.istio.io, authentication.istio.io and rbac.istio.io groups are kept.
+
+ISTIO_GROUPS = ("security.istio.io", "authentication.istio.io", "rbac.istio.io")
+# bounded row groups let policy_risk.py spread a scan over worker processes
+ROW_GROUP_SIZE = 64 * 1024
+LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+LIST_COLUMNS = ("principals", "request_principals", "namespaces", "ip_blocks", "remote_ip_blocks",
+                "methods", "ports", "jwt_issuers")
+
+RESOURCE_SCHEMA = pa.schema(
+    [
+        ("sha", pa.string()),
+        ("document", pa.int32()),
+        ("kind", pa.string()),
+        ("api_version", pa.string()),
+        ("name", pa.string()),
+        ("namespace", pa.string()),
+        ("selector", pa.bool_()),
+        ("mtls_mode", pa.string()),
+        ("action", pa.string()),
+        ("provider", pa.string()),
+        ("rules", pa.int32()),
+        ("empty_rule", pa.bool_()),
+        ("rules_json", pa.string()),
+    ]
+    + [(name, pa.list_(pa.string())) for name in LIST_COLUMNS]
+)
+
+
+def shard_rows(out_base_dir):
+    """(repository_full_name, path, sha, git_url, query) of every stored search item."""
+    frames = []
+    for query_key, shards in find_shards(out_base_dir).items():
+        for shard in shards:
+            for part in parquet_files(shard):
+                df = pd.read_parquet(part, columns=["repository_full_name", "path", "sha", "git_url"])
+                df["query"] = query_key
+                frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=["repository_full_name", "path", "sha", "git_url", "query"])
+    return pd.concat(frames, ignore_index=True).drop_duplicates(ignore_index=True)
+
+
+def _strings(values):
+    if isinstance(values, (str, int, float)):
+        values = [values]
+    return [str(v) for v in values or [] if v is not None]
+
+
+def _rule_fields(rules):
+    """Lists of the source and operation values used across AuthorizationPolicy rules."""
+    fields = {name: [] for name in ("principals", "request_principals", "namespaces", "ip_blocks",
+                                    "remote_ip_blocks", "methods", "ports")}
+    for rule in rules:
+        if not isinstance(rule, dict):
+            continue
+        for source in rule.get("from") or []:
+            source = (source or {}).get("source") or {}
+            fields["principals"] += _strings(source.get("principals"))
+            fields["request_principals"] += _strings(source.get("requestPrincipals"))
+            fields["namespaces"] += _strings(source.get("namespaces"))
+            fields["ip_blocks"] += _strings(source.get("ipBlocks"))
+            fields["remote_ip_blocks"] += _strings(source.get("remoteIpBlocks"))
+        for operation in rule.get("to") or []:
+            operation = (operation or {}).get("operation") or {}
+            fields["methods"] += _strings(operation.get("methods"))
+            fields["ports"] += _strings(operation.get("ports"))
+    return fields
+
+
+def resource_row(doc):
+    """Column values for one parsed Istio security document."""
+    spec = doc.get("spec") if isinstance(doc.get("spec"), dict) else {}
+    metadata = doc.get("metadata") if isinstance(doc.get("metadata"), dict) else {}
+    kind = doc.get("kind")
+    row = {
+        "kind": str(kind) if kind is not None else None,
+        "api_version": str(doc.get("apiVersion")),
+        "name": str(metadata["name"]) if metadata.get("name") is not None else None,
+        "namespace": str(metadata["namespace"]) if metadata.get("namespace") is not None else None,
+        "selector": bool(spec.get("selector")),
+        "mtls_mode": None,
+        "action": None,
+        "provider": None,
+        "rules": 0,
+        "empty_rule": False,
+        "rules_json": None,
+        **{name: [] for name in LIST_COLUMNS},
+    }
+    if kind == "PeerAuthentication":
+        row["mtls_mode"] = str((spec.get("mtls") or {}).get("mode") or "UNSET")
+    elif kind in ("Policy", "MeshPolicy"):
+        # authentication.istio.io/v1alpha1: mtls: {} under peers means STRICT
+        for peer in spec.get("peers") or []:
+            if isinstance(peer, dict) and "mtls" in peer:
+                row["mtls_mode"] = str((peer.get("mtls") or {}).get("mode") or "STRICT")
+        for origin in spec.get("origins") or []:
+            issuer = ((origin or {}).get("jwt") or {}).get("issuer")
+            if issuer is not None:
+                row["jwt_issuers"].append(str(issuer))
+    elif kind == "RequestAuthentication":
+        row["jwt_issuers"] = _strings(rule.get("issuer") for rule in spec.get("jwtRules") or [] if isinstance(rule, dict))
+    elif kind == "AuthorizationPolicy":
+        rules = spec.get("rules") or []
+        if not isinstance(rules, list):
+            raise TypeError("rules is not a list")
+        # an AuthorizationPolicy without action is an ALLOW policy
+        row["action"] = str(spec.get("action") or "ALLOW")
+        provider = (spec.get("provider") or {}).get("name")
+        row["provider"] = None if provider is None else str(provider)
+        row["rules"] = len(rules)
+        row["empty_rule"] = any(not rule for rule in rules)
+        row["rules_json"] = json.dumps(rules, default=str) if rules else None
+        row.update(_rule_fields(rules))
+    elif kind == "ServiceRoleBinding":
+        row["principals"] = _strings((subject or {}).get("user") for subject in spec.get("subjects") or [])
+    return row
+
+
+def parse_blob(job):
+    """
+    Worker: parse the cached blob at path; returns (sha, resource rows, error).
+
+    A document that fails to parse (e.g. a Helm template) ends the file; the
+    documents before it are kept.
+    """
+    sha, path = job
+    try:
+        with open(path, "rb") as f:
+            content = f.read()
+    except OSError as e:
+        return sha, [], str(e)
+    rows = []
+    error = None
+    try:
+        for index, doc in enumerate(yaml.load_all(content, Loader=LOADER)):
+            if not isinstance(doc, dict):
+                continue
+            group = str(doc.get("apiVersion") or "").split("/")[0]
+            if group not in ISTIO_GROUPS:
+                continue
+            try:
+                rows.append({"sha": sha, "document": index, **resource_row(doc)})
+            except (AttributeError, TypeError) as e:
+                # a field of an unexpected shape, e.g. a string where rules are expected
+                error = f"document {index}: {e}"
+    except yaml.YAMLError as e:
+        error = str(e).splitlines()[0]
+    return sha, rows, error
+
+
+class PolicyExtractor:
+    def __init__(self, blobs, pool=None, session=None):
+        self.blobs = blobs
+        self.pool = pool
+        self.session = session or requests.Session()
+
+    def fetch(self, blob_urls, workers=8):
+        """Download the blobs not in the cache; returns the set of shas available locally."""
+        available = {sha for sha in blob_urls if os.path.exists(self.blobs.path(sha))}
+        missing = sorted(sha for sha in blob_urls if sha not in available)
+        print(f"Blobs: {len(blob_urls)} distinct, {len(available)} cached, {len(missing)} to fetch")
+        if missing and self.pool is not None:
+            def fetch(sha):
+                return self.blobs.fetch(sha, api_url(blob_urls[sha]), self.pool, session=self.session)
+
+            for sha, content in fetch_concurrently(missing, fetch, workers):
+                if content is not None:
+                    available.add(sha)
+        return available
+
+    def parse(self, shas, processes=None):
+        """Parse the cached blobs in worker processes; returns (resource rows, {sha: error})."""
+        jobs = [(sha, self.blobs.path(sha)) for sha in sorted(shas)]
+        rows = []
+        errors = {}
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            for sha, blob_rows, error in executor.map(parse_blob, jobs, chunksize=64):
+                rows.extend(blob_rows)
+                if error is not None:
+                    errors[sha] = error
+        return rows, errors
+
+    def run(self, out_base_dir, out_dir, workers=8, processes=None):
+        files = shard_rows(out_base_dir)
+        files = files.dropna(subset=["sha"])
+        blob_urls = dict(zip(files["sha"], files["git_url"]))
+        available = self.fetch(blob_urls, workers)
+        rows, errors = self.parse(available, processes)
+
+        files = files.drop(columns=["git_url"])
+        files["fetched"] = files["sha"].isin(available)
+        files["parse_error"] = files["sha"].map(errors)
+        resources = pa.Table.from_pylist(rows, schema=RESOURCE_SCHEMA)
+
+        os.makedirs(out_dir, exist_ok=True)
+        for name, table in (("files", pa.Table.from_pandas(files, preserve_index=False)), ("resources", resources)):
+            path = os.path.join(out_dir, f"{name}.parquet")
+            tmp_path = path + ".tmp"
+            pq.write_table(table, tmp_path, compression="zstd", row_group_size=ROW_GROUP_SIZE)
+            os.replace(tmp_path, path)
+        print(f"Parsed {len(available)} blobs: {resources.num_rows} resources, {len(errors)} with YAML errors")
+        return files, resources
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fetch and parse the files matched by the sweep.")
+    parser.add_argument("root", nargs="?", default="data", help="sweep output with <query>_<char>.parquet shards")
+    parser.add_argument("--out", default="data/policies")
+    parser.add_argument("--blobs", default="istio_security_data/.blobs", help="blob cache folder, shared with test4.py")
+    parser.add_argument("--workers", type=int, default=8, help="download threads")
+    parser.add_argument("--processes", type=int, default=None, help="parser processes (default: all cores)")
+    parser.add_argument("--offline", action="store_true", help="parse only blobs already in the cache")
+    args = parser.parse_args()
+
+    tokens = load_tokens()
+    if not tokens and not args.offline:
+        print("No GitHub token set; parsing cached blobs only.")
+    pool = TokenPool(tokens) if tokens and not args.offline else None
+    extractor = PolicyExtractor(BlobCache(args.blobs), pool)
+    extractor.run(args.root, args.out, workers=args.workers, processes=args.processes)
+    extractor.blobs.print_summary()
+    if pool is not None:
+        pool.print_summary()
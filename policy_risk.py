@@ -0,0 +1,156 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# Misconfiguration rules over the parsed resources of policy_extraction.py.
+# Rules are evaluated on whole columns, never one document at a time:
+#
+#   1. document features: boolean arrays computed with pyarrow.compute and
+#      NumPy over a batch of resources.parquet rows (e.g. "ALLOW policy with an
+#      empty rule"). Row groups are spread over worker processes, so a corpus
+#      of millions of documents uses every core.
+#   2. repository rules: features are joined to repositories through
+#      files.parquet, reduced with one groupby (any document in the repository)
+#      and combined column-wise (e.g. permissive mTLS and an allow-all policy
+#      in the same repository).
+#
+# New rules are one entry in DOCUMENT_FEATURES or REPOSITORY_RULES.
+
+# CIDRs that match every address; a bare 0.0.0.0 is the single host 0.0.0.0/32
+OPEN_CIDRS = ["0.0.0.0/0", "::/0"]
+FEATURE_COLUMNS = ["sha", "kind", "mtls_mode", "action", "rules", "empty_rule", "selector",
+                   "principals", "request_principals", "ip_blocks", "remote_ip_blocks"]
+
+
+def _is(table, column, value):
+    return pc.fill_null(pc.equal(table.column(column), value), False).to_numpy(zero_copy_only=False)
+
+
+def _list_contains(table, column, values):
+    """Rows whose list column holds any of values."""
+    lists = table.column(column).combine_chunks()
+    hit = np.zeros(len(lists), dtype=bool)
+    flat = pc.list_flatten(lists)
+    if len(flat):
+        matches = pc.fill_null(pc.is_in(flat, value_set=pa.array(values)), False).to_numpy(zero_copy_only=False)
+        hit[pc.list_parent_indices(lists).to_numpy()[matches]] = True
+    return hit
+
+
+def _list_nonempty(table, column):
+    return pc.fill_null(pc.greater(pc.list_value_length(table.column(column)), 0), False).to_numpy(zero_copy_only=False)
+
+
+def _flag(table, column):
+    return pc.fill_null(table.column(column), False).to_numpy(zero_copy_only=False)
+
+
+def _allow(table):
+    return _is(table, "kind", "AuthorizationPolicy") & _is(table, "action", "ALLOW")
+
+
+DOCUMENT_FEATURES = {
+    "permissive_mtls": lambda t: _is(t, "mtls_mode", "PERMISSIVE"),
+    "disabled_mtls": lambda t: _is(t, "mtls_mode", "DISABLE"),
+    # an ALLOW rule without from/to/when matches every request
+    "allow_all": lambda t: _allow(t) & _flag(t, "empty_rule"),
+    "mesh_wide_allow_all": lambda t: _allow(t) & _flag(t, "empty_rule") & ~_flag(t, "selector"),
+    "open_ip_block": lambda t: _allow(t) & (_list_contains(t, "ip_blocks", OPEN_CIDRS)
+                                            | _list_contains(t, "remote_ip_blocks", OPEN_CIDRS)),
+    "wildcard_principal": lambda t: _allow(t) & _list_contains(t, "principals", ["*"]),
+    "jwt_rule": lambda t: _is(t, "kind", "AuthorizationPolicy") & _list_nonempty(t, "request_principals"),
+    "request_authentication": lambda t: _is(t, "kind", "RequestAuthentication"),
+    "authorization_policy": lambda t: _is(t, "kind", "AuthorizationPolicy"),
+}
+
+REPOSITORY_RULES = {
+    "permissive_mtls_with_allow_all": lambda r: r["permissive_mtls"] & r["allow_all"],
+    "mtls_disabled": lambda r: r["disabled_mtls"],
+    "mesh_wide_allow_all": lambda r: r["mesh_wide_allow_all"],
+    "open_ip_blocks": lambda r: r["open_ip_block"],
+    "wildcard_principals": lambda r: r["wildcard_principal"],
+    "jwt_without_request_authentication": lambda r: r["jwt_rule"] & ~r["request_authentication"],
+    "permissive_mtls_without_authorization": lambda r: r["permissive_mtls"] & ~r["authorization_policy"],
+}
+
+
+def document_flags(table):
+    """sha plus one boolean column per DOCUMENT_FEATURES entry for a table of resources."""
+    flags = {"sha": table.column("sha").to_numpy(zero_copy_only=False)}
+    for name, feature in DOCUMENT_FEATURES.items():
+        flags[name] = np.asarray(feature(table), dtype=bool)
+    return pd.DataFrame(flags)
+
+
+def _scan_row_groups(job):
+    path, row_groups = job
+    table = pq.ParquetFile(path).read_row_groups(row_groups, columns=FEATURE_COLUMNS)
+    # one row per blob is enough: repositories only need whether a feature occurs
+    return document_flags(table).groupby("sha", sort=False).max()
+
+
+def scan_documents(resources_path, processes=None):
+    """Per-blob feature flags, evaluated on row groups in parallel worker processes."""
+    row_groups = pq.ParquetFile(resources_path).num_row_groups
+    processes = processes or os.cpu_count() or 1
+    chunks = [list(chunk) for chunk in np.array_split(np.arange(row_groups), min(processes, row_groups)) if len(chunk)]
+    if len(chunks) <= 1:
+        frames = [_scan_row_groups((resources_path, chunks[0] if chunks else []))]
+    else:
+        with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+            frames = list(executor.map(_scan_row_groups, [(resources_path, chunk) for chunk in chunks]))
+    flags = pd.concat(frames)
+    return flags.groupby(level=0).max() if len(frames) > 1 else flags
+
+
+def repository_features(files, blob_flags):
+    """
+    Any-document reduction of the blob flags to one row per repository.
+
+    Repositories and blobs are turned into integer codes, so the reduction is
+    one bincount per feature instead of a join and groupby on name strings.
+    Repositories whose files held no Istio resource get all-False features.
+    """
+    repo_codes, repos = pd.factorize(files["repository_full_name"])
+    rows = blob_flags.index.get_indexer(files["sha"])
+    known = rows >= 0
+    flags = blob_flags.to_numpy(dtype=bool)[rows[known]]
+    codes = repo_codes[known]
+    features = {name: np.bincount(codes, weights=flags[:, i], minlength=len(repos)) > 0
+                for i, name in enumerate(blob_flags.columns)}
+    return pd.DataFrame(features, index=pd.Index(repos, name="repository_full_name"))
+
+
+def evaluate(policies_dir="data/policies", processes=None):
+    """Repository risk table: one boolean column per REPOSITORY_RULES entry plus risk_score."""
+    files = pd.read_parquet(os.path.join(policies_dir, "files.parquet"), columns=["repository_full_name", "sha"])
+    blob_flags = scan_documents(os.path.join(policies_dir, "resources.parquet"), processes)
+    features = repository_features(files, blob_flags)
+    risks = pd.DataFrame({name: rule(features) for name, rule in REPOSITORY_RULES.items()}, index=features.index)
+    risks["risk_score"] = risks.sum(axis=1).astype("int16")
+    return risks.reset_index()
+
+
+def print_summary(risks):
+    print(f"{len(risks)} repositories, {int((risks['risk_score'] > 0).sum())} with at least one finding")
+    for name in REPOSITORY_RULES:
+        print(f"  {name}: {int(risks[name].sum())}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Evaluate misconfiguration rules over the parsed Istio policies.")
+    parser.add_argument("policies", nargs="?", default="data/policies", help="output folder of policy_extraction.py")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    risks = evaluate(args.policies, args.processes)
+    out_path = os.path.join(args.policies, "risks.parquet")
+    risks.to_parquet(out_path, index=False)
+    print_summary(risks)
+    print(f"Wrote {out_path}")
@@ -0,0 +1,105 @@
+import os
+import re
+from parquet_sink import read_parquet_parts
+from search_queries import limited_characters, shard_path
+
+# Cross-query reuse for the sweep. Many base_queries are the same quoted terms
+# as another query plus a refinement (http_traffic_v1 is any_authz_v1 plus
+# "methods:", mtls_strict_v1 is peer_auth_v1 plus "mode: STRICT"). Only the
+# superset goes to the search API; the subsets are derived by checking the
+# refinement terms against the cached file contents of the superset results.
+
+TERM_PATTERN = re.compile(r'"([^"]*)"')
+IDENTIFIER = "A-Za-z0-9_"
+
+
+def query_terms(query):
+    """The quoted terms of a search query, in order."""
+    return TERM_PATTERN.findall(query)
+
+
+def find_refinements(queries):
+    """
+    Map each subset query key to (root key, extra terms).
+
+    The root is the query with the fewest terms whose terms are a strict subset
+    of the key's terms, so a subset is always derived from a dataset that was
+    crawled from the API with every matching file kept.
+    """
+    terms = {key: set(query_terms(query)) for key, query in queries.items()}
+    refinements = {}
+    for key, key_terms in terms.items():
+        root = None
+        for other, other_terms in terms.items():
+            if other != key and other_terms and other_terms < key_terms:
+                if root is None or len(other_terms) < len(terms[root]):
+                    root = other
+        if root is not None:
+            extra = [term for term in query_terms(queries[key]) if term not in terms[root]]
+            refinements[key] = (root, extra)
+    return refinements
+
+
+def plan_queries(queries):
+    """
+    Return [(root key, {subset key: extra terms})] in base_queries order.
+
+    Roots are crawled through the API; their subsets are derived afterwards.
+    """
+    refinements = find_refinements(queries)
+    plan = []
+    for key in queries:
+        if key in refinements:
+            continue
+        subsets = {sub: extra for sub, (root, extra) in refinements.items() if root == key}
+        plan.append((key, subsets))
+    return plan
+
+
+def term_regex(term):
+    """
+    Case-insensitive pattern for a quoted term as a whole token sequence, the
+    way code search matches it: "ipBlocks:" finds ipBlocks: but not
+    notIpBlocks: or remoteIpBlocks:.
+    """
+    pattern = re.escape(term)
+    if term[:1].isalnum() or term[:1] == "_":
+        pattern = f"(?<![{IDENTIFIER}])" + pattern
+    if term[-1:].isalnum() or term[-1:] == "_":
+        pattern += f"(?![{IDENTIFIER}])"
+    return re.compile(pattern, re.IGNORECASE)
+
+
+def matches_terms(content, terms):
+    """Check that every term occurs in the file content as a whole token sequence."""
+    text = content.decode("utf-8", errors="replace")
+    return all(term_regex(term).search(text) for term in terms)
+
+
+def superset_rows(out_base_dir, root_key):
+    """Yield (char1, row) for every stored search item of the root query."""
+    for char1 in limited_characters:
+        path = shard_path(out_base_dir, root_key, char1)
+        if not os.path.exists(path):
+            continue
+        df = read_parquet_parts(path)
+        for row in df.to_dict("records"):
+            yield char1, row
+
+
+def derive_subsets(out_base_dir, root_key, subsets, fetch_content):
+    """
+    Evaluate every subset's extra terms over the root query's files.
+
+    fetch_content(row) returns the file bytes or None. Yields
+    (subset key, char1, row, matched): matched is True for a local match and
+    None when the content could not be fetched, so the caller can fall back to
+    the API for that file. Files that do not match are not yielded.
+    """
+    for char1, row in superset_rows(out_base_dir, root_key):
+        content = fetch_content(row)
+        for subset_key, extra in subsets.items():
+            if content is None:
+                yield subset_key, char1, row, None
+            elif matches_terms(content, extra):
+                yield subset_key, char1, row, True
@@ -0,0 +1,168 @@
+import glob
+import json
+import os
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from search_queries import query_feature
+
+# Consolidated form of data/repositoryinfo/*_repos.parquet for the notebooks.
+#
+#   <out>/repositories/  one row per repository (the GitHub document plus a
+#                        repo_id), hive-partitioned by stars_band and sorted
+#                        by stargazers_count inside each band
+#   <out>/membership/    narrow (repo_id, category, version, mode) rows, one
+#                        per repository and dataset, partitioned by category
+#   <out>/sources.json   content hash of every *_repos.parquet it was built from
+#
+# Both are read through pyarrow.dataset, so a notebook asking for
+# columns=["full_name", "stargazers_count"] with stargazers_count >= 10 only
+# touches those two columns of the row groups whose statistics can match.
+# repo_id is the position of full_name in the sorted name list, the same id the
+# bitmap index in repo_index.py uses. analysis_artifacts.py reads the notebook
+# frames from here and rebuilds the dataset when sources.json no longer matches
+# the repositoryinfo files.
+
+STAR_BANDS = (0, 1, 10, 100, 1000)
+ROW_GROUP_SIZE = 256
+SOURCES_FILE = "sources.json"
+
+
+def stars_band(stars):
+    """Lower bound of the STAR_BANDS band a star count falls into."""
+    band = STAR_BANDS[0]
+    for bound in STAR_BANDS:
+        if stars >= bound:
+            band = bound
+    return band
+
+
+def _write_partitioned(table, path, partition_col):
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    pq.write_to_dataset(
+        table,
+        tmp_path,
+        partition_cols=[partition_col],
+        basename_template="part.{i}.parquet",
+        row_group_size=ROW_GROUP_SIZE,
+        compression="zstd",
+        use_dictionary=True,
+    )
+    old_path = path + ".old"
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def dataset_sources(out_dir="data/consolidated"):
+    """{file name: content hash} of the *_repos.parquet files the dataset was built from."""
+    path = os.path.join(out_dir, SOURCES_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def build_repo_dataset(repo_dir="data/repositoryinfo", out_dir="data/consolidated", sources=None):
+    """
+    Deduplicate every *_repos.parquet into the repositories and membership datasets.
+
+    sources ({file name: content hash}) is written to sources.json, so readers
+    can tell whether the dataset is current.
+    """
+    frames = []
+    memberships = []
+    for path in sorted(glob.glob(os.path.join(repo_dir, "*_repos.parquet"))):
+        key = os.path.basename(path)[:-len("_repos.parquet")]
+        df = pd.read_parquet(path)
+        if df.empty or "full_name" not in df:
+            continue
+        category, mode, version = query_feature(key)
+        frames.append(df)
+        memberships.append(pd.DataFrame({
+            "full_name": df["full_name"].unique(),
+            "category": category,
+            "version": version,
+            "mode": mode,
+        }))
+    if not frames:
+        print(f"No *_repos.parquet files in {repo_dir}")
+        return 0, 0
+
+    repos = pd.concat(frames, ignore_index=True)
+    # the same repository fetched for several queries: keep the newest document
+    if "updated_at" in repos:
+        repos = repos.sort_values("updated_at", na_position="first")
+    repos = repos.drop_duplicates(subset="full_name", keep="last")
+    repos = repos.sort_values("full_name", ignore_index=True)
+    repos.insert(0, "repo_id", range(len(repos)))
+    repos["stars_band"] = repos["stargazers_count"].fillna(0).map(stars_band)
+    ids = dict(zip(repos["full_name"], repos["repo_id"]))
+
+    membership = pd.concat(memberships, ignore_index=True)
+    membership.insert(0, "repo_id", membership.pop("full_name").map(ids))
+    membership = membership.drop_duplicates(ignore_index=True)
+
+    # sorted so that each row group covers a narrow range of the filter columns
+    repos = repos.sort_values(["stars_band", "stargazers_count", "repo_id"], ignore_index=True)
+    membership = membership.sort_values(["category", "version", "mode", "repo_id"], ignore_index=True)
+
+    repos_table = pa.Table.from_pandas(repos, preserve_index=False)
+    membership_table = pa.Table.from_pandas(membership, preserve_index=False)
+    for name in ("category", "version", "mode"):
+        column = membership_table.column(name).dictionary_encode()
+        membership_table = membership_table.set_column(membership_table.schema.get_field_index(name), name, column)
+
+    os.makedirs(out_dir, exist_ok=True)
+    _write_partitioned(repos_table, os.path.join(out_dir, "repositories"), "stars_band")
+    _write_partitioned(membership_table, os.path.join(out_dir, "membership"), "category")
+    if sources is not None:
+        tmp_path = os.path.join(out_dir, SOURCES_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(sources, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, os.path.join(out_dir, SOURCES_FILE))
+    return len(repos), len(membership)
+
+
+def _load(path, columns=None, filter=None):
+    dataset = ds.dataset(path, format="parquet", partitioning="hive")
+    return dataset.to_table(columns=columns, filter=filter).to_pandas()
+
+
+def load_repositories(out_dir="data/consolidated", columns=None, filter=None, min_stars=None):
+    """
+    Read the repository table with column projection and predicate pushdown.
+
+    filter is a pyarrow.dataset expression, e.g. ds.field("fork") == False.
+    min_stars also prunes whole stars_band partitions before any file is opened.
+    """
+    if min_stars is not None:
+        stars = (ds.field("stargazers_count") >= min_stars) & (ds.field("stars_band") >= stars_band(min_stars))
+        filter = stars if filter is None else filter & stars
+    return _load(os.path.join(out_dir, "repositories"), columns, filter)
+
+
+def load_membership(out_dir="data/consolidated", category=None, version=None, mode=None, columns=None):
+    """Read (repo_id, category, version, mode) rows, filtered on any of the three keys."""
+    filter = None
+    for name, value in (("category", category), ("version", version), ("mode", mode)):
+        if value is not None:
+            condition = ds.field(name) == value
+            filter = condition if filter is None else filter & condition
+    return _load(os.path.join(out_dir, "membership"), columns, filter)
+
+
+if __name__ == "__main__":
+    import sys
+
+    repo_dir = sys.argv[1] if len(sys.argv) > 1 else "data/repositoryinfo"
+    out_dir = sys.argv[2] if len(sys.argv) > 2 else "data/consolidated"
+    from analysis_artifacts import ArtifactStore
+
+    sources = ArtifactStore(repo_dir, dataset_dir=out_dir).source_hashes()
+    repo_count, membership_count = build_repo_dataset(repo_dir, out_dir, sources)
+    print(f"Wrote {repo_count} repositories and {membership_count} memberships to {out_dir}")
@@ -0,0 +1,16 @@
+from concurrent.futures import ThreadPoolExecutor
+
+# Bounded concurrent fetching shared by the crawlers: repo_store.py refreshes
+# repository documents, commit_harvester.py pages through commits and
+# policy_extraction.py downloads blobs with it.
+
+
+def fetch_concurrently(names, fetch, workers=8):
+    """Yield (name, fetch(name)) using a thread pool with at most workers * 2 names in flight."""
+    window = workers * 2
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(names), window):
+            batch = names[start:start + window]
+            yield from zip(batch, executor.map(fetch, batch))
+            if (start // window) % 50 == 49:
+                print(f"  {min(start + window, len(names))}/{len(names)} fetched")
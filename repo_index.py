@@ -0,0 +1,186 @@
+import glob
+import json
+import os
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from search_queries import query_feature
+
+# Repository x dataset bitmap index over data/repositoryinfo/*_repos.parquet.
+# Every repository full_name gets an integer id (its position in the sorted
+# name list) and every dataset (query key such as mtls_strict_v1) one packed
+# bitmap over those ids. Set algebra, counts and co-occurrence matrices are
+# then bitwise operations on a few KB of memory instead of re-reading the
+# Parquet files and hashing names in every notebook:
+#
+#   index = load_repo_index("../data/repositoryinfo")
+#   v1 = index.select(category="mtls", version="v1")
+#   beta = index.select(category="mtls", version="v1beta1")
+#   len(v1 - beta), (v1 & beta).names()
+#
+# The index is cached as data/.artifacts/repo_index.npz, next to the other
+# derived analysis files, together with the names and content hashes of the
+# repository files it was built from (ArtifactStore.file_hash, as the analysis
+# artifacts are keyed); it is rebuilt when a file is added, removed or changed.
+
+INDEX_FILE = "repo_index.npz"
+
+
+class RepoSet:
+    """A set of repositories as a packed bitmap over the ids of a RepoIndex."""
+
+    def __init__(self, index, bits):
+        self.index = index
+        self.bits = bits
+
+    def __and__(self, other):
+        return RepoSet(self.index, self.bits & other.bits)
+
+    def __or__(self, other):
+        return RepoSet(self.index, self.bits | other.bits)
+
+    def __xor__(self, other):
+        return RepoSet(self.index, self.bits ^ other.bits)
+
+    def __sub__(self, other):
+        return RepoSet(self.index, self.bits & ~other.bits)
+
+    def __invert__(self):
+        return self.index.all() - self
+
+    def __len__(self):
+        return int(np.unpackbits(self.bits).sum())
+
+    def __contains__(self, full_name):
+        repo_id = self.index.ids.get(full_name)
+        return repo_id is not None and bool(self.bits[repo_id >> 3] & (0x80 >> (repo_id & 7)))
+
+    def ids(self):
+        return np.flatnonzero(np.unpackbits(self.bits, count=len(self.index.names)))
+
+    def names(self):
+        return self.index.names[self.ids()].tolist()
+
+
+class RepoIndex:
+    def __init__(self, names, keys, bits, sources=""):
+        self.names = np.asarray(names, dtype=str)
+        self.keys = list(keys)
+        self.bits = bits
+        # JSON {file name: content hash} of the repository files the index was built from
+        self.sources = sources
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self.rows = {key: i for i, key in enumerate(self.keys)}
+
+    @classmethod
+    def build(cls, repo_dir):
+        """Read the full_name column of every *_repos.parquet in repo_dir."""
+        datasets = {}
+        for path in sorted(glob.glob(os.path.join(repo_dir, "*_repos.parquet"))):
+            key = os.path.basename(path)[:-len("_repos.parquet")]
+            column = pq.read_table(path, columns=["full_name"]).column("full_name")
+            datasets[key] = column.drop_null().unique().to_pylist()
+        names = sorted(set().union(*datasets.values())) if datasets else []
+        ids = {name: i for i, name in enumerate(names)}
+        matrix = np.zeros((len(datasets), len(names)), dtype=bool)
+        for row, members in enumerate(datasets.values()):
+            matrix[row, [ids[name] for name in members]] = True
+        return cls(names, datasets.keys(), np.packbits(matrix, axis=1))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            sources = data["sources"].item() if "sources" in data.files else ""
+            return cls(data["names"], data["keys"].tolist(), data["bits"], sources)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(tmp_path, names=self.names, keys=np.asarray(self.keys, dtype=str), bits=self.bits,
+                            sources=np.asarray(self.sources))
+        os.replace(tmp_path, path)
+
+    def empty(self):
+        return RepoSet(self, np.zeros(self.bits.shape[1], dtype=np.uint8))
+
+    def all(self):
+        result = self.empty()
+        for row in self.bits:
+            result.bits |= row
+        return result
+
+    def get(self, key):
+        """The repositories of one dataset, e.g. index.get("peer_auth_v1")."""
+        return RepoSet(self, self.bits[self.rows[key]])
+
+    def select(self, category=None, mode=None, version=None):
+        """Union of every dataset matching the given category, mode and version."""
+        result = self.empty()
+        for key in self.keys:
+            key_category, key_mode, key_version = query_feature(key)
+            if category is not None and key_category != category:
+                continue
+            if mode is not None and key_mode != mode:
+                continue
+            if version is not None and key_version != version:
+                continue
+            result.bits |= self.bits[self.rows[key]]
+        return result
+
+    def cooccurrence(self, sets):
+        """Matrix of pairwise intersection sizes for a {label: RepoSet} dict."""
+        labels = list(sets)
+        counts = [[len(sets[a] & sets[b]) for b in labels] for a in labels]
+        return pd.DataFrame(counts, index=labels, columns=labels)
+
+    def feature_frame(self, sets):
+        """full_name plus a 0/1 column per {label: RepoSet}, for repositories in any of them."""
+        union = self.empty()
+        for repo_set in sets.values():
+            union = union | repo_set
+        ids = union.ids()
+        df = pd.DataFrame({"full_name": self.names[ids]})
+        for label, repo_set in sets.items():
+            df[label] = np.unpackbits(repo_set.bits, count=len(self.names))[ids].astype(int)
+        return df
+
+
+def venn_regions(*sets):
+    """
+    Exclusive region sizes of two or three RepoSets keyed like matplotlib_venn
+    subsets: '100' is only in the first set, '110' in the first two only, ...
+    """
+    regions = {}
+    for mask in range(1, 2 ** len(sets)):
+        flags = format(mask, f"0{len(sets)}b")
+        region = sets[0].index.all()
+        for flag, repo_set in zip(flags, sets):
+            region = region & repo_set if flag == "1" else region - repo_set
+        regions[flags] = len(region)
+    return regions
+
+
+def load_repo_index(repo_dir="data/repositoryinfo", path=None):
+    """Load the index from data/.artifacts, rebuilding it if the repository files differ from its sources."""
+    from analysis_artifacts import ArtifactStore
+
+    path = path or os.path.join(os.path.dirname(os.path.normpath(repo_dir)), ".artifacts", INDEX_FILE)
+    sources = json.dumps(ArtifactStore(repo_dir, cache_dir=os.path.dirname(path)).source_hashes(), sort_keys=True)
+    if os.path.exists(path):
+        index = RepoIndex.load(path)
+        if index.sources == sources:
+            return index
+    index = RepoIndex.build(repo_dir)
+    index.sources = sources
+    index.save(path)
+    return index
+
+
+if __name__ == "__main__":
+    import sys
+
+    repo_dir = sys.argv[1] if len(sys.argv) > 1 else "data/repositoryinfo"
+    index = load_repo_index(repo_dir)
+    print(f"{len(index.names)} repositories in {len(index.keys)} datasets")
+    for key in index.keys:
+        print(f"  {key}: {len(index.get(key))}")
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import pyarrow.parquet as pq
+import requests
+from http_cache import CachedSession
+from item_schema import REPOSITORIES
+from repo_enrichment import fetch_concurrently
+from search_queries import GITHUB_API
+from token_pool import CORE
+
+# Global repository metadata store shared by every *_repos.parquet output.
+# Documents are stored once by content hash and repos map full_name to the
+# current document plus its ETag, so each repository is fetched at most once
+# per TTL window no matter how many query folders it appears in. Refreshes
+# are conditional (If-None-Match); a 304 only bumps fetched_at. Through a
+# CachedSession the session revalidates with its own ETag and answers a 304
+# with the cached 200, which counts as not modified as well.
+
+DEFAULT_TTL = 7 * 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    hash TEXT PRIMARY KEY,
+    doc TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS repos (
+    full_name TEXT PRIMARY KEY,
+    hash TEXT,
+    etag TEXT,
+    status INTEGER NOT NULL,
+    fetched_at REAL NOT NULL
+);
+"""
+
+
+def _isoformat(value):
+    return value.isoformat()
+
+
+class RepoStore:
+    def __init__(self, path="repo_store.sqlite", ttl=DEFAULT_TTL, session=requests):
+        self.path = path
+        self.ttl = ttl
+        self.session = session
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.fetched = 0
+        self.not_modified = 0
+        self.cached = 0
+        self.failed = 0
+
+    def entry(self, full_name):
+        """(hash, etag, status, fetched_at) for a repository, or None."""
+        with self.lock:
+            return self.db.execute(
+                "SELECT hash, etag, status, fetched_at FROM repos WHERE full_name = ?", (full_name,)
+            ).fetchone()
+
+    def get(self, full_name):
+        """The stored GitHub document for full_name, or None."""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT docs.doc FROM repos JOIN docs ON repos.hash = docs.hash WHERE repos.full_name = ?",
+                (full_name,),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def is_fresh(self, entry, now=None):
+        now = time.time() if now is None else now
+        return entry is not None and now - entry[3] < self.ttl
+
+    def _save(self, full_name, doc, etag, status):
+        now = time.time()
+        with self.lock:
+            if doc is not None:
+                text = json.dumps(doc, sort_keys=True, separators=(",", ":"))
+                digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+                self.db.execute("INSERT OR IGNORE INTO docs (hash, doc) VALUES (?, ?)", (digest, text))
+            else:
+                digest = None
+            self.db.execute(
+                "INSERT OR REPLACE INTO repos (full_name, hash, etag, status, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                (full_name, digest, etag, status, now),
+            )
+            self.db.commit()
+
+    def _touch(self, full_name, fetched_at=None):
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        with self.lock:
+            self.db.execute("UPDATE repos SET fetched_at = ? WHERE full_name = ?", (fetched_at, full_name))
+            self.db.commit()
+
+    def refresh(self, full_name, pool):
+        """Make sure full_name is stored and younger than the TTL; return its status code."""
+        entry = self.entry(full_name)
+        if self.is_fresh(entry):
+            self.cached += 1
+            return entry[2]
+
+        headers = {}
+        if entry is not None and entry[1] and not isinstance(self.session, CachedSession):
+            headers["If-None-Match"] = entry[1]
+        resp = pool.get(f"{GITHUB_API}/repos/{full_name}", bucket=CORE, headers=headers, session=self.session)
+
+        cached = getattr(resp, "from_cache", False) and resp.status_code == 200
+        if resp.status_code == 304 or (cached and entry is not None and entry[0] is not None):
+            self.not_modified += 1
+            self._touch(full_name)
+            return entry[2]
+        if resp.status_code == 200:
+            self.fetched += 1
+            self._save(full_name, resp.json(), resp.headers.get("ETag"), 200)
+        elif resp.status_code in (404, 451):
+            # remembered as well, so deleted repositories are not asked for again until the TTL passes
+            print(f"Repository {full_name} not found.")
+            self._save(full_name, None, None, resp.status_code)
+        else:
+            self.failed += 1
+            print(f"Failed to fetch {full_name}: {resp.status_code}")
+        return resp.status_code
+
+    def refresh_many(self, names, pool, workers=8):
+        """Refresh every stale repository of names concurrently."""
+        stale = [name for name in names if not self.is_fresh(self.entry(name))]
+        self.cached += len(names) - len(stale)
+        print(f"Repositories to fetch or revalidate: {len(stale)} of {len(names)}")
+        for _ in fetch_concurrently(stale, lambda name: self.refresh(name, pool), workers):
+            pass
+
+    def seed_from_parquet(self, path):
+        """Import documents from an existing *_repos.parquet, dated by the file's mtime."""
+        fetched_at = os.path.getmtime(path)
+        docs, repos = [], []
+        with self.lock:
+            known = {row[0] for row in self.db.execute("SELECT full_name FROM repos")}
+        for doc in pq.read_table(path).to_pylist():
+            name = doc.get("full_name")
+            if not name or name in known:
+                continue
+            # files in the fixed schema hold timestamps, stored back as ISO strings
+            text = json.dumps(doc, sort_keys=True, separators=(",", ":"), default=_isoformat)
+            digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            docs.append((digest, text))
+            repos.append((name, digest, None, 200, fetched_at))
+            known.add(name)
+        with self.lock:
+            self.db.executemany("INSERT OR IGNORE INTO docs (hash, doc) VALUES (?, ?)", docs)
+            self.db.executemany(
+                "INSERT OR REPLACE INTO repos (full_name, hash, etag, status, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                repos,
+            )
+            self.db.commit()
+        return len(repos)
+
+    def materialise(self, names, output_path):
+        """Write the stored documents of names as one *_repos.parquet file in the REPOSITORIES schema."""
+        docs = [doc for doc in (self.get(name) for name in sorted(names)) if doc is not None]
+        REPOSITORIES.write(docs, output_path)
+        return len(docs)
+
+    def print_summary(self):
+        print(f"  repo store: {self.fetched} fetched, {self.not_modified} not modified, "
+              f"{self.cached} within TTL, {self.failed} failed")
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,114 @@
+import os
+import string
+from urllib.parse import quote
+
+# Shared search configuration for the code-search sweep (test4.py, api_emulator.py).
+
+GITHUB_API = os.getenv("GITHUB_API", "https://api.github.com")
+
+base_queries = {
+    #mTLS-v1
+    "mtls_strict_v1": '"security.istio.io/v1" "kind: PeerAuthentication" "mode: STRICT"',
+    "mtls_permissive_v1": '"security.istio.io/v1" "kind: PeerAuthentication" "mode: PERMISSIVE"',
+    "mtls_disable_v1": '"security.istio.io/v1" "kind: PeerAuthentication" "mode: DISABLE"',
+    #mTLS-v1beta1
+    "mtls_strict_v1beta1": '"security.istio.io/v1beta1" "kind: PeerAuthentication" "mode: STRICT"',
+    "mtls_permissive_v1beta1": '"security.istio.io/v1beta1" "kind: PeerAuthentication" "mode: PERMISSIVE"',
+    "mtls_disable_v1beta1": '"security.istio.io/v1beta1" "kind: PeerAuthentication" "mode: DISABLE"',
+    #Authentication-v1
+    "peer_auth_v1": '"security.istio.io/v1" "kind: PeerAuthentication"',
+    "req_auth_v1": '"security.istio.io/v1" "kind: RequestAuthentication"',
+    #Authentication-v1beta1
+    "peer_auth_v1beta1": '"security.istio.io/v1beta1" "kind: PeerAuthentication"',
+    "req_auth_v1beta1": '"security.istio.io/v1beta1" "kind: RequestAuthentication"',
+    # Authorization-v1
+    "any_authz_v1": '"security.istio.io/v1" "kind: AuthorizationPolicy"',
+    "http_traffic_v1": '"security.istio.io/v1" "kind: AuthorizationPolicy" "methods:"',
+    "tcp_traffic_v1": '"security.istio.io/v1" "kind: AuthorizationPolicy" "ports:"',
+    "jwt_authz_v1": '"security.istio.io/v1" "kind: AuthorizationPolicy" "requestPrincipals:"',
+    "provider_authz_v1": '"security.istio.io/v1" "kind: AuthorizationPolicy" "provider:"',
+    "ingress_authz_ip_v1": '"security.istio.io/v1" "kind: AuthorizationPolicy" "ipBlocks:"',
+    "ingress_authz_remote_ip_v1": '"security.istio.io/v1" "kind: AuthorizationPolicy" "remoteIpBlocks:"',
+    # Authorization-v1beta1
+    "any_authz_v1beta1": '"security.istio.io/v1beta1" "kind: AuthorizationPolicy"',
+    "http_traffic_v1beta1": '"security.istio.io/v1beta1" "kind: AuthorizationPolicy" "methods:"',
+    "tcp_traffic_v1beta1": '"security.istio.io/v1beta1" "kind: AuthorizationPolicy" "ports:"',
+    "jwt_authz_v1beta1": '"security.istio.io/v1beta1" "kind: AuthorizationPolicy" "requestPrincipals:"',
+    "provider_authz_v1beta1": '"security.istio.io/v1beta1" "kind: AuthorizationPolicy" "provider:"',
+    "ingress_authz_ip_v1beta1": '"security.istio.io/v1beta1" "kind: AuthorizationPolicy" "ipBlocks:"',
+    "ingress_authz_remote_ip_v1beta1": '"security.istio.io/v1beta1" "kind: AuthorizationPolicy" "remoteIpBlocks:"',
+    
+    # mTLS-v1alpha1
+    "mtls_strict_v1alpha1": '"authentication.istio.io/v1alpha1" "kind: Policy" "STRICT"',
+    "mtls_permissive_v1alpha1": '"authentication.istio.io/v1alpha1" "kind: Policy" "PERMISSIVE"',
+    # authentication-v1alpha1
+    "peer_auth_v1alpha1": '"authentication.istio.io/v1alpha1" "kind: Policy" "peers"',
+    "req_auth_v1alpha1": '"authentication.istio.io/v1alpha1" "kind: Policy" "origins"',
+    # authorization-v1alpha1
+    "cluster_authz_v1alpha1": '"rbac.istio.io/v1alpha1"',
+    # all
+    "all_all_all": '"istio.io/v1"',
+}
+
+def create_search_url(query_test, filename_pattern, page=1):
+    """
+    Create a GitHub search URL for the given query and filename pattern.
+    """
+    query = quote(query_test)
+    url = (
+        f'{GITHUB_API}/search/code?q={query}+language:YAML+filename:{filename_pattern}&page={page}&per_page=100'
+    )
+    return url
+
+
+def query_category(query_key):
+    """Return (category, version) for a query key, e.g. mtls_strict_v1 -> (mtls, v1)."""
+    parts = query_key.split('_')
+    return parts[0], parts[-1]
+
+
+# longest first, so ingress_authz_remote_ip is not read as mode "ip"
+MODES = ("remote_ip", "permissive", "disable", "strict", "ip")
+
+
+def query_feature(query_key):
+    """Return (category, mode, version), e.g. mtls_strict_v1 -> (mtls, strict, v1), peer_auth_v1 -> (peer_auth, None, v1)."""
+    rest, version = query_key.rsplit('_', 1)
+    for mode in MODES:
+        if rest.endswith('_' + mode):
+            return rest[:-len(mode) - 1], mode, version
+    return rest, None, version
+
+
+def api_url(url):
+    """A URL recorded from api.github.com, pointed at GITHUB_API."""
+    if url and url.startswith("https://api.github.com"):
+        return GITHUB_API + url[len("https://api.github.com"):]
+    return url
+
+
+def find_shards(out_base_dir):
+    """{query_key: [shard paths]} of the <query>_<char1>.parquet shards anywhere under out_base_dir."""
+    shards = {}
+    for root, dirs, files in os.walk(out_base_dir):
+        # part.N directories of ParquetSink are shards themselves
+        names = files + [d for d in dirs if d.endswith(".parquet")]
+        dirs[:] = sorted(d for d in dirs if not d.endswith(".parquet"))
+        for name in sorted(names):
+            if not name.endswith(".parquet"):
+                continue
+            key, _, char1 = name[:-len(".parquet")].rpartition("_")
+            if key in base_queries and len(char1) == 1 and char1 in characters:
+                shards.setdefault(key, []).append(os.path.join(root, name))
+    return shards
+
+
+def shard_path(out_base_dir, query_key, char1):
+    """Output shard for a query and first filename character: <out>/<category>/<version>/<query>_<char1>.parquet"""
+    category, version = query_category(query_key)
+    return os.path.join(out_base_dir, category, version, f"{query_key}_{char1}.parquet")
+
+
+# seeting for characters
+characters = string.ascii_lowercase + string.digits + "-"
+limited_characters = string.ascii_lowercase + string.digits
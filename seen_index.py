@@ -0,0 +1,213 @@
+import hashlib
+import math
+import os
+import sqlite3
+import struct
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Persistent dedup index for the code-search sweep, shared by every query and
+# every run. A file is identified by (repository, path, blob sha):
+#
+#   files       each distinct file once, in the order it was first seen
+#   membership  (file, query) pairs: which queries returned the file
+#
+# test4.py asks add(item, query) for every search item and stores the item
+# only when the file is new for that query, so memory no longer grows with a
+# per-query seen set. A Bloom filter over the file keys sits in front of the
+# files table: a file it has never seen (the common case during a sweep) is
+# inserted without a lookup first. The filter only ever holds extra keys, so
+# a false positive costs one indexed lookup and nothing is missed. It is
+# written to <index>.bloom on close and caught up from the table on open.
+#
+# position()/rollback() mirror ParquetSink, so a checkpoint can return the
+# index to the exact state that matches the sink positions it recorded.
+# export() writes files.parquet with the list of queries of every file.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    key BLOB NOT NULL UNIQUE,
+    repository_full_name TEXT,
+    path TEXT,
+    sha TEXT
+);
+CREATE TABLE IF NOT EXISTS membership (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    file INTEGER NOT NULL,
+    query TEXT NOT NULL,
+    UNIQUE (file, query)
+);
+"""
+BLOOM_HEADER = struct.Struct("<QIQ")
+# SQLite page cache in KiB (negative cache_size), so memory stays flat however large the index grows
+CACHE_KIB = 16 * 1024
+
+
+def file_identity(item):
+    """(repository full name, path, sha) of a search item, nested or flattened."""
+    repository = item.get("repository")
+    name = repository.get("full_name") if isinstance(repository, dict) else item.get("repository_full_name")
+    return name, item.get("path"), item.get("sha")
+
+
+def file_key(name, path, sha):
+    return hashlib.blake2b(f"{name}\0{path}\0{sha}".encode(), digest_size=16).digest()
+
+
+class BloomFilter:
+    """Fixed-size bit array with k positions per key taken from the key's own hash bits."""
+
+    def __init__(self, capacity=2_000_000, error_rate=0.01):
+        self.bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.array = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, key):
+        # double hashing: keys are already uniform 128-bit digests
+        h1 = int.from_bytes(key[:8], "little")
+        h2 = int.from_bytes(key[8:16], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.array[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.array[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class SeenIndex:
+    def __init__(self, path, capacity=2_000_000, error_rate=0.01):
+        self.path = path
+        self.bloom_path = path + ".bloom"
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute(f"PRAGMA cache_size = -{CACHE_KIB}")
+        self.db.executescript(SCHEMA)
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.bloom_seq = self._load_bloom()
+        self.new_files = 0
+        self.new_members = 0
+        self.duplicates = 0
+        self.lookups = 0
+
+    def _load_bloom(self):
+        """Read the saved filter and add the keys stored after it; returns the last file seq covered."""
+        covered = 0
+        if os.path.exists(self.bloom_path):
+            with open(self.bloom_path, "rb") as f:
+                bits, hashes, seq = BLOOM_HEADER.unpack(f.read(BLOOM_HEADER.size))
+                if (bits, hashes) == (self.bloom.bits, self.bloom.hashes):
+                    array = f.read()
+                    if len(array) == len(self.bloom.array):
+                        self.bloom.array = bytearray(array)
+                        covered = seq
+        for (key,) in self.db.execute("SELECT key FROM files WHERE seq > ?", (covered,)):
+            self.bloom.add(key)
+        return self._max_seq("files")
+
+    def _save_bloom(self):
+        tmp_path = self.bloom_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(BLOOM_HEADER.pack(self.bloom.bits, self.bloom.hashes, self._max_seq("files")))
+            f.write(self.bloom.array)
+        os.replace(tmp_path, self.bloom_path)
+
+    def _max_seq(self, table):
+        return self.db.execute(f"SELECT COALESCE(MAX(seq), 0) FROM {table}").fetchone()[0]
+
+    def add(self, item, query):
+        """Record that query returned item's file; True if the file is new for that query."""
+        name, path, sha = file_identity(item)
+        key = file_key(name, path, sha)
+        file_seq = None
+        if key in self.bloom:
+            self.lookups += 1
+            row = self.db.execute("SELECT seq FROM files WHERE key = ?", (key,)).fetchone()
+            file_seq = row[0] if row else None
+        if file_seq is None:
+            file_seq = self.db.execute(
+                "INSERT INTO files (key, repository_full_name, path, sha) VALUES (?, ?, ?, ?)", (key, name, path, sha)
+            ).lastrowid
+            self.bloom.add(key)
+            self.new_files += 1
+        added = self.db.execute(
+            "INSERT OR IGNORE INTO membership (file, query) VALUES (?, ?)", (file_seq, query)
+        ).rowcount == 1
+        if added:
+            self.new_members += 1
+        else:
+            self.duplicates += 1
+        return added
+
+    def count(self, query):
+        """Files recorded for query."""
+        return self.db.execute("SELECT COUNT(*) FROM membership WHERE query = ?", (query,)).fetchone()[0]
+
+    def commit(self):
+        self.db.commit()
+
+    def position(self):
+        """[last file seq, last membership seq]; pass to rollback() to return here."""
+        return [self._max_seq("files"), self._max_seq("membership")]
+
+    def rollback(self, position):
+        """Forget every file and membership recorded after position."""
+        files, members = position
+        self.db.execute("DELETE FROM membership WHERE seq > ?", (members,))
+        self.db.execute("DELETE FROM files WHERE seq > ?", (files,))
+        self.db.commit()
+        # removed keys stay in the Bloom filter: they only cost a lookup
+
+    def export(self, out_path):
+        """Write one row per file with the sorted list of queries that returned it."""
+        rows = self.db.execute(
+            "SELECT f.repository_full_name, f.path, f.sha, GROUP_CONCAT(m.query, ' ') FROM files f "
+            "JOIN membership m ON m.file = f.seq GROUP BY f.seq ORDER BY f.seq"
+        )
+        names, paths, shas, queries = [], [], [], []
+        for name, path, sha, members in rows:
+            names.append(name)
+            paths.append(path)
+            shas.append(sha)
+            queries.append(sorted(members.split(" ")))
+        table = pa.table({
+            "repository_full_name": pa.array(names, pa.string()).dictionary_encode(),
+            "path": pa.array(paths, pa.string()),
+            "sha": pa.array(shas, pa.string()),
+            "queries": pa.array(queries, pa.list_(pa.string())),
+        })
+        tmp_path = out_path + ".tmp"
+        pq.write_table(table, tmp_path, compression="zstd")
+        os.replace(tmp_path, out_path)
+        return table.num_rows
+
+    def print_summary(self):
+        print(f"  seen index: {self.new_files} new files, {self.new_members} new query memberships, "
+              f"{self.duplicates} duplicates, {self.lookups} lookups past the Bloom filter")
+
+    def close(self):
+        self.db.commit()
+        self._save_bloom()
+        self.db.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarise or export the sweep's persistent dedup index.")
+    parser.add_argument("index", nargs="?", default="istio_security_data/.seen_index.sqlite")
+    parser.add_argument("--export", default=None, help="write files.parquet with the queries of every file")
+    args = parser.parse_args()
+
+    index = SeenIndex(args.index)
+    files, members = [index.db.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ("files", "membership")]
+    print(f"{files} distinct files, {members} (file, query) memberships")
+    for query, count in index.db.execute("SELECT query, COUNT(*) FROM membership GROUP BY query ORDER BY query"):
+        print(f"  {query}: {count}")
+    if args.export:
+        print(f"Wrote {index.export(args.export)} rows to {args.export}")
+    index.close()
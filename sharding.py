@@ -0,0 +1,156 @@
+import math
+from search_queries import characters
+
+# Adaptive filename-prefix sharding for code search. Instead of probing every
+# two-character prefix, start from one character, read total_count from page 1
+# and split only the shards that exceed the 1000-result search cap: first into
+# longer filename prefixes, then into file-size ranges.
+
+MAX_RESULTS = 1000
+PER_PAGE = 100
+MAX_PAGES = MAX_RESULTS // PER_PAGE
+# "." and "_" so that e.g. a.yaml and a_b.yaml are still covered once "a" is split
+SPLIT_CHARACTERS = characters + "._"
+MAX_PREFIX_LENGTH = 4
+# code search only indexes files smaller than 384 KB
+MAX_FILE_SIZE = 384 * 1024
+
+
+class Shard:
+    """A filename prefix, optionally narrowed to a size range in bytes."""
+
+    def __init__(self, prefix, size_range=None):
+        self.prefix = prefix
+        self.size_range = size_range
+
+    @property
+    def pattern(self):
+        """The part that goes after filename: in the search query."""
+        if self.size_range is None:
+            return self.prefix
+        low, high = self.size_range
+        return f"{self.prefix}+size:{low}..{high}"
+
+    def can_split(self):
+        if self.size_range is None:
+            return True
+        low, high = self.size_range
+        return high > low
+
+    def split(self):
+        """Children covering the same files: longer prefixes, then halved size ranges."""
+        if self.size_range is None and len(self.prefix) < MAX_PREFIX_LENGTH:
+            return [Shard(self.prefix + c) for c in SPLIT_CHARACTERS]
+        low, high = self.size_range or (0, MAX_FILE_SIZE)
+        middle = (low + high) // 2
+        return [Shard(self.prefix, (low, middle)), Shard(self.prefix, (middle + 1, high))]
+
+    def to_state(self):
+        return [self.prefix, list(self.size_range) if self.size_range else None]
+
+    @classmethod
+    def from_state(cls, state):
+        prefix, size_range = state
+        return cls(prefix, tuple(size_range) if size_range else None)
+
+    def __repr__(self):
+        return f"Shard({self.pattern!r})"
+
+
+def last_page(total_count):
+    return min(math.ceil(total_count / PER_PAGE), MAX_PAGES)
+
+
+def is_saturated(total_count):
+    return total_count > MAX_RESULTS
+
+
+class ShardPlanner:
+    """
+    Walk the shard tree for one query.
+
+    fetch_page(shard, page) returns the decoded search response or None on
+    failure. crawl() yields (shard, page, items, total_count) for every page
+    that returned items, and stops early once max_failures fetches failed.
+    """
+
+    def __init__(self, fetch_page, max_failures=None):
+        self.fetch_page = fetch_page
+        self.max_failures = max_failures
+        self.failures = 0
+        self.requests = 0
+        self.empty = 0
+        self.splits = 0
+        self.truncated = []
+        self.stack = []
+        self.current = None
+
+    def failed(self):
+        return self.max_failures is not None and self.failures >= self.max_failures
+
+    def fetch(self, shard, page):
+        self.requests += 1
+        data = self.fetch_page(shard, page)
+        if data is None:
+            self.failures += 1
+        return data
+
+    def state(self):
+        """JSON-able cursor: pending shards plus the shard and page to fetch next."""
+        current = None
+        if self.current is not None:
+            shard, page, total_count = self.current
+            current = [shard.to_state(), page, total_count]
+        return {"stack": [shard.to_state() for shard in self.stack], "current": current}
+
+    def crawl(self, roots, resume=None):
+        """Yield pages for roots, or continue from a state() saved by an earlier run."""
+        if resume is None:
+            self.stack = [Shard(root) if isinstance(root, str) else root for root in reversed(list(roots))]
+            self.current = None
+        else:
+            self.stack = [Shard.from_state(state) for state in resume["stack"]]
+            self.current = None
+            if resume["current"] is not None:
+                shard_state, page, total_count = resume["current"]
+                self.current = (Shard.from_state(shard_state), page, total_count)
+
+        while not self.failed():
+            if self.current is not None:
+                shard, page, total_count = self.current
+                self.current = None
+            elif self.stack:
+                shard, page, total_count = self.stack.pop(), 1, None
+            else:
+                break
+
+            data = self.fetch(shard, page)
+            if data is None:
+                continue
+
+            if page == 1:
+                total_count = data.get("total_count", 0)
+                if is_saturated(total_count):
+                    if shard.can_split():
+                        children = shard.split()
+                        self.splits += 1
+                        print(f"    {shard.pattern}: {total_count} results over the cap, splitting into {len(children)} shards.")
+                        self.stack.extend(reversed(children))
+                        continue
+                    # cannot narrow any further, keep the first 1000 and remember it
+                    self.truncated.append((shard, total_count))
+                    print(f"    {shard.pattern}: {total_count} results cannot be split further, keeping the first {MAX_RESULTS}.")
+
+            items = data.get("items", [])
+            if not items:
+                if page == 1:
+                    self.empty += 1
+                continue
+
+            # set the cursor before yielding so state() taken by the caller points past this page
+            if page < last_page(total_count):
+                self.current = (shard, page + 1, total_count)
+            yield shard, page, items, total_count
+
+    def print_summary(self):
+        print(f"  shards: {self.requests} requests, {self.empty} empty, {self.splits} split, {len(self.truncated)} truncated, {self.failures} failed")
@@ -1,250 +1,290 @@
-import requests
-import json
-import time
-import string
+import atexit
 import os
-import pandas as pd
-from urllib.parse import quote
 import sys
 from datetime import datetime
-
-# simple log
+from parquet_sink import ParquetSinkPool
+from item_schema import SEARCH_ITEMS
+from token_pool import TokenPool, SEARCH, load_tokens
+from search_queries import base_queries, create_search_url, shard_path, limited_characters
+from sharding import Shard, ShardPlanner
+from checkpoint import SweepCheckpoint
+from seen_index import SeenIndex
+from blob_cache import BlobCache
+from http_cache import CachedSession
+from event_log import EventLog
+from query_planner import plan_queries, derive_subsets
+from log_coverage import load_coverage, seed_shards
+
+# structured run log: one JSON line per request, sleep and printed message,
+# written by a background thread instead of flushing a text file on every print
 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-log_filename = f"istio_security_log_{timestamp}.txt"
-
-class Tee:
-    def __init__(self, *files):
-        self.files = files
-
-    def write(self, message):
-        for file in self.files:
-            file.write(message)
-            file.flush()
-
-    def flush(self):
-        for file in self.files:
-            file.flush()
-
-log_handle = open(log_filename, 'w',encoding='utf-8')
-sys.stdout = Tee(sys.stdout, log_handle)
-
-# token read from environment variables, can put more than two tokens
-# token 1 sleep 10 seconds, token 2 sleep 5 seconds 4 hours
-TOKENS = [
-    os.getenv("GITHUB_TOKEN1"),
-    os.getenv("GITHUB_TOKEN2"),
-    os.getenv("GITHUB_TOKEN3"),
-    os.getenv("GITHUB_TOKEN4"),
-]
-TOKENS = [token for token in TOKENS if token]
-
-if len(TOKENS) < 2:
-    raise ValueError("At least 2 GitHub tokens must be set in environment variables.")
-
-# rotetin index
-token_index = 0
-
-def rotate_token():
-    global token_index
-    token_index = (token_index + 1) % len(TOKENS)
-
-def get_headers():
-    return {
-        "Authorization": f"token {TOKENS[token_index]}"
-    }
-
-def handle_rate_limit(response):
-    if response.status_code == 403:
-        msg = response.json().get("message", "").lower()
-        if "rate limit exceeded" in msg or "secondary rate limit" in msg:
-            retry_after = response.headers.get("Retry-After")
-            if retry_after:
-                wait_time = int(retry_after)
-            elif "X-RateLimit-Reset" in response.headers:
-                reset_time = int(response.headers["X-RateLimit-Reset"])
-                wait_time = reset_time - int(time.time()) + 1
-            else:
-                wait_time = 60  # default fallback
-            print(f"Rate limit exceeded. Sleeping for {wait_time} seconds.")
-            time.sleep(max(wait_time, 1))
-            return True
-    return False
-
-def flatten_item_for_parquet(item):
-    """Flatten the item for easier handling in Parquet."""
-    flattended = {}
-    for key, value in item.items():
-        if isinstance(value, dict):
-            for sub_key, sub_value in value.items():
-                flattended[f"{key}_{sub_key}"] = sub_value
-        else:
-            flattended[key] = value
-    return flattended
+log_filename = f"istio_security_log_{timestamp}.jsonl"
+events = EventLog(log_filename)
+events.capture_stdout()
+# flush the queued events and restore stdout however the run ends
+atexit.register(events.close)
 
-def append_item_to_parquet(filename, item):
-    """Append a flattened item to a Parquet file."""
-    try:
-        # Create directory if it doesn't exist
-        os.makedirs(os.path.dirname(filename), exist_ok=True)
-
-        flattened_item = flatten_item_for_parquet(item)
-        new_df = pd.DataFrame([flattened_item])
-
-        if os.path.exists(filename):
-            existing_df = pd.read_parquet(filename)
-            combined_df = pd.concat([existing_df, new_df], ignore_index=True)
-        else:
-            combined_df = new_df
-
-        combined_df.to_parquet(filename, index=False, compression='snappy')
-        return True
-    except Exception as e:
-        print(f"Error appending item to Parquet file {filename}: {e}")
-        return False
-    
-base_queries = {
-    #mTLS-v1
-    "mtls_strict_v1": '"security.istio.io/v1" "kind: PeerAuthentication" "mode: STRICT"',
-    "mtls_permissive_v1": '"security.istio.io/v1" "kind: PeerAuthentication" "mode: PERMISSIVE"',
-    "mtls_disable_v1": '"security.istio.io/v1" "kind: PeerAuthentication" "mode: DISABLE"',
-    #mTLS-v1beta1
-    "mtls_strict_v1beta1": '"security.istio.io/v1beta1" "kind: PeerAuthentication" "mode: STRICT"',
-    "mtls_permissive_v1beta1": '"security.istio.io/v1beta1" "kind: PeerAuthentication" "mode: PERMISSIVE"',
-    "mtls_disable_v1beta1": '"security.istio.io/v1beta1" "kind: PeerAuthentication" "mode: DISABLE"',
-    #Authentication-v1
-    "peer_auth_v1": '"security.istio.io/v1" "kind: PeerAuthentication"',
-    "req_auth_v1": '"security.istio.io/v1" "kind: RequestAuthentication"',
-    #Authentication-v1beta1
-    "peer_auth_v1beta1": '"security.istio.io/v1beta1" "kind: PeerAuthentication"',
-    "req_auth_v1beta1": '"security.istio.io/v1beta1" "kind: RequestAuthentication"',
-    # Authorization-v1
-    "any_authz_v1": '"security.istio.io/v1" "kind: AuthorizationPolicy"',
-    "http_traffic_v1": '"security.istio.io/v1" "kind: AuthorizationPolicy" "methods:"',
-    "tcp_traffic_v1": '"security.istio.io/v1" "kind: AuthorizationPolicy" "ports:"',
-    "jwt_authz_v1": '"security.istio.io/v1" "kind: AuthorizationPolicy" "requestPrincipals:"',
-    "provider_authz_v1": '"security.istio.io/v1" "kind: AuthorizationPolicy" "provider:"',
-    "ingress_authz_ip_v1": '"security.istio.io/v1" "kind: AuthorizationPolicy" "ipBlocks:"',
-    "ingress_authz_remote_ip_v1": '"security.istio.io/v1" "kind: AuthorizationPolicy" "remoteIpBlocks:"',
-    # Authorization-v1beta1
-    "any_authz_v1beta1": '"security.istio.io/v1beta1" "kind: AuthorizationPolicy"',
-    "http_traffic_v1beta1": '"security.istio.io/v1beta1" "kind: AuthorizationPolicy" "methods:"',
-    "tcp_traffic_v1beta1": '"security.istio.io/v1beta1" "kind: AuthorizationPolicy" "ports:"',
-    "jwt_authz_v1beta1": '"security.istio.io/v1beta1" "kind: AuthorizationPolicy" "requestPrincipals:"',
-    "provider_authz_v1beta1": '"security.istio.io/v1beta1" "kind: AuthorizationPolicy" "provider:"',
-    "ingress_authz_ip_v1beta1": '"security.istio.io/v1beta1" "kind: AuthorizationPolicy" "ipBlocks:"',
-    "ingress_authz_remote_ip_v1beta1": '"security.istio.io/v1beta1" "kind: AuthorizationPolicy" "remoteIpBlocks:"',
-    
-    # mTLS-v1alpha1
-    "mtls_strict_v1alpha1": '"authentication.istio.io/v1alpha1" "kind: Policy" "STRICT"',
-    "mtls_permissive_v1alpha1": '"authentication.istio.io/v1alpha1" "kind: Policy" "PERMISSIVE"',
-    # authentication-v1alpha1
-    "peer_auth_v1alpha1": '"authentication.istio.io/v1alpha1" "kind: Policy" "peers"',
-    "req_auth_v1alpha1": '"authentication.istio.io/v1alpha1" "kind: Policy" "origins"',
-    # authorization-v1alpha1
-    "cluster_authz_v1alpha1": '"rbac.istio.io/v1alpha1"',
-    # all
-    "all_all_all": '"istio.io/v1"',
-}
-
-def create_search_url(query_test, filename_pattern, page=1):
-    """
-    Create a GitHub search URL for the given query and filename pattern.
-    """
-    query = quote(query_test)
-    url = (
-        f'https://api.github.com/search/code?q={query}+language:YAML+filename:{filename_pattern}&page={page}&per_page=100'
-    )
-    return url
+# python test4.py --offline replays every response from the HTTP cache without network access
+OFFLINE = "--offline" in sys.argv
 
+# token read from environment variables (GITHUB_TOKEN1..4), can put more than two tokens
+TOKENS = load_tokens()
 
+if OFFLINE:
+    TOKENS = TOKENS or ["offline"]
+elif len(TOKENS) < 2:
+    raise ValueError("At least 2 GitHub tokens must be set in environment variables.")
 
+# requests go to whichever token has search quota left; we only sleep when all are exhausted
+pool = TokenPool(TOKENS, min_interval=0 if OFFLINE else 0.1, events=events)
 
-# seeting for characters
-characters = string.ascii_lowercase + string.digits + "-"
-limited_characters = string.ascii_lowercase + string.digits
 failed_responses = 0
 
+def fetch_search_page(query_key, shard, page):
+    """Fetch one search page for a shard; None on failure."""
+    url = create_search_url(base_queries[query_key], shard.pattern, page)
+    fields = {"query": query_key, "prefix": shard.pattern, "page": page}
+    response = pool.get(url, bucket=SEARCH, session=http, event_fields=fields)
+    if response.status_code != 200:
+        print(f"    Failed: filename {shard.pattern}, page {page}")
+        print(f"    Status: {response.status_code}, Response: {response.text}")
+        return None
+    data = response.json()
+    events.emit("page", items=len(data.get("items", [])), total_count=data.get("total_count"), **fields)
+    return data
+
 #create main output directory if it doesn't exist
 out_base_dir= "istio_security_data"
 os.makedirs(out_base_dir, exist_ok=True)
+# every page is cached with its ETag; refreshes send conditional requests
+http = CachedSession(os.path.join(out_base_dir, ".http_cache.sqlite"), offline=OFFLINE)
+# items are buffered per output shard and written as part.N files; the journal
+# keeps buffered rows on disk so a checkpoint can restore them exactly; parts
+# use the fixed search item schema of item_schema.py
+sinks = ParquetSinkPool(max_rows=1000, max_seconds=60.0, journal=True, schema=SEARCH_ITEMS)
+
+# every (repository, path, sha) is stored once per query, across queries and runs;
+# python test4.py --reset-index forgets the files earlier runs stored
+index_path = os.path.join(out_base_dir, ".seen_index.sqlite")
+if "--reset-index" in sys.argv:
+    for path in (index_path, index_path + ".bloom"):
+        if os.path.exists(path):
+            os.remove(path)
+index = SeenIndex(index_path)
+
+# python test4.py --resume continues from the last saved (query, prefix, page)
+checkpoint = SweepCheckpoint(os.path.join(out_base_dir, ".checkpoint"))
+resume_state = checkpoint.load() if "--resume" in sys.argv else None
+if resume_state is None:
+    checkpoint.clear()
+else:
+    sinks.rollback(resume_state["sinks"])
+    index.rollback(resume_state["index"])
+    print(f"Resuming {resume_state['query']} at char1 {resume_state.get('char1')} "
+          f"with {index.count(resume_state['query'])} files already stored.")
+
+# python test4.py --coverage data/sweep_coverage.parquet starts char1 sweeps that
+# earlier logs saw over the search cap from their non-empty two-character prefixes
+coverage = None
+if "--coverage" in sys.argv:
+    coverage = load_coverage(sys.argv[sys.argv.index("--coverage") + 1])
+
+# file contents of superset queries, used to derive their subset queries locally
+blobs = BlobCache(os.path.join(out_base_dir, ".blobs"))
+
+
+def crawl_query(query_key, resume_state=None):
+    """
+    Sweep one query through the search API.
+
+    Every matching file is stored once for the query, whichever prefix or page
+    returned it; the seen index remembers it across queries and runs. Returns
+    the shards that were still over the search cap after splitting.
+    """
+    if resume_state is not None:
+        query_failed_responses = resume_state["failures"]
+        saved_count = resume_state["saved"]
+        truncated = [Shard.from_state(state) for state in resume_state["truncated"]]
+    else:
+        query_failed_responses = 0
+        saved_count = 0
+        truncated = []
+
+    for char1 in limited_characters:
+        planner_state = None
+        if resume_state is not None:
+            if char1 != resume_state["char1"]:
+                continue
+            planner_state = resume_state["planner"]
+            resume_state = None
+
+        print(f"\nProcessing char1: {char1} for query {query_key}")
+        #output path: <out>/<category>/<version>/<query>_<char1>.parquet
+        output_filename = shard_path(out_base_dir, query_key, char1)
+
+        # start from the single character and split only shards over the 1000-result cap
+        planner = ShardPlanner(
+            lambda shard, page: fetch_search_page(query_key, shard, page),
+            max_failures=10 - query_failed_responses,
+        )
+
+        def save_checkpoint():
+            sinks.sync()
+            index.commit()
+            checkpoint.save({
+                "query": query_key,
+                "char1": char1,
+                "planner": planner.state(),
+                "sinks": sinks.positions([output_filename]),
+                "index": index.position(),
+                "failures": query_failed_responses + planner.failures,
+                "saved": saved_count,
+                "truncated": [shard.to_state() for shard in truncated]
+                             + [shard.to_state() for shard, _ in planner.truncated],
+            })
+
+        roots = [Shard(char1)]
+        if coverage is not None:
+            roots = seed_shards(coverage, query_key, char1) or roots
+            if len(roots) > 1:
+                print(f"  seeded {len(roots)} prefixes from the sweep coverage")
+        if planner_state is None:
+            planner.stack = list(reversed(roots))
+            save_checkpoint()
+
+        for shard, page, items, total_count in planner.crawl(roots, resume=planner_state):
+            if page == 1:
+                print(f"  {shard.pattern}: Found {total_count} items.")
+
+            for item in items:
+                if index.add(item, query_key) and sinks.append(output_filename, item):
+                    saved_count += 1
+
+            sinks.flush_stale()
+            save_checkpoint()
+
+        planner.print_summary()
+        sinks.release(output_filename)
+        truncated.extend(shard for shard, _ in planner.truncated)
+
+        query_failed_responses += planner.failures
+        stop = query_failed_responses >= 10
+        # release() flushed the shard and removed its journal, so the positions
+        # saved above cannot be rolled back to: resume from the next char1
+        remaining = limited_characters[limited_characters.index(char1) + 1:]
+        index.commit()
+        checkpoint.save({
+            "query": query_key,
+            "char1": remaining[0] if remaining and not stop else None,
+            "planner": None,
+            "sinks": sinks.positions(),
+            "index": index.position(),
+            "failures": query_failed_responses,
+            "saved": saved_count,
+            "truncated": [shard.to_state() for shard in truncated],
+        })
+        if stop:
+            print("Too many failures in one query, stopping.")
+            break
+
+    print(f"Query {query_key} completed with {index.count(query_key)} unique files found.")
+    return truncated
+
+
+def fetch_row_content(row):
+    return blobs.fetch(row["sha"], row["git_url"], pool, session=http)
+
+
+def derive_query_subsets(root_key, subsets, truncated):
+    """
+    Build the subset datasets of root_key from its stored files.
+
+    Files whose content cannot be fetched are looked up with a search
+    restricted to their repository and file name, and shards of the root that
+    hit the search cap are swept again for each subset through the API.
+    """
+    paths = [shard_path(out_base_dir, key, char1) for key in subsets for char1 in limited_characters]
+    sinks.sync()
+    index.commit()
+    checkpoint.save({"query": root_key, "derive": True, "char1": None, "sinks": sinks.positions(paths),
+                     "index": index.position(), "truncated": [shard.to_state() for shard in truncated]})
+
+    saved = {key: 0 for key in subsets}
+
+    def store(subset_key, char1, row=None, item=None):
+        if not index.add(row if row is not None else item, subset_key):
+            return
+        output_filename = shard_path(out_base_dir, subset_key, char1)
+        if row is not None:
+            stored = sinks.get(output_filename).append(row, flatten=False)
+        else:
+            stored = sinks.append(output_filename, item)
+        if stored:
+            saved[subset_key] += 1
+
+    fallback_requests = 0
+    for subset_key, char1, row, matched in derive_subsets(out_base_dir, root_key, subsets, fetch_row_content):
+        if matched:
+            store(subset_key, char1, row=row)
+            continue
+        # content unavailable: ask the API about this one file
+        fallback_requests += 1
+        pattern = f"{row['name']}+repo:{row['repository_full_name']}"
+        data = fetch_search_page(subset_key, Shard(pattern), 1)
+        for item in (data or {}).get("items", []):
+            if item["path"] == row["path"]:
+                store(subset_key, char1, item=item)
+
+    for subset_key in subsets:
+        for shard in truncated:
+            # the root only kept the first 1000 results here, sweep the subset itself
+            planner = ShardPlanner(lambda s, page: fetch_search_page(subset_key, s, page))
+            for _, _, items, _ in planner.crawl([shard]):
+                for item in items:
+                    store(subset_key, shard.prefix[0], item=item)
+            fallback_requests += planner.requests
+
+    for path in paths:
+        sinks.release(path)
+    index.commit()
+    checkpoint.save({"query": root_key, "done": True, "sinks": sinks.positions(), "index": index.position()})
+    blobs.print_summary()
+    for subset_key in subsets:
+        print(f"Query {subset_key} derived from {root_key}: {saved[subset_key]} unique files.")
+    print(f"  {fallback_requests} fallback search requests.")
+
+
+for query_key, subsets in plan_queries(base_queries):
+    if resume_state is not None and query_key != resume_state["query"]:
+        continue
+    if resume_state is not None and resume_state.get("done"):
+        # stopped after the query and its subsets were written
+        resume_state = None
+        continue
+    query_test = base_queries[query_key]
 
-for query_key, query_test in base_queries.items():
     print(f"\n{'='*60}")
     print(f"Processing query: {query_key}")
     print(f"Query: {query_test}")
+    if subsets:
+        print(f"Derived locally: {', '.join(subsets)}")
     print(f"{'='*60}\n")
-    
-    query_failed_responses = 0
-    full_name_exclude = set()
-    saved_count = 0
-    for char1 in limited_characters:
-        print(f"\nProcessing char1: {char1} for query {query_key}")
-
-        for char2 in characters:
-            filename = f"{char1}{char2}"
-            print(f"  Checking filename: {filename}")
-
-            no_more_results = False
-            filename_total_items = 0
-
-            for page in range(1, 11):
-                time.sleep(0.1)
-                if no_more_results:
-                    break
-                while True:
-                    url = create_search_url(query_test, filename, page)
-                    headers = get_headers()
-                    response = requests.get(url, headers=headers)
-
-                    if response.status_code == 200:
-                        data = response.json()
-                        items = data.get("items", [])
-
-                        if not items:
-                            print(f"    No more results for filename {filename}, stopping at page {page}.")
-                            no_more_results = True
-                            rotate_token()
-                            time.sleep(1.6)
-                            break
-                        
-                        filename_total_items += len(items)
-                        for item in items:
-                            time.sleep(0.005)
-                            repo_name = item["repository"]["full_name"]
-
-                            if repo_name not in full_name_exclude:
-                                full_name_exclude.add(repo_name)
-                            #create folder for the query if it doesn't exist
-                                category=query_key.split('_')[0] #e.g., mtls, authz
-                                version=query_key.split('_')[-1] #e.g., v1, v1beta1
-                            #create output path:
-                                folder_path = os.path.join(out_base_dir, category, version)
-                                output_filename= os.path.join(folder_path, f"{query_key}_{char1}.parquet")
-                                
-                                if append_item_to_parquet(output_filename, item):
-                                    saved_count += 1
-
-                        rotate_token()
-                        time.sleep(1.6)
-                        break
-                    elif handle_rate_limit(response):
-                        continue
-                    else:
-                        query_failed_responses += 1
-                        print(f"    Failed: filename {filename}, page {page}")
-                        print(f"    Status: {response.status_code}, Response: {response.text}")
-                        break
-            
-            if filename_total_items > 0:
-                print(f"  {filename}: Found {filename_total_items} items.")
-            else:
-                print(f"  {filename}: No items found.")
-
-            if query_failed_responses >= 10:
-                print("Too many failures in one query, stopping.")
-                break
-
-        print(f"Query {query_key} completed with {len(full_name_exclude)} unique repositories found.")
 
+    if resume_state is not None and resume_state.get("derive"):
+        truncated = [Shard.from_state(state) for state in resume_state["truncated"]]
+    else:
+        truncated = crawl_query(query_key, resume_state=resume_state)
+    resume_state = None
+
+    if subsets:
+        derive_query_subsets(query_key, subsets, truncated)
+
+sinks.close()
+index.close()
+index.print_summary()
+checkpoint.clear()
+http.print_summary()
+http.close()
+pool.print_summary()
+events.print_summary()
 print("Done.")
-
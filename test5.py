@@ -1,94 +1,43 @@
+import atexit
 import os
-import time
-import pandas as pd
-import requests
+from token_pool import TokenPool, load_tokens
 import sys
 from datetime import datetime
+from parquet_sink import read_parquet_parts
+from repo_store import RepoStore
+from http_cache import CachedSession
+from event_log import EventLog
 
 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-log_filename = f"github_repo_log_{timestamp}.txt"
-class Tee:
-    def __init__(self, *files):
-        self.files = files
-    def write(self, message):
-        for f in self.files:
-            f.write(message)
-            f.flush()
-    def flush(self):
-        for f in self.files:
-            if not f.closed:
-                f.flush()
-log_handle = open(log_filename, "w", encoding="utf-8")
-sys.stdout = Tee(sys.stdout, log_handle)
-
-TOKENS = [
-    os.getenv("GITHUB_TOKEN1"),
-    os.getenv("GITHUB_TOKEN2"),
-    os.getenv("GITHUB_TOKEN3"),
-    os.getenv("GITHUB_TOKEN4"),
-]
-TOKENS = [t for t in TOKENS if t]
-if len(TOKENS) < 2:
+log_filename = f"github_repo_log_{timestamp}.jsonl"
+# printed lines and every API request go to a buffered JSON-lines event log
+events = EventLog(log_filename)
+events.capture_stdout()
+# flush the queued events and restore stdout however the run ends
+atexit.register(events.close)
+
+# python test5.py --offline replays every response from the HTTP cache without network access
+OFFLINE = "--offline" in sys.argv
+
+TOKENS = load_tokens()
+if OFFLINE:
+    TOKENS = TOKENS or ["offline"]
+elif len(TOKENS) < 2:
     raise ValueError("At least 2 GitHub tokens are required.")
-token_index = 0
-def rotate_token():
-    global token_index
-    token_index = (token_index + 1) % len(TOKENS)
-def get_headers():
-    return {"Authorization": f"token {TOKENS[token_index]}"}
-
-def handle_rate_limit(resp):
-    if resp.status_code == 403:
-        msg = resp.json().get("message", "").lower()
-        if "rate limit" in msg:
-            reset_time = resp.headers.get("X-RateLimit-Reset")
-            if reset_time:
-                wait_time = int(reset_time) - int(time.time()) + 1
-            else:
-                wait_time = 60
-            print(f"Rate limit hit. Waiting {wait_time}s...")
-            time.sleep(max(wait_time, 1))
-            return True
-    return False
-
-def clean_data_for_parquet(data):
-    if not data:
-        return None
-    problematic_fields = ['custom_properties']
-    cleaned_data = data.copy()
-    for field in problematic_fields:
-        if field in cleaned_data:
-            if cleaned_data is None or cleaned_data[field] == {}:
-                del cleaned_data[field]
-            else:
-                cleaned_data[field] = str(cleaned_data[field])
-    for key, value in cleaned_data.items():
-        if isinstance(value, list) and not value:
-            cleaned_data[key] = None
-        elif isinstance(value, dict) and len(value) == 0:
-            cleaned_data[key] = None
-    return cleaned_data
-
-def get_repo_info(full_name):
-    url = f"https://api.github.com/repos/{full_name}"
-    while True:
-        resp = requests.get(url, headers=get_headers())
-        if resp.status_code == 200:
-            return clean_data_for_parquet(resp.json())
-        elif resp.status_code == 404:
-            print(f"Repository {full_name} not found.")
-            return None
-        elif handle_rate_limit(resp):
-            continue
-        else:
-            print(f"Failed to fetch {full_name}: {resp.status_code}")
-            return None
+# repo lookups use the core bucket; the pool picks the token with quota left
+pool = TokenPool(TOKENS, events=events)
 
 base_folder = "istio_repository"
+# one metadata store for all folders: a repository in several categories is fetched once per TTL
+http = CachedSession(os.path.join(base_folder, "http_cache.sqlite"), offline=OFFLINE)
+store = RepoStore(os.path.join(base_folder, "repo_store.sqlite"), ttl=7 * 24 * 3600, session=http)
 
 for root, dirs, files in os.walk(base_folder):
 
-    parquet_files = [f for f in files if f.endswith(".parquet") and not f.endswith("_repos.parquet")]
+    # shards written by ParquetSink are part.N directories named like the old files
+    shard_dirs = [d for d in dirs if d.endswith(".parquet")]
+    dirs[:] = [d for d in dirs if not d.endswith(".parquet")]
+    parquet_files = [f for f in files + shard_dirs if f.endswith(".parquet") and not f.endswith("_repos.parquet")]
     if not parquet_files:
         continue
 
@@ -102,7 +51,7 @@ for root, dirs, files in os.walk(base_folder):
     for file in parquet_files:
         parquet_path = os.path.join(root, file)
         print(f"Reading {file}...")
-        df = pd.read_parquet(parquet_path)
+        df = read_parquet_parts(parquet_path, columns=["repository_full_name"])
         repo_names = df["repository_full_name"].unique()
         all_repo_names.update(repo_names)
         print(f"Found {len(repo_names)} unique repositories in this file.")
@@ -111,25 +60,17 @@ for root, dirs, files in os.walk(base_folder):
     print(f"Total unique repositories in folder: {len(repo_name_list)}")
 
     if os.path.exists(output_path):
-        existing_df = pd.read_parquet(output_path)
-        done_names = set(existing_df["full_name"])
-        repo_name_list = [r for r in repo_name_list if r not in done_names]
-        combined_df = existing_df
-    else:
-        combined_df = pd.DataFrame()
-
-    print(f"Remaining repositories to process: {len(repo_name_list)}")
-
-    for idx, repo in enumerate(repo_name_list, 1):
-        data = get_repo_info(repo)
-        if data:
-            new_row = pd.DataFrame([data])
-            combined_df = pd.concat([combined_df, new_row], ignore_index=True)
-            combined_df.to_parquet(output_path, index=False, compression="snappy")
-        rotate_token()
-        time.sleep(0.02)
-
-    print(f"Processed {len(combined_df)} repositories in {output_path}.")
-
-print("All done.")
-log_handle.close()
\ No newline at end of file
+        # outputs of earlier runs seed the store, so those repos are not fetched again
+        store.seed_from_parquet(output_path)
+    store.refresh_many(repo_name_list, pool, workers=8)
+    written = store.materialise(repo_name_list, output_path)
+
+    print(f"Processed {written} repositories in {output_path}.")
+
+store.print_summary()
+store.close()
+http.print_summary()
+http.close()
+pool.print_summary()
+events.print_summary()
+print("All done.")
\ No newline at end of file
@@ -0,0 +1,124 @@
+import os
+import sys
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from commit_harvester import CommitHarvester, commits_api_url
+from item_schema import COMMITS
+from parquet_sink import ParquetSinkPool, list_parts
+
+HISTORY = [
+    ("c4", "2025-08-04T00:00:00Z"),
+    ("c3", "2025-07-03T00:00:00Z"),
+    ("c2", "2025-07-02T00:00:00Z"),
+    ("c1", "2025-07-01T00:00:00Z"),
+]
+
+
+class Response:
+    def __init__(self, status_code, items):
+        self.status_code = status_code
+        self.items = items
+
+    def json(self):
+        return self.items
+
+
+class CommitsPool:
+    """Answers every commits request with the full history, newest first, like the API without since."""
+
+    def __init__(self):
+        self.urls = []
+
+    def get(self, url, bucket=None, session=None):
+        self.urls.append(url)
+        return Response(200, [{"sha": sha, "commit": {"author": {"date": date}}} for sha, date in HISTORY])
+
+
+def write_dataset(out_dir):
+    """data/final as harvested before .harvest/ existed: c1..c3 of one repository in v1."""
+    os.makedirs(os.path.join(out_dir, "v1"))
+    df = pd.DataFrame({
+        "sha": [sha for sha, _ in HISTORY[1:]],
+        "author_date": pd.to_datetime([date for _, date in HISTORY[1:]], utc=True),
+        "repository_full_name": "owner/repo",
+    })
+    df.to_parquet(os.path.join(out_dir, "v1", "part.0.parquet"))
+
+
+def harvested_shas(out_dir):
+    return sorted(sha for part in list_parts(os.path.join(out_dir, "v1"))
+                  for sha in pd.read_parquet(part, columns=["sha"])["sha"])
+
+
+def test_refresh_without_harvest_state_appends_only_new_commits(tmp_path):
+    out_dir = str(tmp_path / "final")
+    write_dataset(out_dir)
+    pool = CommitsPool()
+    harvester = CommitHarvester(out_dir, pool, session=None, until="")
+    try:
+        harvester.run({"owner/repo": (commits_api_url("owner/repo"), {"v1"})}, workers=1, refresh=True)
+    finally:
+        harvester.close()
+
+    assert harvested_shas(out_dir) == ["c1", "c2", "c3", "c4"]
+    assert harvester.commits == 1
+    assert "since=2025-07-03T00%3A00%3A00Z" in pool.urls[0]
+    with open(os.path.join(out_dir, ".harvest", "done.txt"), encoding="utf-8") as f:
+        assert f.read() == "v1\towner/repo\n"
+
+
+def test_harvest_skips_repositories_of_an_existing_dataset(tmp_path):
+    out_dir = str(tmp_path / "final")
+    write_dataset(out_dir)
+    pool = CommitsPool()
+    harvester = CommitHarvester(out_dir, pool, session=None)
+    try:
+        harvester.run({"owner/repo": (commits_api_url("owner/repo"), {"v1"})}, workers=1)
+    finally:
+        harvester.close()
+
+    assert pool.urls == []
+    assert harvested_shas(out_dir) == ["c1", "c2", "c3"]
+
+
+class CrashingHarvester(CommitHarvester):
+    """Dies after the rows of crash_at were appended (and partly flushed) but before they are marked done."""
+
+    crash_at = "owner/b"
+
+    def mark_done(self, pairs, mark=None):
+        if mark is not None and mark[0] == self.crash_at:
+            raise KeyboardInterrupt
+        super().mark_done(pairs, mark)
+
+
+def test_restart_after_a_crash_keeps_no_rows_twice(tmp_path):
+    out_dir = str(tmp_path / "final")
+    repos = {name: (commits_api_url(name), {"v1"}) for name in ("owner/a", "owner/b")}
+    harvester = CrashingHarvester(out_dir, CommitsPool(), session=None)
+    # flush every three rows, so owner/b leaves a part and a journal behind
+    harvester.sinks = ParquetSinkPool(max_rows=3, journal=True, schema=COMMITS)
+    with pytest.raises(KeyboardInterrupt):
+        try:
+            harvester.run(repos, workers=1)
+        finally:
+            harvester.close()
+
+    pool = CommitsPool()
+    harvester = CommitHarvester(out_dir, pool, session=None)
+    try:
+        harvester.run(repos, workers=1)
+    finally:
+        harvester.close()
+
+    assert [url.split("/")[-2] for url in pool.urls] == ["b"]
+    parts = list_parts(os.path.join(out_dir, "v1"))
+    df = pd.concat([pd.read_parquet(part) for part in parts])
+    assert sorted(df.groupby("repository_full_name")["sha"].apply(sorted).items()) == [
+        ("owner/a", ["c1", "c2", "c3", "c4"]), ("owner/b", ["c1", "c2", "c3", "c4"])]
+    for part in parts:
+        assert pq.read_schema(part).remove_metadata() == COMMITS.schema.remove_metadata()
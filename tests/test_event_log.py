@@ -0,0 +1,34 @@
+import io
+import os
+import sys
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from event_log import EventLog, read_events
+
+
+def test_close_keeps_a_later_stdout_replacement(tmp_path):
+    path = str(tmp_path / "events.jsonl")
+    terminal = io.StringIO()
+    with redirect_stdout(terminal):
+        log = EventLog(path)
+        log.capture_stdout()
+        print("first line")
+        print("partial", end="")
+        replacement = io.StringIO()
+        sys.stdout = replacement
+        log.close()
+        assert sys.stdout is replacement
+
+    assert terminal.getvalue() == "first line\npartial"
+    assert [record["text"] for record in read_events(path)] == ["first line", "partial"]
+
+
+def test_close_restores_the_terminal(tmp_path):
+    terminal = io.StringIO()
+    with redirect_stdout(terminal):
+        log = EventLog(str(tmp_path / "events.jsonl"))
+        log.capture_stdout()
+        log.close()
+        assert sys.stdout is terminal
@@ -0,0 +1,62 @@
+import json
+import os
+import sys
+import pytest
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http_cache import CachedSession
+from repo_store import RepoStore
+
+DOC = {"full_name": "owner/repo", "stargazers_count": 3}
+
+
+class Response:
+    def __init__(self, url, status_code, headers, doc=None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = requests.structures.CaseInsensitiveDict(headers)
+        self.content = json.dumps(doc).encode() if doc is not None else b""
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class RepositoryAPI:
+    """Serves one repository document with an ETag and answers a matching If-None-Match with a 304."""
+
+    def __init__(self):
+        self.conditional = []
+
+    def get(self, url, headers=None, **kwargs):
+        etag = (headers or {}).get("If-None-Match")
+        self.conditional.append(etag)
+        if etag == '"v1"':
+            return Response(url, 304, {"ETag": '"v1"'})
+        return Response(url, 200, {"ETag": '"v1"'}, DOC)
+
+
+class Pool:
+    def get(self, url, bucket=None, session=None, headers=None):
+        return session.get(url, headers=headers)
+
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_not_modified_only_bumps_fetched_at(tmp_path, cached):
+    api = RepositoryAPI()
+    session = CachedSession(str(tmp_path / "http_cache.sqlite"), session=api) if cached else api
+    store = RepoStore(str(tmp_path / "repo_store.sqlite"), ttl=0, session=session)
+    try:
+        assert store.refresh("owner/repo", Pool()) == 200
+        digest, etag, status, first_fetch = store.entry("owner/repo")
+        assert store.refresh("owner/repo", Pool()) == 200
+        entry = store.entry("owner/repo")
+        docs = store.db.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+    finally:
+        store.close()
+
+    assert api.conditional == [None, '"v1"']
+    assert (store.fetched, store.not_modified) == (1, 1)
+    assert entry[:3] == (digest, etag, status) and entry[3] >= first_fetch
+    assert docs == 1
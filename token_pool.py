@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+import requests
+
+# Rate-limit aware token pool for the GitHub API. Each token keeps separate
+# state for the search and core buckets, requests always go to the token whose
+# bucket frees up soonest, and callers only block when every token is exhausted.
+
+SEARCH = "search"
+CORE = "core"
+# X-RateLimit-Resource values that share a bucket; code search reports its own resource
+RESOURCES = {"search": SEARCH, "code_search": SEARCH, "core": CORE}
+
+
+def load_tokens(count=4):
+    """Read GITHUB_TOKEN1..GITHUB_TOKENn from the environment, skipping unset ones."""
+    tokens = [os.getenv(f"GITHUB_TOKEN{i}") for i in range(1, count + 1)]
+    return [token for token in tokens if token]
+
+
+def is_rate_limited(response):
+    """True for primary and secondary rate-limit responses."""
+    if response.status_code == 429:
+        return True
+    if response.status_code != 403:
+        return False
+    if response.headers.get("X-RateLimit-Remaining") == "0":
+        return True
+    try:
+        msg = response.json().get("message", "").lower()
+    except ValueError:
+        return False
+    return "rate limit" in msg
+
+
+def rate_limit_wait(headers, now=None):
+    """Seconds to wait after a rate-limited response, from Retry-After or X-RateLimit-Reset."""
+    now = time.time() if now is None else now
+    retry_after = headers.get("Retry-After")
+    if retry_after:
+        return max(int(retry_after), 1)
+    if "X-RateLimit-Reset" in headers:
+        return max(int(headers["X-RateLimit-Reset"]) - now + 1, 1)
+    return 60
+
+
+class BucketState:
+    """X-RateLimit state of one token for one bucket (search or core)."""
+
+    def __init__(self):
+        self.remaining = None
+        self.reset_at = 0.0
+        self.blocked_until = 0.0
+        self.last_request_at = 0.0
+
+    def available_at(self, min_interval=0.0):
+        at = max(self.blocked_until, self.last_request_at + min_interval)
+        if self.remaining is not None and self.remaining <= 0:
+            at = max(at, self.reset_at)
+        return at
+
+    def update(self, headers, now):
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+        if remaining is not None:
+            self.remaining = int(remaining)
+        if reset is not None:
+            self.reset_at = int(reset) + 1
+        elif self.remaining is not None and now >= self.reset_at:
+            # window passed without fresh headers, assume capacity again
+            self.remaining = None
+
+    def block(self, headers, now):
+        """Mark the bucket unusable after a rate-limit response; return the blocked seconds."""
+        wait_time = rate_limit_wait(headers, now)
+        self.blocked_until = max(self.blocked_until, now + wait_time)
+        return wait_time
+
+
+class TokenPool:
+    """Dispatch requests to the token with the soonest available capacity."""
+
+    def __init__(self, tokens, min_interval=0.0, events=None):
+        if not tokens:
+            raise ValueError("At least 1 GitHub token must be set in environment variables.")
+        self.tokens = list(tokens)
+        self.min_interval = min_interval
+        # optional event_log.EventLog receiving request, sleep and throttled events
+        self.events = events
+        self.state = {(i, bucket): BucketState() for i in range(len(self.tokens)) for bucket in (SEARCH, CORE)}
+        self.requests = [0] * len(self.tokens)
+        self.throttled_seconds = [0.0] * len(self.tokens)
+        self.waited_seconds = [0.0] * len(self.tokens)
+        self.lock = threading.Lock()
+
+    def headers(self, index):
+        return {"Authorization": f"token {self.tokens[index]}"}
+
+    def _pick(self, bucket, now):
+        best = None
+        for i in range(len(self.tokens)):
+            state = self.state[(i, bucket)]
+            # soonest available first, then the token with most quota left
+            key = (max(state.available_at(self.min_interval), now),
+                   -(state.remaining if state.remaining is not None else float("inf")),
+                   state.last_request_at)
+            if best is None or key < best[0]:
+                best = (key, i)
+        return best[1], best[0][0]
+
+    def acquire(self, bucket=SEARCH):
+        """Reserve a token for one request, sleeping only if every token is exhausted."""
+        while True:
+            with self.lock:
+                now = time.time()
+                index, available_at = self._pick(bucket, now)
+                wait_time = available_at - now
+                if wait_time <= 0:
+                    state = self.state[(index, bucket)]
+                    state.last_request_at = now
+                    if state.remaining is not None:
+                        state.remaining -= 1
+                    self.requests[index] += 1
+                    return index
+                self.waited_seconds[index] += wait_time
+            if wait_time > 5:
+                print(f"All tokens exhausted for {bucket}. Sleeping for {wait_time:.0f} seconds.")
+            if self.events is not None:
+                self.events.emit("sleep", bucket=bucket, token=index + 1, seconds=round(wait_time, 3))
+            time.sleep(wait_time)
+
+    def update(self, index, response, bucket=SEARCH):
+        """Record the response headers; return True if the request must be retried."""
+        # unknown resources (graphql, ...) are accounted to the bucket the caller asked for
+        bucket = RESOURCES.get(response.headers.get("X-RateLimit-Resource"), bucket)
+        with self.lock:
+            now = time.time()
+            state = self.state[(index, bucket)]
+            state.update(response.headers, now)
+            if is_rate_limited(response):
+                blocked = state.block(response.headers, now)
+                self.throttled_seconds[index] += blocked
+                if self.events is not None:
+                    self.events.emit("throttled", bucket=bucket, token=index + 1, seconds=round(blocked, 3))
+                print(f"Rate limit hit on token {index + 1} ({bucket}). Token paused for {blocked:.0f}s.")
+                return True
+        return False
+
+    def get(self, url, bucket=SEARCH, session=requests, event_fields=None, **kwargs):
+        """
+        GET url with the best available token, retrying on rate limits.
+
+        event_fields (e.g. query, prefix, page) are added to the request event.
+        """
+        extra_headers = kwargs.pop("headers", None) or {}
+        while True:
+            index = self.acquire(bucket)
+            headers = {**extra_headers, **self.headers(index)}
+            started = time.perf_counter()
+            response = session.get(url, headers=headers, **kwargs)
+            if self.events is not None:
+                remaining = response.headers.get("X-RateLimit-Remaining")
+                self.events.emit(
+                    "request", token=index + 1, bucket=bucket, status=response.status_code,
+                    latency=round(time.perf_counter() - started, 4),
+                    remaining=int(remaining) if remaining is not None else None,
+                    url=url, **(event_fields or {}),
+                )
+            if not self.update(index, response, bucket):
+                return response
+
+    def summary(self):
+        """Per-token counters: requests, seconds throttled by GitHub, seconds callers waited."""
+        return [
+            {
+                "token": i + 1,
+                "requests": self.requests[i],
+                "throttled_seconds": round(self.throttled_seconds[i], 1),
+                "waited_seconds": round(self.waited_seconds[i], 1),
+                "search_remaining": self.state[(i, SEARCH)].remaining,
+                "core_remaining": self.state[(i, CORE)].remaining,
+            }
+            for i in range(len(self.tokens))
+        ]
+
+    def print_summary(self):
+        for row in self.summary():
+            print(
+                f"  token{row['token']}: {row['requests']} requests, "
+                f"throttled {row['throttled_seconds']}s, waited {row['waited_seconds']}s"
+            )